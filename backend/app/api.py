@@ -1,16 +1,64 @@
+import asyncio
+import logging
+import os
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException, status, Depends
+from typing import Generator, List, Optional, Set
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status, Depends, Header, Query, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 import schemas
 import crud
-from utils import create_access_token, create_refresh_token, verify_token
-from database import get_db
+from cache import mentor_cache, user_cache, calendar_cache, calendar_versions
+from events import hub, format_sse
+import idempotency
+import group_commit
+from revocation import revocations, revoke_token
+from singleflight import SingleFlight
+from catalog import catalog, mentor_projector
+from media import media_store, MEDIA_NAME, CONTENT_TYPES, MediaTooLarge, UnsupportedMedia, StoredMedia
+from projection import Projector, parse_fields
+from utils import create_token_pair, verify_token
+from database import get_db, SessionLocal, ReadSessionLocal
+from replicas import open_read_session
 from config import settings
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/v1")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Допустимые расширения ответа бронирований (?include=)
+BOOKING_INCLUDES = {"mentor"}
+
+# Файлы /media адресуются хешем содержимого и не меняются
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Сериализатор списка менторов (кешируется готовый JSON)
+mentor_list_adapter = TypeAdapter(List[schemas.MentorResponse])
+
+# Разделы сводки /users/me/dashboard (?fields=)
+DASHBOARD_SECTIONS = {"user", "upcoming_bookings", "recent_notes", "mentors"}
+
+# Фильтры каталога без ограничений (первая страница по умолчанию)
+DEFAULT_MENTOR_FILTERS = {
+    "city": None, "yoga_style": None, "gender": None, "min_price": None,
+    "max_price": None, "min_rating": None, "sort": None, "skip": 0, "limit": 100,
+}
+
+# Сериализация списков сразу в JSON из ORM объектов
+booking_list_adapter = TypeAdapter(List[schemas.BookingWithMentorResponse])
+note_list_adapter = TypeAdapter(List[schemas.NoteResponse])
+
+# Частичные ответы списков (?fields=; менторы - тем же сериализатором, что и снимок)
+note_projector = Projector(schemas.NoteResponse)
+booking_projector = Projector(schemas.BookingWithMentorResponse)
+
+# Одинаковые одновременные запросы каталога выполняют один запрос к БД
+catalog_flight = SingleFlight("catalog")
 
 
 # Вспомогательные функции
@@ -19,10 +67,30 @@ def get_current_user(
     db: Session = Depends(get_db)
 ) -> schemas.UserResponse:
     # Получить текущего аутентифицированного пользователя
-    token = credentials.credentials
+    return authenticate_token(credentials.credentials, db)
+
+
+def get_read_db(current_user: schemas.UserResponse = Depends(get_current_user)) -> Generator:
+    # Сессия для GET эндпоинтов (реплика или основная БД после записи).
+    # get_current_user кешируется FastAPI на запрос: токен проверяется один раз
+    yield from open_read_session(current_user.id)
+
+
+def require_admin(current_user: schemas.UserResponse = Depends(get_current_user)) -> schemas.UserResponse:
+    # Доступ только для администраторов (settings.ADMIN_USERNAMES)
+    if current_user.username not in settings.ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Недостаточно прав",
+        )
+    return current_user
+
+
+def authenticate_token(token: str, db: Session) -> schemas.UserResponse:
+    # Проверить access токен и вернуть пользователя
     payload = verify_token(token)
     
-    if payload is None or payload.get("type") != "access":
+    if payload is None or payload.get("type") != "access" or revocations.is_revoked(payload):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный или просроченный токен",
@@ -44,12 +112,21 @@ def get_current_user(
             detail="Неверный формат токена",
         )
     
-    user = crud.user_crud.get_user(db, user_id)
+    # Сессия запроса знает пользователя: его записи включают read-your-writes
+    db.info["user_id"] = user_id
+    
+    # Пользователь берется из кеша воркера, в БД идем только при промахе
+    generation = user_cache.generation
+    user = user_cache.get(user_id)
     if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Пользователь не найден",
-        )
+        db_user = crud.user_crud.get_user(db, user_id)
+        if db_user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Пользователь не найден",
+            )
+        user = schemas.UserResponse.model_validate(db_user)
+        user_cache.set(user_id, user, generation=generation)
     
     if not user.is_active:
         raise HTTPException(
@@ -57,17 +134,60 @@ def get_current_user(
             detail="Пользователь деактивирован",
         )
     
-    return schemas.UserResponse.model_validate(user)
+    return user
+
+
+def parse_include(include: Optional[str], allowed: Set[str], param: str = "include") -> Set[str]:
+    # Разобрать параметр со списком через запятую ("mentor,user")
+    if not include:
+        return set()
+    
+    requested = {part.strip() for part in include.split(",") if part.strip()}
+    unknown = requested - allowed
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Неизвестные значения {param}: {', '.join(sorted(unknown))}"
+        )
+    return requested
+
+
+def total_count_header(db: Session, user_id: int, counter: str) -> dict:
+    # Заголовок X-Total-Count для постраничных списков: счетчик пользователя
+    # читается одной строкой, без COUNT(*) по таблице
+    return {"X-Total-Count": str(crud.counter_crud.get_user_count(db, user_id, counter))}
+
+
+def serialize_booking(booking, with_mentor: bool) -> schemas.BookingResponse:
+    # Сериализовать бронирование, при необходимости с данными ментора
+    if with_mentor:
+        return schemas.BookingWithMentorResponse.model_validate(booking)
+    return schemas.BookingResponse.model_validate(booking)
+
+
+async def store_refresh_token(db: Session, token: str, user_id: int, replaces: Optional[str] = None) -> None:
+    # Сохранить refresh токен (replaces - деактивировать прежний в той же транзакции)
+    def store(session: Session) -> None:
+        if replaces is not None:
+            crud.refresh_token_crud.deactivate_token(session, replaces, commit=False)
+        crud.refresh_token_crud.create_token(
+            session, token, user_id,
+            timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+            commit=False
+        )
+    
+    await group_commit.execute(db, store, user_id)
 
 
 # Эндпоинты аутентификации
 @router.post("/auth/login", response_model=schemas.AuthResponse)
 async def login(
     request: schemas.LoginRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     # Вход пользователя в систему
-    user = crud.user_crud.authenticate_user(db, request.login, request.password)
+    user = crud.user_crud.authenticate_user(db, request.login, request.password, background_tasks)
     
     if not user:
         raise HTTPException(
@@ -86,14 +206,10 @@ async def login(
     crud.refresh_token_crud.clear_expired_tokens(db, user.id)
     
     # Создание токенов
-    access_token = create_access_token(data={"sub": str(user.id)})
-    refresh_token = create_refresh_token(data={"sub": str(user.id)})
+    access_token, refresh_token = create_token_pair(user.id)
     
     # Сохранение refresh токена в базу данных
-    crud.refresh_token_crud.create_token(
-        db, refresh_token, user.id, 
-        timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    )
+    await store_refresh_token(db, refresh_token, user.id)
     
     # Подготовка ответа с пользователем
     user_response = schemas.UserResponse.model_validate(user)
@@ -129,14 +245,10 @@ async def register(
     user = crud.user_crud.create_user(db, request)
     
     # Создание токенов
-    access_token = create_access_token(data={"sub": str(user.id)})
-    refresh_token = create_refresh_token(data={"sub": str(user.id)})
+    access_token, refresh_token = create_token_pair(user.id)
     
     # Сохранение refresh токена
-    crud.refresh_token_crud.create_token(
-        db, refresh_token, user.id,
-        timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    )
+    await store_refresh_token(db, refresh_token, user.id)
     
     # Подготовка ответа
     user_response = schemas.UserResponse.model_validate(user)
@@ -185,25 +297,21 @@ async def refresh_token(
             detail="Refresh токен недействителен"
         )
     
-    # Проверка срока действия
-    if refresh_token_obj.expires_at < datetime.now(timezone.utc):
+    # Проверка срока действия (SQLite возвращает datetime без таймзоны - это UTC)
+    expires_at = refresh_token_obj.expires_at
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    if expires_at < datetime.now(timezone.utc):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Refresh токен истек"
         )
     
-    # Деактивация старого refresh токена
-    crud.refresh_token_crud.deactivate_token(db, request.refresh_token)
-    
     # Создание новых токенов
-    new_access_token = create_access_token(data={"sub": str(user_id)})
-    new_refresh_token = create_refresh_token(data={"sub": str(user_id)})
+    new_access_token, new_refresh_token = create_token_pair(user_id)
     
-    # Сохранение нового refresh токена
-    crud.refresh_token_crud.create_token(
-        db, new_refresh_token, user_id,
-        timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    )
+    # Деактивация старого и сохранение нового refresh токена одной транзакцией
+    await store_refresh_token(db, new_refresh_token, user_id, replaces=request.refresh_token)
     
     return schemas.Token(
         access_token=new_access_token,
@@ -214,9 +322,16 @@ async def refresh_token(
 @router.post("/auth/logout")
 async def logout(
     request: schemas.TokenRefreshRequest,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
     db: Session = Depends(get_db)
 ):
-    # Выход из системы - деактивация refresh токена
+    # Выход из системы - деактивация refresh токена и отзыв текущего access токена
+    if credentials is not None:
+        payload = verify_token(credentials.credentials)
+        if payload is not None and payload.get("type") == "access":
+            revoke_token(db, payload)
+            db.commit()
+    
     if crud.refresh_token_crud.deactivate_token(db, request.refresh_token):
         return {"message": "Успешный выход"}
     else:
@@ -256,62 +371,312 @@ async def update_current_user(
     return schemas.UserResponse.model_validate(updated_user)
 
 
+@router.put("/users/me/photo", response_model=schemas.UserResponse)
+async def upload_current_user_photo(
+    request: Request,
+    current_user: schemas.UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Загрузить фото профиля: тело запроса - само изображение
+    stored = await store_upload(request)
+    user = crud.user_crud.set_photo(db, current_user.id, media_store.urls(stored)["url"])
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Пользователь не найден"
+        )
+    return schemas.UserResponse.model_validate(user)
+
+
+@router.delete("/users/me/photo", response_model=schemas.UserResponse)
+async def delete_current_user_photo(
+    current_user: schemas.UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Убрать фото профиля (файл остается: он может быть общим для одинаковых загрузок)
+    user = crud.user_crud.set_photo(db, current_user.id, None)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Пользователь не найден"
+        )
+    return schemas.UserResponse.model_validate(user)
+
+
+# Эндпоинты администрирования (settings.ADMIN_USERNAMES)
+@router.post("/admin/users/{user_id}/deactivate", response_model=schemas.UserResponse)
+async def deactivate_user(
+    user_id: int,
+    admin: schemas.UserResponse = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    # Деактивировать пользователя: его refresh токены гасятся, а выданные
+    # access токены отзываются во всех воркерах (revocation.py)
+    user = crud.user_crud.deactivate_user(db, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Пользователь не найден"
+        )
+    
+    logger.info(f"Пользователь {user_id} деактивирован администратором {admin.username}")
+    return schemas.UserResponse.model_validate(user)
+
+
+@router.get("/users/me/dashboard", response_model=schemas.DashboardResponse)
+async def get_dashboard(
+    fields: Optional[str] = None,
+    bookings_limit: int = 5,
+    notes_limit: int = 5,
+    mentors_limit: int = 20,
+    current_user: schemas.UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    # Данные стартового экрана одним запросом: пользователь, ближайшие бронирования,
+    # последние заметки и первая страница каталога. ?fields=user,recent_notes - только
+    # выбранные разделы. Запросы к БД идут в одной сессии, каталог - из памяти
+    sections = parse_include(fields, DASHBOARD_SECTIONS, "fields") or DASHBOARD_SECTIONS
+    
+    parts = {}
+    if "user" in sections:
+        parts["user"] = current_user.model_dump_json().encode()
+    if "upcoming_bookings" in sections:
+        bookings = crud.booking_crud.get_upcoming_bookings(db, current_user.id, max(bookings_limit, 0))
+        parts["upcoming_bookings"] = booking_list_adapter.dump_json(
+            booking_list_adapter.validate_python(bookings, from_attributes=True)
+        )
+    if "recent_notes" in sections:
+        notes = crud.note_crud.get_user_notes(db, current_user.id, limit=max(notes_limit, 0))
+        parts["recent_notes"] = note_list_adapter.dump_json(
+            note_list_adapter.validate_python(notes, from_attributes=True)
+        )
+    if "mentors" in sections:
+        filters = dict(DEFAULT_MENTOR_FILTERS, limit=max(mentors_limit, 0))
+        parts["mentors"] = await fetch_mentor_list(filters)
+    
+    # Разделы уже сериализованы (список менторов - готовыми байтами из каталога)
+    body = b"{" + b",".join(b'"%s":%s' % (name.encode(), part) for name, part in parts.items()) + b"}"
+    return Response(content=body, media_type="application/json")
+
+
 # Эндпоинты менторов
+def load_mentor_list(filters: dict, fields: Optional[List[str]] = None) -> bytes:
+    # Загрузить и сериализовать список менторов (в пуле потоков, со своей сессией).
+    # Каталог публичный и кешируется на MENTOR_CACHE_TTL_SECONDS, поэтому читается с реплики
+    db = ReadSessionLocal()
+    try:
+        mentors = crud.mentor_crud.get_mentors(db, **filters, columns=fields)
+        if fields:
+            return mentor_projector.dump_json(mentors, fields)
+        return mentor_list_adapter.dump_json(
+            [schemas.MentorResponse.model_validate(mentor) for mentor in mentors]
+        )
+    finally:
+        db.close()
+
+
+def load_mentor(mentor_id: int) -> Optional[schemas.MentorResponse]:
+    # Загрузить одного ментора (в пуле потоков, со своей сессией)
+    db = SessionLocal()
+    try:
+        mentor = crud.mentor_crud.get_mentor(db, mentor_id)
+        return schemas.MentorResponse.model_validate(mentor) if mentor else None
+    finally:
+        db.close()
+
+
+async def load_catalog_entry(cache_key: tuple, loader, *args):
+    # Прочитать запись каталога из кеша или загрузить ее один раз
+    # для всех одновременных запросов с тем же ключом
+    value = mentor_cache.get(cache_key)
+    if value is not None:
+        return value
+    
+    generation = mentor_cache.generation
+    
+    async def load():
+        result = await run_in_threadpool(loader, *args)
+        if result is not None:
+            mentor_cache.set(cache_key, result, generation=generation)
+        return result
+    
+    try:
+        return await catalog_flight.do(
+            cache_key, load, timeout=settings.CATALOG_LOAD_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Превышено время ожидания каталога"
+        )
+
+
+async def fetch_mentor_list(filters: dict, fields: Optional[List[str]] = None) -> bytes:
+    # JSON списка менторов: из колоночного снимка или из кеша/БД
+    if settings.CATALOG_SNAPSHOT_ENABLED:
+        snapshot = await catalog.get()
+        return snapshot.query(**filters, fields=fields)
+    cache_key = ("list",) + tuple(filters.values()) + (tuple(fields) if fields else None,)
+    return await load_catalog_entry(cache_key, load_mentor_list, filters, fields)
+
+
 @router.get("/mentors", response_model=List[schemas.MentorResponse])
 async def get_mentors(
     city: Optional[str] = None,
     yoga_style: Optional[str] = None,
+    gender: Optional[str] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    min_rating: Optional[float] = None,
+    sort: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    fields: Optional[str] = None
 ):
-    # Получить список менторов с возможностью фильтрации
-    mentors = crud.mentor_crud.get_mentors(
-        db, skip=skip, limit=limit, city=city, yoga_style=yoga_style
-    )
-    return [schemas.MentorResponse.model_validate(mentor) for mentor in mentors]
+    # Получить список менторов с фильтрацией, сортировкой ("price", "-rating", ...) и пагинацией.
+    # ?fields=id,name,city - только эти поля
+    columns = parse_fields(fields, schemas.MentorResponse)
+    if sort and sort.lstrip("-") not in crud.MENTOR_SORT_FIELDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Сортировка возможна по полям: {', '.join(crud.MENTOR_SORT_FIELDS)}"
+        )
+    
+    filters = {
+        "city": city or None,
+        "yoga_style": yoga_style or None,
+        "gender": gender or None,
+        "min_price": min_price,
+        "max_price": max_price,
+        "min_rating": min_rating,
+        "sort": sort or None,
+        "skip": max(skip, 0),
+        "limit": max(limit, 0),
+    }
+    
+    return Response(content=await fetch_mentor_list(filters, columns), media_type="application/json")
 
 
 @router.get("/mentors/{mentor_id}", response_model=schemas.MentorResponse)
-async def get_mentor(
+async def get_mentor(mentor_id: int):
+    # Получить информацию о конкретном менторе
+    mentor = await load_catalog_entry(("mentor", mentor_id), load_mentor, mentor_id)
+    if mentor is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ментор не найден"
+        )
+    
+    return mentor
+
+
+@router.get("/mentors/{mentor_id}/calendar", response_model=schemas.MentorCalendarResponse)
+async def get_mentor_calendar(
     mentor_id: int,
+    date_from: datetime = Query(..., alias="from"),
+    date_to: datetime = Query(..., alias="to"),
+    bucket: str = "day",
     db: Session = Depends(get_db)
 ):
-    # Получить информацию о конкретном менторе
-    mentor = crud.mentor_crud.get_mentor(db, mentor_id)
-    if not mentor:
+    # Загрузка ментора по дням или часам: занятые минуты и число бронирований
+    if bucket not in ("day", "hour"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="bucket должен быть day или hour"
+        )
+    
+    # Даты без таймзоны считаем UTC: сравнение со сроком архивации требует aware datetime
+    date_from, date_to = (
+        value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+        for value in (date_from, date_to)
+    )
+    
+    if date_to <= date_from or date_to - date_from > timedelta(days=settings.CALENDAR_MAX_DAYS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Неверный диапазон дат (не более {settings.CALENDAR_MAX_DAYS} дней)"
+        )
+    
+    mentor = await load_catalog_entry(("mentor", mentor_id), load_mentor, mentor_id)
+    if mentor is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Ментор не найден"
         )
     
-    return schemas.MentorResponse.model_validate(mentor)
+    cache_key = (mentor_id, calendar_versions.get(mentor_id, 0), date_from, date_to, bucket)
+    generation = calendar_cache.generation
+    calendar = calendar_cache.get(cache_key)
+    if calendar is None:
+        rows = crud.booking_crud.get_mentor_calendar(db, mentor_id, date_from, date_to, bucket)
+        calendar = schemas.MentorCalendarResponse(
+            mentor_id=mentor_id,
+            bucket=bucket,
+            date_from=date_from,
+            date_to=date_to,
+            buckets=[
+                schemas.CalendarBucket(start=start, booked_minutes=minutes or 0, bookings=count)
+                for start, minutes, count in rows
+            ],
+        )
+        calendar_cache.set(cache_key, calendar, generation=generation)
+    
+    return calendar
 
 
 # Эндпоинты заметок
 @router.get("/notes", response_model=List[schemas.NoteResponse])
 async def get_notes(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    fields: Optional[str] = None,
+    preview_len: Optional[int] = None,
     current_user: schemas.UserResponse = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    # Получить заметки текущего пользователя
+    # Получить заметки текущего пользователя.
+    # ?fields=id,created_at - только эти поля, ?preview_len=80 - начало текста
+    columns = parse_fields(fields, schemas.NoteResponse)
+    if preview_len is not None and preview_len < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="preview_len должен быть положительным"
+        )
+    
     notes = crud.note_crud.get_user_notes(
-        db, current_user.id, skip=skip, limit=limit
+        db, current_user.id, skip=skip, limit=limit, columns=columns, preview_len=preview_len
     )
+    total = total_count_header(db, current_user.id, "notes")
+    if columns or preview_len:
+        body = note_projector.dump_json(notes, columns or list(schemas.NoteResponse.model_fields))
+        return Response(content=body, media_type="application/json", headers=total)
+    response.headers.update(total)
     return [schemas.NoteResponse.model_validate(note) for note in notes]
 
 
 @router.post("/notes", response_model=schemas.NoteResponse)
 async def create_note(
     note_data: schemas.NoteCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: schemas.UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     # Создать новую заметку
-    note = crud.note_crud.create_note(db, note_data, current_user.id)
-    return schemas.NoteResponse.model_validate(note)
+    async def handler(save_response: idempotency.SaveResponse):
+        def create(session: Session):
+            note = crud.note_crud.create_note(session, note_data, current_user.id, commit=False)
+            # Ответ по ключу идемпотентности сохраняется в той же транзакции
+            save_response(session, note)
+            return note
+        
+        note = await group_commit.execute(db, create, current_user.id)
+        return schemas.NoteResponse.model_validate(note)
+    
+    return await idempotency.execute(
+        db, idempotency_key, current_user.id, "POST /notes", note_data, handler,
+        response_model=schemas.NoteResponse
+    )
 
 
 @router.put("/notes/{note_id}", response_model=schemas.NoteResponse)
@@ -335,7 +700,15 @@ async def update_note(
             detail="Нет доступа к этой заметке"
         )
     
-    updated_note = crud.note_crud.update_note(db, note_id, note_data)
+    def update(session: Session):
+        return crud.note_crud.update_note(session, note_id, note_data, commit=False)
+    
+    updated_note = await group_commit.execute(db, update, current_user.id)
+    if updated_note is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Заметка не найдена"
+        )
     return schemas.NoteResponse.model_validate(updated_note)
 
 
@@ -369,40 +742,79 @@ async def delete_note(
 
 
 # Эндпоинты бронирований
-@router.get("/bookings", response_model=List[schemas.BookingResponse])
+@router.get("/bookings", response_model=List[schemas.BookingWithMentorResponse])
 async def get_bookings(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    include: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: schemas.UserResponse = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    # Получить бронирования текущего пользователя
+    # Получить бронирования текущего пользователя (?include=mentor - с данными менторов,
+    # ?fields=id,session_date,status - только эти поля)
+    with_mentor = "mentor" in parse_include(include, BOOKING_INCLUDES)
+    columns = parse_fields(fields, schemas.BookingWithMentorResponse)
+    total = total_count_header(db, current_user.id, "bookings")
+    if columns is None:
+        bookings = crud.booking_crud.get_user_bookings(
+            db, current_user.id, skip=skip, limit=limit, with_mentor=with_mentor
+        )
+        response.headers.update(total)
+        return [serialize_booking(booking, with_mentor) for booking in bookings]
+    
+    # Поле mentor в fields равносильно include=mentor
+    with_mentor = with_mentor or "mentor" in columns
+    if with_mentor and "mentor" not in columns:
+        columns.append("mentor")
     bookings = crud.booking_crud.get_user_bookings(
-        db, current_user.id, skip=skip, limit=limit
+        db, current_user.id, skip=skip, limit=limit, with_mentor=with_mentor,
+        columns=[name for name in columns if name != "mentor"]
+    )
+    return Response(
+        content=booking_projector.dump_json(bookings, columns), media_type="application/json", headers=total
     )
-    return [schemas.BookingResponse.model_validate(booking) for booking in bookings]
 
 
-@router.post("/bookings", response_model=schemas.BookingResponse)
+@router.post("/bookings", response_model=schemas.BookingWithMentorResponse)
 async def create_booking(
     booking_data: schemas.BookingCreate,
+    include: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: schemas.UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     # Создать новое бронирование
-    try:
-        booking = crud.booking_crud.create_booking(db, booking_data, current_user.id)
-        return schemas.BookingResponse.model_validate(booking)
-    except ValueError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Ошибка при создании бронирования: {str(e)}"
-        )
+    with_mentor = "mentor" in parse_include(include, BOOKING_INCLUDES)
+    
+    async def handler(save_response: idempotency.SaveResponse):
+        try:
+            # Ментор уже загружен в сессию при проверке, поэтому вложение не требует запроса
+            booking = crud.booking_crud.create_booking(db, booking_data, current_user.id, commit=False)
+            response = serialize_booking(booking, with_mentor)
+            # Ответ по ключу идемпотентности сохраняется в той же транзакции
+            save_response(db, response)
+            db.commit()
+            return response
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Ошибка при создании бронирования: {str(e)}"
+            )
+    
+    # include влияет на тело ответа, поэтому входит в отпечаток запроса
+    return await idempotency.execute(
+        db, idempotency_key, current_user.id, f"POST /bookings?include={include or ''}",
+        booking_data, handler, response_model=schemas.BookingWithMentorResponse
+    )
 
 
 @router.put("/bookings/{booking_id}/cancel", response_model=schemas.BookingResponse)
@@ -432,4 +844,221 @@ async def cancel_booking(
         )
     
     updated_booking = crud.booking_crud.update_booking_status(db, booking_id, "cancelled")
-    return schemas.BookingResponse.model_validate(updated_booking)
\ No newline at end of file
+    return schemas.BookingResponse.model_validate(updated_booking)
+
+
+# Очередь ожидания занятых слотов: при отмене бронирования слот сразу
+# переходит первому в очереди (событие booking.promoted в /events)
+@router.post("/bookings/waitlist", response_model=schemas.WaitlistResponse, status_code=status.HTTP_201_CREATED)
+async def join_waitlist(
+    booking_data: schemas.BookingCreate,
+    current_user: schemas.UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Встать в очередь на занятое время ментора
+    try:
+        entry = crud.waitlist_crud.join(db, booking_data, current_user.id)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    response = schemas.WaitlistResponse.model_validate(entry)
+    response.position = crud.waitlist_crud.get_position(db, entry)
+    return response
+
+
+@router.get("/bookings/waitlist", response_model=List[schemas.WaitlistResponse])
+async def get_waitlist(
+    current_user: schemas.UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Предстоящие записи текущего пользователя в очередях с местом в очереди
+    entries = []
+    for entry, position in crud.waitlist_crud.get_user_entries(db, current_user.id):
+        response = schemas.WaitlistResponse.model_validate(entry)
+        response.position = position
+        entries.append(response)
+    return entries
+
+
+@router.delete("/bookings/waitlist/{entry_id}")
+async def leave_waitlist(
+    entry_id: int,
+    current_user: schemas.UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Выйти из очереди
+    entry = crud.waitlist_crud.get_entry(db, entry_id)
+    if not entry:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Запись в очереди не найдена"
+        )
+    
+    if entry.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Нет доступа к этой записи"
+        )
+    
+    crud.waitlist_crud.leave(db, entry_id)
+    return {"message": "Вы вышли из очереди"}
+
+
+# Изображения
+async def store_upload(request: Request) -> StoredMedia:
+    # Сохранить изображение из тела запроса потоком, не читая его в память
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > media_store.max_upload_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Файл больше {media_store.max_upload_bytes} байт"
+        )
+    try:
+        return await media_store.save(request.stream())
+    except MediaTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except UnsupportedMedia as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+
+
+def serve_media_file(request: Request, path: str, content_type: str, etag: str) -> Response:
+    # Отдать файл хранилища: FileResponse (sendfile, если сервер поддерживает)
+    # или X-Accel-Redirect, чтобы файл отдал nginx
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+        relative = os.path.relpath(path, media_store.root).replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = f"{settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative}"
+        return Response(media_type=content_type, headers=headers)
+    return FileResponse(path, media_type=content_type, headers=headers)
+
+
+def media_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Изображение не найдено"
+    )
+
+
+@router.post("/media", response_model=schemas.MediaResponse, status_code=status.HTTP_201_CREATED)
+async def upload_media(
+    request: Request,
+    current_user: schemas.UserResponse = Depends(get_current_user)
+):
+    # Загрузить изображение (JPEG, PNG, GIF, WebP); тело запроса - сам файл.
+    # В ответе неизменяемые URL оригинала и миниатюр
+    stored = await store_upload(request)
+    return schemas.MediaResponse(
+        id=stored.name,
+        content_type=stored.content_type,
+        size=stored.size,
+        **media_store.urls(stored)
+    )
+
+
+@router.get("/media/{name}")
+async def get_media(name: str, request: Request):
+    # Оригинал изображения
+    match = MEDIA_NAME.match(name)
+    if not match:
+        raise media_not_found()
+    digest, extension = match.groups()
+    path = media_store.original_path(digest, extension)
+    if not await run_in_threadpool(os.path.exists, path):
+        raise media_not_found()
+    return serve_media_file(request, path, CONTENT_TYPES[extension], f'"{digest}"')
+
+
+@router.get("/media/{digest}/{size}.webp")
+async def get_media_thumbnail(digest: str, size: int, request: Request):
+    # Миниатюра WebP (строится при первом запросе, затем берется с диска)
+    if size not in media_store.thumbnail_sizes or not MEDIA_NAME.match(f"{digest}.webp"):
+        raise media_not_found()
+    
+    if not media_store.thumbnails_available:
+        # Без Pillow миниатюр нет - отдаем оригинал
+        original = await run_in_threadpool(media_store.find_original, digest)
+        if original is None:
+            raise media_not_found()
+        return RedirectResponse(
+            f"{router.prefix}/media/{os.path.basename(original)}",
+            headers={"Cache-Control": "no-cache"}
+        )
+    
+    try:
+        path = await media_store.thumbnail(digest, size)
+    except Exception:
+        logger.exception(f"Не удалось построить миниатюру {digest}_{size}")
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Не удалось обработать изображение"
+        )
+    if path is None:
+        raise media_not_found()
+    return serve_media_file(request, path, "image/webp", f'"{digest}-{size}"')
+
+
+# Поток событий (Server-Sent Events)
+@router.get("/events")
+async def stream_events(
+    request: Request,
+    access_token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db)
+):
+    # Поток уведомлений пользователя. EventSource не умеет передавать заголовки,
+    # поэтому токен можно передать параметром ?access_token=
+    token = credentials.credentials if credentials else access_token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Требуется токен",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    user = authenticate_token(token, db)
+    # Соединение с БД не должно удерживаться на все время жизни потока
+    db.close()
+    
+    if not hub.has_capacity(user.id):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много открытых соединений"
+        )
+    
+    async def event_stream():
+        # Подписка создается в самом потоке: если клиент отключился до начала
+        # передачи, генератор не запускается и место в лимите не занимается
+        subscription = hub.subscribe(user.id)
+        if subscription is None:
+            # Лимит заняли между проверкой и началом потока
+            return
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=settings.EVENTS_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    # Heartbeat не дает прокси закрыть простаивающее соединение
+                    yield ": heartbeat\n\n"
+                    continue
+                
+                if subscription.overflowed:
+                    # Часть событий потеряна - клиенту нужно перечитать данные
+                    subscription.overflowed = False
+                    yield format_sse({"type": "resync", "data": {}})
+                yield format_sse(event)
+        finally:
+            hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
\ No newline at end of file
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from config import settings
+from invalidation import bus
+from metrics import metrics
+
+
+class LocalCache:
+    # Кеш в памяти процесса: LRU с ограничением размера и TTL.
+    # Каждый воркер держит свой экземпляр, согласованность между воркерами
+    # обеспечивает шина инвалидации (invalidation.py).
+
+    def __init__(self, name: str, max_size: int = 1024, ttl: float = 60.0):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        # Поколение увеличивается при каждой инвалидации: значение, прочитанное
+        # из БД до инвалидации, не попадет в кеш после нее
+        self.generation = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        # Получить значение или None, если его нет или оно устарело
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                metrics.incr(f"cache.{self.name}.miss")
+                return None
+            self._data.move_to_end(key)
+        metrics.incr(f"cache.{self.name}.hit")
+        return item[0]
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        # Сохранить значение; generation - поколение на момент чтения из БД
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        # Удалить одно значение
+        with self._lock:
+            self.generation += 1
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        # Очистить кеш полностью
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Реестр кешей процесса
+caches: Dict[str, LocalCache] = {}
+
+
+def create_cache(name: str, max_size: int, ttl: float) -> LocalCache:
+    # Создать и зарегистрировать именованный кеш
+    cache = LocalCache(name, max_size=max_size, ttl=ttl)
+    caches[name] = cache
+    return cache
+
+
+# КЕШИ ПРИЛОЖЕНИЯ
+
+mentor_cache = create_cache(
+    "mentors", max_size=settings.MENTOR_CACHE_MAX_SIZE, ttl=settings.MENTOR_CACHE_TTL_SECONDS
+)
+user_cache = create_cache(
+    "users", max_size=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS
+)
+calendar_cache = create_cache(
+    "calendar", max_size=settings.CALENDAR_CACHE_MAX_SIZE, ttl=settings.CALENDAR_CACHE_TTL_SECONDS
+)
+
+# Версии расписаний менторов: входят в ключ calendar_cache, поэтому после
+# изменения бронирований старые записи просто перестают находиться
+calendar_versions: Dict[int, int] = {}
+
+
+def _invalidate_users(key: Optional[str]) -> None:
+    if key is None:
+        user_cache.clear()
+    else:
+        user_cache.delete(int(key))
+
+
+def _invalidate_mentor_stats(key: Optional[str]) -> None:
+    # Агрегаты бронирований: сбрасывается только карточка ментора,
+    # списки обновляются по TTL (MENTOR_CACHE_TTL_SECONDS)
+    if key is None:
+        mentor_cache.clear()
+    else:
+        mentor_cache.delete(("mentor", int(key)))
+
+
+# Списки менторов зависят от любого ментора, поэтому кеш сбрасывается целиком
+bus.subscribe("mentors", lambda key: mentor_cache.clear())
+bus.subscribe("mentor_stats", _invalidate_mentor_stats)
+bus.subscribe("users", _invalidate_users)
+
+
+def _invalidate_calendar(key: Optional[str]) -> None:
+    if key is None:
+        calendar_cache.clear()
+    else:
+        mentor_id = int(key)
+        calendar_versions[mentor_id] = calendar_versions.get(mentor_id, 0) + 1
+
+
+bus.subscribe("bookings", _invalidate_calendar)
@@ -0,0 +1,271 @@
+import copy
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from crud import MENTOR_SORT_FIELDS
+from database import SessionLocal
+from invalidation import bus
+from metrics import metrics
+from projection import Projector
+from singleflight import SingleFlight
+import models_db as models
+import schemas
+
+try:
+    import numpy as np
+except ImportError:  # numpy - необязательная зависимость, без нее фильтрация идет циклом
+    np = None
+
+
+# Колонки таблицы менторов, из которых строится снимок (без ORM объектов)
+SNAPSHOT_COLUMNS = [column for column in models.Mentor.__table__.columns]
+
+mentor_adapter = TypeAdapter(schemas.MentorResponse)
+mentor_projector = Projector(schemas.MentorResponse)
+
+
+def _serialize(row) -> bytes:
+    # JSON одной строки в формате MentorResponse
+    return mentor_adapter.dump_json(mentor_adapter.validate_python(dict(row._mapping)))
+
+
+def _column(values: Iterable, typecode: str):
+    # Числовая колонка: массив numpy или array.array
+    if np is not None:
+        return np.fromiter(values, dtype={"q": np.int64, "d": np.float64, "b": np.bool_}[typecode])
+    return array(typecode, values)
+
+
+def _encode(values: Sequence[str]):
+    # Словарное кодирование строковой колонки: значение -> код
+    codes: Dict[str, int] = {}
+    for value in values:
+        codes.setdefault(value, len(codes))
+    return _column((codes[value] for value in values), "q"), codes
+
+
+class MentorSnapshot:
+    # Колоночный снимок каталога менторов.
+    # Строки упорядочены по id; для каждой строки хранится готовый JSON,
+    # а фильтры и сортировки считаются по числовым колонкам. Снимок неизменен:
+    # изменения дают новый снимок (patched), который подменяет старый целиком.
+
+    def __init__(self, rows: List, rows_json: Optional[List[bytes]] = None):
+        self.size = len(rows)
+        self.ids = [row.id for row in rows]
+        self.index_by_id = {mentor_id: index for index, mentor_id in enumerate(self.ids)}
+        self.rows = rows
+        self.rows_json = rows_json if rows_json is not None else [_serialize(row) for row in rows]
+
+        self.price = _column((row.price for row in rows), "q")
+        self.rating = _column((row.rating or 0.0 for row in rows), "d")
+        self.experience_years = _column((row.experience_years or 0 for row in rows), "q")
+        self.is_available = _column((bool(row.is_available) for row in rows), "b")
+        self.city, self.city_codes = _encode([row.city for row in rows])
+        self.yoga_style, self.yoga_style_codes = _encode([row.yoga_style for row in rows])
+        self.gender, self.gender_codes = _encode([row.gender for row in rows])
+
+        # Порядки сортировки считаются один раз; при равенстве значений - по id
+        self.orders = {}
+        for field in MENTOR_SORT_FIELDS:
+            values = getattr(self, field)
+            if np is not None:
+                self.orders[field] = np.argsort(values, kind="stable")
+                self.orders[f"-{field}"] = np.argsort(-values, kind="stable")
+            else:
+                self.orders[field] = sorted(range(self.size), key=lambda i: (values[i], i))
+                self.orders[f"-{field}"] = sorted(range(self.size), key=lambda i: (-values[i], i))
+
+    def patched(self, changed_rows: List, stats_only: bool = False) -> Optional["MentorSnapshot"]:
+        # Новый снимок с замененными строками; None - нужна полная пересборка.
+        # stats_only - изменились только агрегаты бронирований: они не участвуют
+        # в фильтрах и сортировках, поэтому колонки и порядки берутся из этого снимка
+        rows = list(self.rows)
+        rows_json = list(self.rows_json)
+        for row in changed_rows:
+            index = self.index_by_id.get(row.id)
+            if index is None:
+                return None
+            rows[index] = row
+            rows_json[index] = _serialize(row)
+        if not stats_only:
+            return MentorSnapshot(rows, rows_json)
+        snapshot = copy.copy(self)
+        snapshot.rows = rows
+        snapshot.rows_json = rows_json
+        return snapshot
+
+    def query(
+        self,
+        city: Optional[str] = None,
+        yoga_style: Optional[str] = None,
+        gender: Optional[str] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        min_rating: Optional[float] = None,
+        sort: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+        fields: Optional[List[str]] = None
+    ) -> bytes:
+        # Отфильтровать, отсортировать и вернуть страницу в виде JSON массива
+        # (fields - только эти поля; сериализуются лишь строки страницы)
+        encoded_filters = []
+        for value, column, codes in (
+            (city, self.city, self.city_codes),
+            (yoga_style, self.yoga_style, self.yoga_style_codes),
+            (gender, self.gender, self.gender_codes),
+        ):
+            if value:
+                code = codes.get(value)
+                if code is None:
+                    return b"[]"
+                encoded_filters.append((column, code))
+
+        if np is not None:
+            page = self._query_numpy(encoded_filters, min_price, max_price, min_rating, sort, skip, limit)
+        else:
+            page = self._query_python(encoded_filters, min_price, max_price, min_rating, sort, skip, limit)
+
+        if fields:
+            return mentor_projector.dump_json([self.rows[index] for index in page], fields)
+        return b"[" + b",".join(self.rows_json[index] for index in page) + b"]"
+
+    def _query_numpy(self, encoded_filters, min_price, max_price, min_rating, sort, skip, limit):
+        mask = self.is_available.copy()
+        for column, code in encoded_filters:
+            mask &= column == code
+        if min_price is not None:
+            mask &= self.price >= min_price
+        if max_price is not None:
+            mask &= self.price <= max_price
+        if min_rating is not None:
+            mask &= self.rating >= min_rating
+
+        if sort:
+            order = self.orders[sort]
+            indexes = order[mask[order]]
+        else:
+            indexes = np.flatnonzero(mask)
+        return indexes[skip:skip + limit].tolist()
+
+    def _query_python(self, encoded_filters, min_price, max_price, min_rating, sort, skip, limit):
+        def matches(i: int) -> bool:
+            if not self.is_available[i]:
+                return False
+            for column, code in encoded_filters:
+                if column[i] != code:
+                    return False
+            if min_price is not None and self.price[i] < min_price:
+                return False
+            if max_price is not None and self.price[i] > max_price:
+                return False
+            if min_rating is not None and self.rating[i] < min_rating:
+                return False
+            return True
+
+        order = self.orders[sort] if sort else range(self.size)
+        page = []
+        skipped = 0
+        for i in order:
+            if not matches(i):
+                continue
+            if skipped < skip:
+                skipped += 1
+                continue
+            page.append(i)
+            if len(page) >= limit:
+                break
+        return page
+
+
+class CatalogSnapshotManager:
+    # Хранит текущий снимок и пересобирает его после изменений менторов.
+    # Замена снимка - атомарная подмена ссылки; запросы, уже получившие
+    # старый снимок, дочитывают его без блокировок.
+
+    def __init__(self):
+        self._snapshot: Optional[MentorSnapshot] = None
+        self._full_rebuild = True
+        self._dirty_ids: set = set()
+        # Менторы, у которых изменились только агрегаты бронирований
+        self._stats_ids: set = set()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("catalog_snapshot")
+
+    def invalidate(self, key: Optional[str]) -> None:
+        # Пометить снимок устаревшим (одна строка или целиком)
+        with self._lock:
+            if key is None:
+                self._full_rebuild = True
+            else:
+                self._dirty_ids.add(int(key))
+
+    def invalidate_stats(self, key: Optional[str]) -> None:
+        # Изменились агрегаты бронирований (одного ментора или всех)
+        with self._lock:
+            if key is None:
+                self._full_rebuild = True
+            else:
+                self._stats_ids.add(int(key))
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._snapshot is not None
+            and not self._full_rebuild
+            and not self._dirty_ids
+            and not self._stats_ids
+        )
+
+    async def get(self) -> MentorSnapshot:
+        # Актуальный снимок; пересборка выполняется один раз для всех ожидающих
+        if self._is_fresh():
+            return self._snapshot
+        return await self._flight.do("snapshot", lambda: run_in_threadpool(self.refresh))
+
+    def refresh(self) -> MentorSnapshot:
+        # Пересобрать снимок (полностью или только измененные строки)
+        with self._lock:
+            full_rebuild, dirty_ids, stats_ids = self._full_rebuild, self._dirty_ids, self._stats_ids
+            self._full_rebuild, self._dirty_ids, self._stats_ids = False, set(), set()
+
+        db = SessionLocal()
+        try:
+            snapshot = None
+            if not full_rebuild and self._snapshot is not None:
+                if dirty_ids:
+                    snapshot = self._snapshot.patched(self._load_rows(db, dirty_ids | stats_ids))
+                    metrics.incr("catalog_snapshot.patched")
+                elif stats_ids:
+                    snapshot = self._snapshot.patched(self._load_rows(db, stats_ids), stats_only=True)
+                    metrics.incr("catalog_snapshot.stats_patched")
+                else:
+                    snapshot = self._snapshot
+            if snapshot is None:
+                snapshot = MentorSnapshot(self._load_rows(db))
+                metrics.incr("catalog_snapshot.rebuilt")
+        except Exception:
+            with self._lock:
+                self._full_rebuild = True
+            raise
+        finally:
+            db.close()
+
+        self._snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def _load_rows(db: Session, ids: Optional[set] = None) -> List:
+        stmt = select(*SNAPSHOT_COLUMNS).order_by(models.Mentor.id)
+        if ids is not None:
+            stmt = stmt.where(models.Mentor.id.in_(ids))
+        return list(db.execute(stmt))
+
+
+catalog = CatalogSnapshotManager()
+bus.subscribe("mentors", catalog.invalidate)
+bus.subscribe("mentor_stats", catalog.invalidate_stats)
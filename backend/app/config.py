@@ -1,28 +1,172 @@
 from datetime import timedelta
-from dotenv import load_dotenv
+from typing import Dict, List, Optional
 from pathlib import Path
 from pydantic_settings import BaseSettings
 
+# .env читается самими настройками при создании, без изменения os.environ
 env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
 
 class Settings(BaseSettings):
     # Настройки JWT
     SECRET_KEY: str
+    # HS256 - общий секрет; EdDSA или ES256 - пара ключей, проверять токены
+    # можно по открытому ключу (/.well-known/jwks.json) без SECRET_KEY
     ALGORITHM: str = "HS256"
+    # PEM строка или путь к файлу
+    JWT_PRIVATE_KEY: Optional[str] = None
+    JWT_PUBLIC_KEY: Optional[str] = None
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     TIMEZONE: str = "Europe/Moscow"
+    # Хеширование паролей: PASSWORD_HASH_ROUNDS=0 - подобрать стоимость при старте
+    # воркера так, чтобы хеш занимал около PASSWORD_HASH_TARGET_MS
+    PASSWORD_HASH_SCHEME: str = "sha256_crypt"
+    PASSWORD_HASH_ROUNDS: int = 29000
+    PASSWORD_HASH_TARGET_MS: float = 100
+    # Хеши со стоимостью ниже текущей больше чем на эту долю перехешируются при входе
+    PASSWORD_HASH_REHASH_TOLERANCE: float = 0.1
+    # Размер списка отозванных access токенов в памяти воркера. Должен покрывать
+    # худший случай: отзывов в секунду * ACCESS_TOKEN_EXPIRE_MINUTES * 60. При
+    # переполнении отзываются все токены, истекающие раньше вытесненного
+    REVOCATION_MAX_ENTRIES: int = 100_000
 
     DATABASE_URL: str = "sqlite:///./data/yogavibe.db"
+    # Реплики только для чтения для GET /mentors, /notes, /bookings (JSON список URL).
+    # Для SQLite можно указать тот же файл: соединения откроются в режиме query_only
+    DATABASE_REPLICA_URLS: List[str] = []
+    # Сколько секунд после записи чтения пользователя идут в основную БД
+    READ_YOUR_WRITES_SECONDS: float = 5
     DEBUG: bool = True
+    # Пользователи с доступом к отладочным эндпоинтам /api/debug/* (JSON список имен)
+    ADMIN_USERNAMES: List[str] = []
+
+    # Интервал сверки агрегатов менторов (0 - отключить)
+    MENTOR_STATS_RECONCILE_INTERVAL_SECONDS: int = 3600
+
+    # Кеши воркера и шина инвалидации между воркерами
+    MENTOR_CACHE_TTL_SECONDS: float = 60
+    MENTOR_CACHE_MAX_SIZE: int = 1024
+    USER_CACHE_TTL_SECONDS: float = 30
+    USER_CACHE_MAX_SIZE: int = 10_000
+    CALENDAR_CACHE_TTL_SECONDS: float = 300
+    CALENDAR_CACHE_MAX_SIZE: int = 2048
+    CALENDAR_MAX_DAYS: int = 92
+    CATALOG_LOAD_TIMEOUT_SECONDS: float = 10
+    # Отдавать GET /mentors из колоночного снимка каталога в памяти
+    CATALOG_SNAPSHOT_ENABLED: bool = True
+    CACHE_INVALIDATION_POLL_SECONDS: float = 0.5
+    CACHE_INVALIDATION_RETENTION_MINUTES: int = 60
+
+    # Server-Sent Events (/events)
+    EVENTS_HEARTBEAT_SECONDS: float = 15
+    EVENTS_QUEUE_SIZE: int = 100
+    EVENTS_MAX_CONNECTIONS_PER_USER: int = 5
+
+    # Ключи идемпотентности (заголовок Idempotency-Key)
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    IDEMPOTENCY_CACHE_SIZE: int = 10_000
+    IDEMPOTENCY_PURGE_INTERVAL_SECONDS: int = 3600
+    # Ключ занимается до выполнения запроса на IDEMPOTENCY_LEASE_SECONDS;
+    # повтор из другого воркера ждет ответа до IDEMPOTENCY_WAIT_SECONDS, затем 409
+    IDEMPOTENCY_LEASE_SECONDS: int = 60
+    IDEMPOTENCY_WAIT_SECONDS: float = 10
+
+    # Архивация холодных строк (интервал 0 - отключить): завершенные и отмененные
+    # бронирования старше ARCHIVE_BOOKINGS_AFTER_DAYS, отозванные и истекшие
+    # refresh токены, заметки через ARCHIVE_DELETED_NOTES_AFTER_DAYS после удаления
+    ARCHIVE_INTERVAL_SECONDS: int = 3600
+    ARCHIVE_BOOKINGS_AFTER_DAYS: int = 180
+    ARCHIVE_DELETED_NOTES_AFTER_DAYS: int = 30
+    # Строк в одной транзакции и транзакций за один запуск задачи
+    ARCHIVE_BATCH_SIZE: int = 500
+    ARCHIVE_MAX_BATCHES: int = 100
+
+    # Групповой коммит (по умолчанию выключен): создание и изменение заметок и выпуск
+    # refresh токенов выполняет один поток-писатель, фиксируя записи конкурентных
+    # запросов одной транзакцией раз в GROUP_COMMIT_WINDOW_MS
+    GROUP_COMMIT_ENABLED: bool = False
+    GROUP_COMMIT_WINDOW_MS: float = 2
+    GROUP_COMMIT_MAX_BATCH: int = 256
+
+    # Изображения (/media): оригиналы и миниатюры на локальном диске. Миниатюры
+    # строятся при первом запросе (нужен Pillow) и вытесняются по LRU сверх бюджета
+    MEDIA_ROOT: str = "./data/media"
+    MEDIA_MAX_UPLOAD_BYTES: int = 10 * 1024 * 1024
+    MEDIA_THUMBNAIL_SIZES: List[int] = [128, 256, 512]
+    MEDIA_THUMBNAIL_QUALITY: int = 80
+    MEDIA_THUMBNAIL_WORKERS: int = 2
+    # Изображения больше этого числа точек не уменьшаются (защита от "бомб" распаковки)
+    MEDIA_MAX_IMAGE_PIXELS: int = 40_000_000
+    MEDIA_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    # Префикс internal location nginx: файлы отдает nginx (X-Accel-Redirect, sendfile)
+    MEDIA_ACCEL_REDIRECT_PREFIX: Optional[str] = None
+
+    # Запуск сервера (serve.py); WEB_CONCURRENCY=0 - по числу ядер
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    WEB_CONCURRENCY: int = 0
+    GRACEFUL_TIMEOUT_SECONDS: int = 30
+
+    # Логирование (logs.py): формат "json" или "text", уровни корневого и отдельных
+    # логгеров. SQL запросы пишутся при LOG_LEVELS["sqlalchemy.engine"] = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: Dict[str, str] = {
+        "sqlalchemy.engine": "WARNING",
+        # Журнал доступа ведет RequestLoggingMiddleware (с id запроса и выборкой)
+        "uvicorn.access": "WARNING",
+    }
+    # Доля запросов, у которых пишутся записи ниже WARNING (1.0 - все запросы)
+    LOG_SAMPLE_RATE: float = 1.0
+    # Запросы дольше порога и ответы 5xx попадают в журнал доступа всегда
+    LOG_SLOW_REQUEST_MS: float = 1000
+    # Размер очереди записей; при переполнении записи отбрасываются
+    LOG_QUEUE_SIZE: int = 10_000
+
+    # Профилирование (по умолчанию выключено): статистика SQL по отпечаткам запросов,
+    # медленные запросы логируются с планом; /api/debug/queries - top-N
+    SQL_PROFILER_ENABLED: bool = False
+    SQL_SLOW_QUERY_MS: float = 100
+    SQL_PROFILER_TOP_N: int = 20
+    SQL_PROFILER_WINDOW_SECONDS: float = 300
+    SQL_PROFILER_MAX_FINGERPRINTS: int = 1000
+    # Профили отдельных запросов: заголовок X-Profile или доля случайных запросов
+    REQUEST_PROFILING_ENABLED: bool = False
+    REQUEST_PROFILING_SAMPLE_RATE: float = 0.0
+    REQUEST_PROFILING_KEEP: int = 20
+
+    # Ограничение частоты запросов: "МЕТОД путь" -> {"ip" | "user": "N/second|minute|hour|day"}
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    RATE_LIMITS: Dict[str, Dict[str, str]] = {
+        "POST /api/v1/auth/login": {"ip": "10/minute"},
+        "POST /api/v1/auth/register": {"ip": "5/minute"},
+        "POST /api/v1/auth/refresh": {"ip": "30/minute"},
+        "POST /api/v1/notes": {"ip": "120/minute", "user": "30/minute"},
+        "POST /api/v1/bookings": {"ip": "60/minute", "user": "10/minute"},
+        "POST /api/v1/bookings/waitlist": {"ip": "60/minute", "user": "10/minute"},
+    }
+
+    # Сжатие ответов (brotli используется, если установлен пакет brotli)
+    COMPRESSION_MINIMUM_SIZE: int = 500
+    GZIP_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+
+    # Политики Cache-Control: префикс пути -> значение заголовка
+    CACHE_POLICIES: Dict[str, str] = {
+        "/api/v1/mentors": "public, max-age=60",
+        "/api/v1/notes": "private, no-store",
+        "/api/v1/bookings": "private, no-store",
+        "/api/v1/users": "private, no-store",
+        "/api/v1/auth": "no-store",
+    }
 
     @property
     def moscow_tz(self) -> timedelta:
         return timedelta(hours=3)
     
     class Config:
-        env_file = ".env"
+        env_file = (env_path, ".env")
 
 
 settings = Settings()
\ No newline at end of file
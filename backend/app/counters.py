@@ -0,0 +1,74 @@
+from sqlalchemy import bindparam, event, insert, update
+from sqlalchemy.orm import Session
+import models_db as models
+
+# Счетчики строк: по пользователю (users.note_count, users.booking_count) и общие
+# (таблица counters). Итоги для X-Total-Count и статистики читаются одной строкой
+# вместо COUNT(*) по таблице.
+#   notes    - заметки, кроме удаленных
+#   bookings - все бронирования пользователя, включая отмененные и архивные
+#              (то же, что перечисляет GET /bookings)
+#
+# Изменения копятся в сессии и применяются перед коммитом той же транзакции:
+# пачка группового коммита обновляет всех своих пользователей одним запросом
+# и каждый общий счетчик - одним. Расхождение (например, после ручной правки
+# базы) исправляет crud.CounterCRUD.reconcile.
+
+# Счетчик -> колонка пользователя
+USER_COLUMNS = {
+    "notes": "note_count",
+    "bookings": "booking_count",
+}
+
+
+def record(db: Session, name: str, user_id: int, delta: int) -> None:
+    # Зарегистрировать изменение счетчика в текущей транзакции (без запроса)
+    deltas = db.info.setdefault("counter_deltas", {})
+    deltas[name, user_id] = deltas.get((name, user_id), 0) + delta
+
+
+def add_total(db: Session, name: str, delta: int) -> None:
+    # Изменить общий счетчик; если строки нет, она создается
+    counters = models.Counter.__table__
+    result = db.execute(
+        update(counters).where(counters.c.name == name).values(value=counters.c.value + delta)
+    )
+    if result.rowcount == 0:
+        db.execute(insert(counters).values(name=name, value=delta))
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_deltas(session: Session) -> None:
+    deltas = session.info.pop("counter_deltas", None)
+    if not deltas:
+        return
+
+    users = models.User.__table__
+    for name, column in USER_COLUMNS.items():
+        rows = [
+            {"counter_user_id": user_id, "counter_delta": delta}
+            for (counter, user_id), delta in deltas.items()
+            if counter == name and delta
+        ]
+        if not rows:
+            continue
+        session.execute(
+            update(users)
+            .where(users.c.id == bindparam("counter_user_id"))
+            .values({column: users.c[column] + bindparam("counter_delta")}),
+            rows,
+        )
+        total = sum(row["counter_delta"] for row in rows)
+        if total:
+            add_total(session, name, total)
+
+
+@event.listens_for(models.Counter.__table__, "after_create")
+def _seed_totals(table, connection, **kw) -> None:
+    # Строки общих счетчиков создаются вместе с таблицей
+    connection.execute(insert(table), [{"name": name, "value": 0} for name in USER_COLUMNS])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_deltas(session: Session) -> None:
+    session.info.pop("counter_deltas", None)
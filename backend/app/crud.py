@@ -1,11 +1,34 @@
 import math
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, select, delete
+import uuid
+from fastapi import BackgroundTasks
+from sqlalchemy.orm import Session, aliased, joinedload, load_only
+from sqlalchemy import and_, or_, select, insert, delete, update, func, case, union_all
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List
+from zoneinfo import ZoneInfo
 import models_db as models
 import schemas
-from utils import get_password_hash, verify_password
+from config import settings
+from database import SessionLocal
+from invalidation import bus
+import counters
+from events import publish_event
+from revocation import revoke_user_tokens
+from utils import get_password_hash, verify_password, password_needs_rehash
+
+
+# Статусы, при которых бронирование занимает слот ментора
+ACTIVE_BOOKING_STATUSES = ("pending", "confirmed")
+
+# Статусы, с которыми прошедшие бронирования переносятся в архив
+ARCHIVED_BOOKING_STATUSES = ("completed", "cancelled")
+
+# Поля, по которым можно сортировать каталог менторов
+MENTOR_SORT_FIELDS = ("price", "rating", "experience_years")
+
+# status_code ключа идемпотентности, запрос по которому еще выполняется
+IDEMPOTENCY_PENDING = 0
 
 
 # CRUD операции для пользователей
@@ -28,8 +51,14 @@ class UserCRUD:
         return db.scalar(stmt)
     
     @staticmethod
-    def authenticate_user(db: Session, login: str, password: str) -> Optional[models.User]:
-        # Аутентификация пользователя по email или username
+    def authenticate_user(
+        db: Session,
+        login: str,
+        password: str,
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> Optional[models.User]:
+        # Аутентификация пользователя по email или username.
+        # Устаревший хеш пароля пересчитывается в фоне после ответа на вход
         stmt = select(models.User).where(
             or_(
                 models.User.email == login,
@@ -42,8 +71,27 @@ class UserCRUD:
             return None
         if not verify_password(password, user.hashed_password):
             return None
+        if background_tasks is not None and password_needs_rehash(user.hashed_password):
+            background_tasks.add_task(UserCRUD.rehash_password, user.id, password, user.hashed_password)
         return user
     
+    @staticmethod
+    def rehash_password(user_id: int, password: str, old_hash: str) -> bool:
+        # Пересчитать хеш с текущими параметрами (отдельная сессия - выполняется после ответа).
+        # Хеш заменяется, только если пароль не сменили за это время
+        new_hash = get_password_hash(password)
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                update(models.User)
+                .where(models.User.id == user_id, models.User.hashed_password == old_hash)
+                .values(hashed_password=new_hash)
+            )
+            db.commit()
+            return result.rowcount == 1
+        finally:
+            db.close()
+    
     @staticmethod
     def create_user(db: Session, user_data: schemas.UserCreate) -> models.User:
         # Создать нового пользователя
@@ -57,7 +105,6 @@ class UserCRUD:
         
         db.add(user)
         db.commit()
-        db.refresh(user)
         return user
     
     @staticmethod
@@ -71,8 +118,39 @@ class UserCRUD:
             if hasattr(user, key) and value is not None:
                 setattr(user, key, value)
         
+        bus.publish(db, "users", user_id)
+        db.commit()
+        return user
+    
+    @staticmethod
+    def set_photo(db: Session, user_id: int, photo_url: Optional[str]) -> Optional[models.User]:
+        # Установить или убрать (None) фото профиля
+        user = UserCRUD.get_user(db, user_id)
+        if not user:
+            return None
+        
+        user.photo_url = photo_url
+        bus.publish(db, "users", user_id)
+        db.commit()
+        return user
+    
+    @staticmethod
+    def deactivate_user(db: Session, user_id: int) -> Optional[models.User]:
+        # Деактивировать пользователя: refresh токены гасятся в БД,
+        # выданные access токены отзываются во всех воркерах
+        user = UserCRUD.get_user(db, user_id)
+        if not user:
+            return None
+        
+        user.is_active = False
+        db.execute(
+            update(models.RefreshToken)
+            .where(models.RefreshToken.user_id == user_id)
+            .values(is_active=False)
+        )
+        revoke_user_tokens(db, user_id)
+        bus.publish(db, "users", user_id)
         db.commit()
-        db.refresh(user)
         return user
 
 
@@ -89,65 +167,199 @@ class MentorCRUD:
         skip: int = 0, 
         limit: int = 100,
         city: Optional[str] = None,
-        yoga_style: Optional[str] = None
-    ) -> List[models.Mentor]:
-        # Получить список менторов с фильтрацией
-        stmt = select(models.Mentor).where(models.Mentor.is_available == True)
+        yoga_style: Optional[str] = None,
+        gender: Optional[str] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        min_rating: Optional[float] = None,
+        sort: Optional[str] = None,
+        columns: Optional[List[str]] = None
+    ) -> List:
+        # Получить список менторов с фильтрацией.
+        # columns - выбрать только эти колонки (строки Core вместо ORM объектов)
+        if columns:
+            stmt = select(*[getattr(models.Mentor, name) for name in columns])
+        else:
+            stmt = select(models.Mentor)
+        stmt = stmt.where(models.Mentor.is_available == True)
         
         if city:
             stmt = stmt.where(models.Mentor.city == city)
         if yoga_style:
             stmt = stmt.where(models.Mentor.yoga_style == yoga_style)
+        if gender:
+            stmt = stmt.where(models.Mentor.gender == gender)
+        if min_price is not None:
+            stmt = stmt.where(models.Mentor.price >= min_price)
+        if max_price is not None:
+            stmt = stmt.where(models.Mentor.price <= max_price)
+        if min_rating is not None:
+            stmt = stmt.where(models.Mentor.rating >= min_rating)
+        
+        # Сортировка "поле" или "-поле"; при равенстве - по id
+        if sort:
+            column = getattr(models.Mentor, sort.lstrip("-"))
+            stmt = stmt.order_by(column.desc() if sort.startswith("-") else column.asc())
+        stmt = stmt.order_by(models.Mentor.id)
         
         stmt = stmt.offset(skip).limit(limit)
-        return list(db.scalars(stmt))
+        return list(db.execute(stmt)) if columns else list(db.scalars(stmt))
     
     @staticmethod
     def create_mentor(db: Session, mentor_data: schemas.MentorCreate) -> models.Mentor:
         # Создать нового ментора
         mentor = models.Mentor(**mentor_data.model_dump())
         db.add(mentor)
+        bus.publish(db, "mentors")
         db.commit()
-        db.refresh(mentor)
         return mentor
+    
+    @staticmethod
+    def apply_stats_delta(
+        db: Session,
+        mentor_id: int,
+        total: int = 0,
+        upcoming: int = 0,
+        completed: int = 0,
+        revenue: int = 0
+    ) -> None:
+        # Атомарно изменить агрегаты ментора в текущей транзакции (без коммита)
+        values = {}
+        if total:
+            values["total_bookings"] = models.Mentor.total_bookings + total
+        if upcoming:
+            values["upcoming_bookings"] = models.Mentor.upcoming_bookings + upcoming
+        if completed:
+            values["completed_sessions"] = models.Mentor.completed_sessions + completed
+        if revenue:
+            values["revenue"] = models.Mentor.revenue + revenue
+        if not values:
+            return
+        
+        db.execute(
+            update(models.Mentor).where(models.Mentor.id == mentor_id).values(**values)
+        )
+        # Отдельная тема: агрегаты не влияют на фильтры и сортировки каталога,
+        # поэтому снимок и кеш менторов не пересобираются целиком
+        bus.publish(db, "mentor_stats", mentor_id)
+    
+    @staticmethod
+    def lock_mentors(db: Session) -> None:
+        # Заблокировать строки менторов до конца транзакции. Записи бронирований
+        # меняют агрегаты UPDATE-ом этих строк и ждут снятия блокировки.
+        # В SQLite блокировок строк нет - транзакция сразу берет блокировку записи
+        connection = db.connection()
+        if connection.dialect.name == "sqlite":
+            if not connection.connection.dbapi_connection.in_transaction:
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            db.execute(select(models.Mentor.id).with_for_update())
+    
+    @staticmethod
+    def reconcile_stats(db: Session) -> int:
+        # Пересчитать агрегаты всех менторов по бронированиям, включая архивные.
+        # Строки менторов заблокированы на время пересчета: бронирование, созданное
+        # между подсчетом и записью итогов, не потеряется
+        MentorCRUD.lock_mentors(db)
+        now = datetime.now(timezone.utc)
+        bookings = BookingCRUD.with_archive("mentor_id", "session_date", "price", "status")
+        is_active = bookings.c.status.in_(ACTIVE_BOOKING_STATUSES)
+        is_completed = bookings.c.status == "completed"
+        
+        stmt = select(
+            bookings.c.mentor_id,
+            func.count(),
+            func.sum(case((and_(is_active, bookings.c.session_date >= now), 1), else_=0)),
+            func.sum(case((is_completed, 1), else_=0)),
+            func.sum(case((is_completed, bookings.c.price), else_=0)),
+        ).group_by(bookings.c.mentor_id)
+        
+        aggregates = {
+            mentor_id: (total, upcoming or 0, completed or 0, revenue or 0)
+            for mentor_id, total, upcoming, completed, revenue in db.execute(stmt)
+        }
+        
+        rows = []
+        for mentor_id in db.scalars(select(models.Mentor.id)):
+            total, upcoming, completed, revenue = aggregates.get(mentor_id, (0, 0, 0, 0))
+            rows.append({
+                "id": mentor_id,
+                "total_bookings": total,
+                "upcoming_bookings": upcoming,
+                "completed_sessions": completed,
+                "revenue": revenue,
+            })
+        
+        if rows:
+            db.execute(update(models.Mentor), rows)
+            bus.publish(db, "mentor_stats")
+        db.commit()
+        return len(rows)
 
 
 # CRUD операции для заметок
 class NoteCRUD:
     @staticmethod
     def get_note(db: Session, note_id: int) -> Optional[models.Note]:
-        # Получить заметку по ID
-        return db.get(models.Note, note_id)
+        # Получить заметку по ID (удаленные не возвращаются)
+        note = db.get(models.Note, note_id)
+        return note if note is not None and note.deleted_at is None else None
     
     @staticmethod
     def get_user_notes(
         db: Session, 
         user_id: int, 
         skip: int = 0, 
-        limit: int = 100
-    ) -> List[models.Note]:
-        # Получить заметки пользователя
-        stmt = select(models.Note).where(
-            models.Note.user_id == user_id
+        limit: int = 100,
+        columns: Optional[List[str]] = None,
+        preview_len: Optional[int] = None
+    ) -> List:
+        # Получить заметки пользователя.
+        # columns - только эти колонки, preview_len - текст обрезается в самой БД
+        if columns or preview_len:
+            selected = []
+            for name in columns or [column.name for column in models.Note.__table__.columns]:
+                if name == "text" and preview_len:
+                    selected.append(func.substr(models.Note.text, 1, preview_len).label("text"))
+                else:
+                    selected.append(getattr(models.Note, name))
+            stmt = select(*selected)
+        else:
+            stmt = select(models.Note)
+        
+        stmt = stmt.where(
+            models.Note.user_id == user_id,
+            models.Note.deleted_at.is_(None)
         ).order_by(models.Note.created_at.desc()).offset(skip).limit(limit)
         
-        return list(db.scalars(stmt))
+        return list(db.execute(stmt)) if columns or preview_len else list(db.scalars(stmt))
     
     @staticmethod
-    def create_note(db: Session, note_data: schemas.NoteCreate, user_id: int) -> models.Note:
-        # Создать новую заметку
+    def create_note(
+        db: Session,
+        note_data: schemas.NoteCreate,
+        user_id: int,
+        commit: bool = True
+    ) -> models.Note:
+        # Создать новую заметку (commit=False - коммит за вызывающим)
         note = models.Note(
             text=note_data.text,
             user_id=user_id
         )
         db.add(note)
-        db.commit()
-        db.refresh(note)
+        counters.record(db, "notes", user_id, 1)
+        if commit:
+            db.commit()
         return note
     
     @staticmethod
-    def update_note(db: Session, note_id: int, updates: schemas.NoteCreate) -> Optional[models.Note]:
-        # Обновить заметку
+    def update_note(
+        db: Session,
+        note_id: int,
+        updates: schemas.NoteCreate,
+        commit: bool = True
+    ) -> Optional[models.Note]:
+        # Обновить заметку (commit=False - коммит за вызывающим)
         note = NoteCRUD.get_note(db, note_id)
         if not note:
             return None
@@ -155,18 +367,19 @@ class NoteCRUD:
         note.text = updates.text
         note.updated_at = datetime.now(timezone.utc)
         
-        db.commit()
-        db.refresh(note)
+        if commit:
+            db.commit()
         return note
     
     @staticmethod
     def delete_note(db: Session, note_id: int) -> bool:
-        # Удалить заметку
+        # Удалить заметку (мягко: строку позже перенесет в архив ArchiveCRUD)
         note = NoteCRUD.get_note(db, note_id)
         if not note:
             return False
         
-        db.delete(note)
+        note.deleted_at = datetime.now(timezone.utc)
+        counters.record(db, "notes", note.user_id, -1)
         db.commit()
         return True
 
@@ -183,18 +396,69 @@ class BookingCRUD:
         db: Session, 
         user_id: int, 
         skip: int = 0, 
-        limit: int = 100
+        limit: int = 100,
+        with_mentor: bool = False,
+        columns: Optional[List[str]] = None
     ) -> List[models.Booking]:
-        # Получить бронирования пользователя
+        # Получить бронирования пользователя (columns - загрузить только эти колонки).
+        # Страница, уходящая за конец основной таблицы, дочитывается из архива:
+        # там только сессии старше срока архивации, они идут в конце списка
+        stmt = BookingCRUD._user_bookings_stmt(models.Booking, user_id, with_mentor, columns)
+        bookings = list(db.scalars(stmt.offset(skip).limit(limit)))
+        if len(bookings) >= limit:
+            return bookings
+        
+        if bookings or skip == 0:
+            hot_total = skip + len(bookings)
+        else:
+            hot_total = db.scalar(
+                select(func.count()).select_from(models.Booking).where(models.Booking.user_id == user_id)
+            )
+        
+        stmt = BookingCRUD._user_bookings_stmt(models.BookingArchive, user_id, with_mentor, columns)
+        bookings.extend(db.scalars(stmt.offset(max(skip - hot_total, 0)).limit(limit - len(bookings))))
+        return bookings
+    
+    @staticmethod
+    def _user_bookings_stmt(model, user_id: int, with_mentor: bool, columns: Optional[List[str]]):
+        # Запрос бронирований пользователя к основной или архивной таблице
+        stmt = select(model).where(model.user_id == user_id).order_by(model.session_date.desc())
+        if columns:
+            stmt = stmt.options(load_only(*[getattr(model, name) for name in columns]))
+        if with_mentor:
+            # Загружаем менторов тем же запросом через JOIN
+            stmt = stmt.options(joinedload(model.mentor, innerjoin=True))
+        return stmt
+    
+    @staticmethod
+    def with_archive(*columns: str):
+        # Подзапрос UNION ALL основной и архивной таблиц бронирований
+        return union_all(
+            select(*[models.Booking.__table__.c[name] for name in columns]),
+            select(*[models.BookingArchive.__table__.c[name] for name in columns]),
+        ).subquery("all_bookings")
+    
+    @staticmethod
+    def get_upcoming_bookings(db: Session, user_id: int, limit: int = 5) -> List[models.Booking]:
+        # Ближайшие активные бронирования пользователя вместе с менторами
         stmt = select(models.Booking).where(
-            models.Booking.user_id == user_id
-        ).order_by(models.Booking.session_date.desc()).offset(skip).limit(limit)
+            models.Booking.user_id == user_id,
+            models.Booking.status.in_(ACTIVE_BOOKING_STATUSES),
+            models.Booking.session_date >= datetime.now(timezone.utc)
+        ).order_by(models.Booking.session_date).limit(limit).options(
+            joinedload(models.Booking.mentor, innerjoin=True)
+        )
         
         return list(db.scalars(stmt))
     
     @staticmethod
-    def create_booking(db: Session, booking_data: schemas.BookingCreate, user_id: int) -> models.Booking:
-        # Создать новое бронирование
+    def create_booking(
+        db: Session,
+        booking_data: schemas.BookingCreate,
+        user_id: int,
+        commit: bool = True
+    ) -> models.Booking:
+        # Создать новое бронирование (commit=False - коммит за вызывающим)
         mentor = MentorCRUD.get_mentor(db, booking_data.mentor_id)
         if not mentor:
             raise ValueError("Ментор не найден")
@@ -203,38 +467,116 @@ class BookingCRUD:
         if not mentor.is_available:
             raise ValueError("Ментор временно недоступен")
         
-        conflicting_booking = db.scalar(
-            select(models.Booking).where(
-                and_(
-                    models.Booking.mentor_id == booking_data.mentor_id,
-                    models.Booking.session_date == booking_data.session_date,
-                    models.Booking.status.in_(["pending", "confirmed"])
-                )
-            )
-        )
-        
+        conflicting_booking = BookingCRUD.get_active_booking(db, booking_data.mentor_id, booking_data.session_date)
         if conflicting_booking:
             raise ValueError("На это время уже есть бронирование")
         
-        # Расчет цены
-        hours = math.ceil(booking_data.duration_minutes / 60)
-        price = mentor.price * hours
-        
         booking = models.Booking(
             user_id=user_id,
             mentor_id=booking_data.mentor_id,
             session_date=booking_data.session_date,
             duration_minutes=booking_data.duration_minutes,
-            price=price,
+            price=BookingCRUD.calculate_price(mentor, booking_data.duration_minutes),
             notes=booking_data.notes,
             status="pending"
         )
         
         db.add(booking)
-        db.commit()
-        db.refresh(booking)
+        MentorCRUD.apply_stats_delta(db, mentor.id, total=1, upcoming=1)
+        counters.record(db, "bookings", user_id, 1)
+        db.flush()
+        BookingCRUD._publish(db, booking, "booking.created")
+        if commit:
+            db.commit()
         return booking
     
+    @staticmethod
+    def calculate_price(mentor: models.Mentor, duration_minutes: int) -> int:
+        # Цена занятия: почасовая ставка ментора за каждый начатый час
+        return mentor.price * math.ceil(duration_minutes / 60)
+    
+    @staticmethod
+    def get_active_booking(db: Session, mentor_id: int, session_date: datetime) -> Optional[models.Booking]:
+        # Активное бронирование слота ментора, если слот занят
+        return db.scalar(
+            select(models.Booking).where(
+                and_(
+                    models.Booking.mentor_id == mentor_id,
+                    models.Booking.session_date == session_date,
+                    models.Booking.status.in_(ACTIVE_BOOKING_STATUSES)
+                )
+            )
+        )
+    
+    @staticmethod
+    def get_mentor_calendar(
+        db: Session,
+        mentor_id: int,
+        start: datetime,
+        end: datetime,
+        bucket: str = "day"
+    ) -> List[tuple]:
+        # Загрузка ментора по интервалам: (начало интервала, минуты, число бронирований).
+        # Один диапазонный запрос по индексу (mentor_id, session_date) с GROUP BY в БД;
+        # диапазон старше срока архивации читается вместе с архивом.
+        # Интервалы - дни и часы по местному времени settings.TIMEZONE
+        bookings = models.Booking.__table__
+        if start < ArchiveCRUD.bookings_cutoff():
+            bookings = BookingCRUD.with_archive("mentor_id", "session_date", "duration_minutes", "status")
+        
+        tz = ZoneInfo(settings.TIMEZONE)
+        postgres = db.get_bind().dialect.name == "postgresql"
+        if postgres:
+            local_date = func.timezone(settings.TIMEZONE, bookings.c.session_date)
+            bucket_expr = func.date_trunc(bucket, local_date)
+        else:
+            # SQLite хранит время UTC без смещения и не знает правил пояса: группируем
+            # по часам UTC, а в местные дни и часы переводим ниже через zoneinfo
+            # (у каждого часа свое смещение - переход на летнее время учитывается).
+            # Дробная часть смещения (+05:30) сдвигает границы часа еще в запросе
+            shift_minutes = int(start.astimezone(tz).utcoffset().total_seconds() // 60) % 60
+            bucket_expr = func.strftime("%Y-%m-%dT%H:00:00", bookings.c.session_date, f"+{shift_minutes} minutes")
+        
+        stmt = select(
+            bucket_expr.label("bucket_start"),
+            func.sum(bookings.c.duration_minutes),
+            func.count(),
+        ).where(
+            bookings.c.mentor_id == mentor_id,
+            bookings.c.session_date >= start,
+            bookings.c.session_date < end,
+            bookings.c.status != "cancelled"
+        ).group_by("bucket_start").order_by("bucket_start")
+        
+        if postgres:
+            return [
+                (bucket_start.replace(tzinfo=tz), minutes, count)
+                for bucket_start, minutes, count in db.execute(stmt)
+            ]
+        
+        # Часы UTC идут по порядку, поэтому местные интервалы тоже; повторный час
+        # при переводе часов назад сливается в один интервал, как в date_trunc
+        buckets = {}
+        for utc_hour, minutes, count in db.execute(stmt):
+            utc_start = datetime.fromisoformat(utc_hour).replace(tzinfo=timezone.utc) - timedelta(minutes=shift_minutes)
+            local = utc_start.astimezone(tz).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+            if bucket == "day":
+                local = local.replace(hour=0)
+            total_minutes, total_count = buckets.get(local, (0, 0))
+            buckets[local] = (total_minutes + (minutes or 0), total_count + count)
+        return [(local.replace(tzinfo=tz), minutes, count) for local, (minutes, count) in buckets.items()]
+    
+    @staticmethod
+    def _publish(db: Session, booking: models.Booking, event_type: str) -> None:
+        # Уведомить владельца бронирования и сбросить кеш расписания ментора после коммита
+        bus.publish(db, "bookings", booking.mentor_id)
+        publish_event(db, booking.user_id, event_type, {
+            "id": booking.id,
+            "mentor_id": booking.mentor_id,
+            "session_date": booking.session_date.isoformat(),
+            "status": booking.status,
+        })
+    
     @staticmethod
     def update_booking_status(db: Session, booking_id: int, status: str) -> Optional[models.Booking]:
         # Обновить статус бронирования
@@ -242,44 +584,184 @@ class BookingCRUD:
         if not booking:
             return None
         
+        old_status = booking.status
         booking.status = status
         booking.updated_at = datetime.now(timezone.utc)
         
+        # Обновляем агрегаты ментора в той же транзакции
+        was_active = old_status in ACTIVE_BOOKING_STATUSES
+        is_active = status in ACTIVE_BOOKING_STATUSES
+        completed = int(status == "completed") - int(old_status == "completed")
+        MentorCRUD.apply_stats_delta(
+            db, booking.mentor_id,
+            upcoming=int(is_active) - int(was_active),
+            completed=completed,
+            revenue=completed * booking.price
+        )
+        BookingCRUD._publish(db, booking, "booking.updated")
+        
+        # Освободившийся слот сразу получает следующий из очереди ожидания
+        if was_active and status == "cancelled":
+            WaitlistCRUD.promote_next(db, booking.mentor_id, booking.session_date)
+        
         db.commit()
-        db.refresh(booking)
         return booking
 
 
-# CRUD операции для refresh токенов
-class RefreshTokenCRUD:
+# Очередь ожидания занятых слотов менторов
+class WaitlistCRUD:
     @staticmethod
-    def create_token(db: Session, token: str, user_id: int, expires_delta: timedelta) -> models.RefreshToken:
-        # Создать новый refresh токен
-        expires_at = datetime.now(timezone.utc) + expires_delta
+    def get_entry(db: Session, entry_id: int) -> Optional[models.WaitlistEntry]:
+        # Получить запись очереди по ID
+        return db.get(models.WaitlistEntry, entry_id)
+    
+    @staticmethod
+    def join(db: Session, booking_data: schemas.BookingCreate, user_id: int) -> models.WaitlistEntry:
+        # Встать в очередь на занятый слот ментора
+        mentor = MentorCRUD.get_mentor(db, booking_data.mentor_id)
+        if not mentor:
+            raise ValueError("Ментор не найден")
         
-        # Сначала проверяем, нет ли такого токена
-        existing_token = db.query(models.RefreshToken).filter(
-            models.RefreshToken.token == token
-        ).first()
+        if not mentor.is_available:
+            raise ValueError("Ментор временно недоступен")
+        
+        if booking_data.session_date <= datetime.now(timezone.utc):
+            raise ValueError("Это время уже прошло")
+        
+        booking = BookingCRUD.get_active_booking(db, booking_data.mentor_id, booking_data.session_date)
+        if not booking:
+            raise ValueError("Слот свободен - его можно забронировать")
         
-        if existing_token:
-            # Если токен уже существует, обновляем его
-            existing_token.expires_at = expires_at
-            existing_token.is_active = True
+        if booking.user_id == user_id:
+            raise ValueError("Это время уже забронировано вами")
+        
+        entry = models.WaitlistEntry(
+            user_id=user_id,
+            mentor_id=booking_data.mentor_id,
+            session_date=booking_data.session_date,
+            duration_minutes=booking_data.duration_minutes,
+            notes=booking_data.notes
+        )
+        
+        db.add(entry)
+        try:
             db.commit()
-            db.refresh(existing_token)
-            return existing_token
+        except IntegrityError:
+            db.rollback()
+            raise ValueError("Вы уже в очереди на это время")
+        return entry
+    
+    @staticmethod
+    def get_position(db: Session, entry: models.WaitlistEntry) -> int:
+        # Место записи в очереди слота (с 1): диапазон по индексу слота
+        return db.scalar(
+            select(func.count()).select_from(models.WaitlistEntry).where(
+                models.WaitlistEntry.mentor_id == entry.mentor_id,
+                models.WaitlistEntry.session_date == entry.session_date,
+                models.WaitlistEntry.id <= entry.id
+            )
+        )
+    
+    @staticmethod
+    def get_user_entries(db: Session, user_id: int) -> List[tuple]:
+        # Предстоящие записи пользователя в очередях: (запись, место в очереди)
+        ahead = aliased(models.WaitlistEntry)
+        position = select(func.count()).where(
+            ahead.mentor_id == models.WaitlistEntry.mentor_id,
+            ahead.session_date == models.WaitlistEntry.session_date,
+            ahead.id <= models.WaitlistEntry.id
+        ).correlate(models.WaitlistEntry).scalar_subquery()
         
-        # Если токена нет, создаем новый
+        stmt = select(models.WaitlistEntry, position).where(
+            models.WaitlistEntry.user_id == user_id,
+            models.WaitlistEntry.session_date >= datetime.now(timezone.utc)
+        ).order_by(models.WaitlistEntry.session_date)
+        
+        return [tuple(row) for row in db.execute(stmt)]
+    
+    @staticmethod
+    def leave(db: Session, entry_id: int) -> bool:
+        # Выйти из очереди
+        entry = WaitlistCRUD.get_entry(db, entry_id)
+        if not entry:
+            return False
+        
+        db.delete(entry)
+        db.commit()
+        return True
+    
+    @staticmethod
+    def promote_next(db: Session, mentor_id: int, session_date: datetime) -> Optional[models.Booking]:
+        # Отдать освободившийся слот первому в очереди. Выполняется в транзакции
+        # отмены (коммит за вызывающим): голова очереди - первая строка индекса
+        # (mentor_id, session_date, id), без опроса и без сортировки всей очереди.
+        # Ожидающий получает событие booking.promoted после коммита
+        entry = db.scalar(
+            select(models.WaitlistEntry).where(
+                models.WaitlistEntry.mentor_id == mentor_id,
+                models.WaitlistEntry.session_date == session_date,
+                models.WaitlistEntry.session_date > datetime.now(timezone.utc)
+            ).order_by(models.WaitlistEntry.id).limit(1).with_for_update(skip_locked=True)
+        )
+        if not entry:
+            return None
+        
+        mentor = MentorCRUD.get_mentor(db, mentor_id)
+        if not mentor or not mentor.is_available:
+            return None
+        
+        booking = models.Booking(
+            user_id=entry.user_id,
+            mentor_id=mentor_id,
+            session_date=entry.session_date,
+            duration_minutes=entry.duration_minutes,
+            price=BookingCRUD.calculate_price(mentor, entry.duration_minutes),
+            notes=entry.notes,
+            status="pending"
+        )
+        
+        db.delete(entry)
+        db.add(booking)
+        MentorCRUD.apply_stats_delta(db, mentor_id, total=1, upcoming=1)
+        counters.record(db, "bookings", booking.user_id, 1)
+        db.flush()
+        BookingCRUD._publish(db, booking, "booking.promoted")
+        return booking
+    
+    @staticmethod
+    def purge_past(db: Session) -> int:
+        # Удалить записи очередей на прошедшие слоты
+        result = db.execute(
+            delete(models.WaitlistEntry).where(
+                models.WaitlistEntry.session_date <= datetime.now(timezone.utc)
+            )
+        )
+        db.commit()
+        return result.rowcount
+
+
+# CRUD операции для refresh токенов
+class RefreshTokenCRUD:
+    @staticmethod
+    def create_token(
+        db: Session,
+        token: str,
+        user_id: int,
+        expires_delta: timedelta,
+        commit: bool = True
+    ) -> models.RefreshToken:
+        # Создать новый refresh токен (commit=False - коммит за вызывающим).
+        # Токен уникален (jti), поэтому проверка существования не нужна;
+        # id и created_at возвращает сам INSERT ... RETURNING
         refresh_token = models.RefreshToken(
             token=token,
             user_id=user_id,
-            expires_at=expires_at
+            expires_at=datetime.now(timezone.utc) + expires_delta
         )
         
         db.add(refresh_token)
-        db.commit()
-        db.refresh(refresh_token)
+        if commit:
+            db.commit()
         return refresh_token
     
     @staticmethod
@@ -293,15 +775,22 @@ class RefreshTokenCRUD:
         return db.scalar(stmt)
     
     @staticmethod
-    def deactivate_token(db: Session, token: str) -> bool:
-        # Деактивировать refresh токен
-        refresh_token = RefreshTokenCRUD.get_token(db, token)
-        if not refresh_token:
-            return False
-        
-        refresh_token.is_active = False
-        db.commit()
-        return True
+    def deactivate_token(db: Session, token: str, commit: bool = True) -> bool:
+        # Деактивировать действующий refresh токен одним UPDATE
+        # (commit=False - коммит за вызывающим)
+        result = db.execute(
+            update(models.RefreshToken)
+            .where(
+                models.RefreshToken.token == token,
+                models.RefreshToken.is_active == True,
+                models.RefreshToken.expires_at > datetime.now(timezone.utc)
+            )
+            .values(is_active=False)
+            .execution_options(synchronize_session=False)
+        )
+        if commit:
+            db.commit()
+        return result.rowcount == 1
     
     @staticmethod
     def clear_expired_tokens(db: Session, user_id: int) -> None:
@@ -314,9 +803,255 @@ class RefreshTokenCRUD:
         db.commit()
 
 
+# CRUD операции для ключей идемпотентности
+class IdempotencyCRUD:
+    @staticmethod
+    def get_key(db: Session, user_id: int, key: str) -> Optional[models.IdempotencyKey]:
+        # Получить действующую запись по ключу пользователя
+        stmt = select(models.IdempotencyKey).where(
+            models.IdempotencyKey.user_id == user_id,
+            models.IdempotencyKey.key == key,
+            models.IdempotencyKey.expires_at > datetime.now(timezone.utc)
+        )
+        return db.scalar(stmt)
+    
+    @staticmethod
+    def claim_key(db: Session, user_id: int, key: str, request_hash: str, lease: timedelta) -> Optional[str]:
+        # Занять ключ до выполнения запроса: строка со статусом IDEMPOTENCY_PENDING
+        # на время lease. Возвращает метку занявшего запроса (хранится в response_body
+        # до записи ответа); None - ключ занят (выполняется или уже выполнен)
+        # в этом или другом процессе. Истекшую строку (процесс упал, не сохранив
+        # ответ) можно занять заново
+        now = datetime.now(timezone.utc)
+        token = uuid.uuid4().hex
+        db.add(models.IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            request_hash=request_hash,
+            status_code=IDEMPOTENCY_PENDING,
+            response_body=token,
+            expires_at=now + lease
+        ))
+        try:
+            db.commit()
+            return token
+        except IntegrityError:
+            db.rollback()
+        
+        result = db.execute(
+            update(models.IdempotencyKey)
+            .where(
+                models.IdempotencyKey.user_id == user_id,
+                models.IdempotencyKey.key == key,
+                models.IdempotencyKey.expires_at <= now
+            )
+            .values(
+                request_hash=request_hash,
+                status_code=IDEMPOTENCY_PENDING,
+                response_body=token,
+                expires_at=now + lease
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return token if result.rowcount == 1 else None
+    
+    @staticmethod
+    def save_key(
+        db: Session,
+        user_id: int,
+        key: str,
+        token: str,
+        status_code: int,
+        response_body: str,
+        ttl: timedelta,
+        commit: bool = True
+    ) -> bool:
+        # Сохранить ответ в строку, занятую запросом с меткой token (commit=False -
+        # в транзакции вызывающего). False - строка уже не наша: аренда истекла
+        # и ключ занял другой запрос
+        result = db.execute(
+            update(models.IdempotencyKey)
+            .where(
+                models.IdempotencyKey.user_id == user_id,
+                models.IdempotencyKey.key == key,
+                models.IdempotencyKey.status_code == IDEMPOTENCY_PENDING,
+                models.IdempotencyKey.response_body == token
+            )
+            .values(
+                status_code=status_code,
+                response_body=response_body,
+                expires_at=datetime.now(timezone.utc) + ttl
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if commit:
+            db.commit()
+        return result.rowcount == 1
+    
+    @staticmethod
+    def release_key(db: Session, user_id: int, key: str, token: str) -> None:
+        # Освободить занятый ключ без ответа (ошибка сервера - запрос можно повторить)
+        db.execute(
+            delete(models.IdempotencyKey).where(
+                models.IdempotencyKey.user_id == user_id,
+                models.IdempotencyKey.key == key,
+                models.IdempotencyKey.status_code == IDEMPOTENCY_PENDING,
+                models.IdempotencyKey.response_body == token
+            )
+        )
+        db.commit()
+    
+    @staticmethod
+    def purge_expired(db: Session) -> int:
+        # Удалить просроченные ключи
+        result = db.execute(
+            delete(models.IdempotencyKey).where(
+                models.IdempotencyKey.expires_at <= datetime.now(timezone.utc)
+            )
+        )
+        db.commit()
+        return result.rowcount
+
+
+# Архивация холодных строк
+class ArchiveCRUD:
+    @staticmethod
+    def bookings_cutoff() -> datetime:
+        # Бронирования с сессией раньше этого момента могут быть в архиве
+        return datetime.now(timezone.utc) - timedelta(days=settings.ARCHIVE_BOOKINGS_AFTER_DAYS)
+    
+    @staticmethod
+    def move_rows(db: Session, model, archive_model, condition) -> int:
+        # Перенести подходящие строки в архивную таблицу пачками по ARCHIVE_BATCH_SIZE;
+        # каждая пачка - отдельная короткая транзакция INSERT ... SELECT + DELETE
+        columns = [column.name for column in model.__table__.columns]
+        moved = 0
+        for _ in range(settings.ARCHIVE_MAX_BATCHES):
+            ids = list(db.scalars(
+                select(model.id).where(condition).order_by(model.id).limit(settings.ARCHIVE_BATCH_SIZE)
+            ))
+            if not ids:
+                break
+            
+            db.execute(insert(archive_model.__table__).from_select(
+                columns,
+                select(*[model.__table__.c[name] for name in columns]).where(model.id.in_(ids))
+            ))
+            db.execute(delete(model.__table__).where(model.id.in_(ids)))
+            db.commit()
+            moved += len(ids)
+            if len(ids) < settings.ARCHIVE_BATCH_SIZE:
+                break
+        return moved
+    
+    @staticmethod
+    def archive_cold_rows(db: Session) -> dict:
+        # Перенести в архив старые бронирования, мертвые токены и удаленные заметки;
+        # очереди ожидания на прошедшие слоты удаляются
+        now = datetime.now(timezone.utc)
+        return {
+            "bookings": ArchiveCRUD.move_rows(
+                db, models.Booking, models.BookingArchive,
+                and_(
+                    models.Booking.status.in_(ARCHIVED_BOOKING_STATUSES),
+                    models.Booking.session_date < ArchiveCRUD.bookings_cutoff()
+                )
+            ),
+            "refresh_tokens": ArchiveCRUD.move_rows(
+                db, models.RefreshToken, models.RefreshTokenArchive,
+                or_(models.RefreshToken.is_active == False, models.RefreshToken.expires_at <= now)
+            ),
+            "notes": ArchiveCRUD.move_rows(
+                db, models.Note, models.NoteArchive,
+                models.Note.deleted_at < now - timedelta(days=settings.ARCHIVE_DELETED_NOTES_AFTER_DAYS)
+            ),
+            "waitlist": WaitlistCRUD.purge_past(db),
+        }
+
+
+# Счетчики заметок и бронирований (см. counters.py)
+class JobRunCRUD:
+    @staticmethod
+    def claim_run(db: Session, name: str, interval: timedelta) -> bool:
+        # Занять очередной запуск периодической задачи для этого воркера.
+        # False - срок еще не наступил (задачу за этот интервал выполнил другой воркер)
+        now = datetime.now(timezone.utc)
+        result = db.execute(
+            update(models.JobRun)
+            .where(models.JobRun.name == name, models.JobRun.next_run_at <= now)
+            .values(next_run_at=now + interval)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            db.commit()
+            return True
+        
+        db.add(models.JobRun(name=name, next_run_at=now + interval))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return False
+        return True
+
+
+class CounterCRUD:
+    @staticmethod
+    def get_user_count(db: Session, user_id: int, name: str) -> int:
+        # Счетчик пользователя: одна строка по первичному ключу
+        column = getattr(models.User, counters.USER_COLUMNS[name])
+        return db.scalar(select(column).where(models.User.id == user_id)) or 0
+    
+    @staticmethod
+    def get_totals(db: Session) -> dict:
+        # Общие счетчики по всем пользователям
+        totals = {name: 0 for name in counters.USER_COLUMNS}
+        totals.update(db.execute(select(models.Counter.name, models.Counter.value)).tuples().all())
+        return totals
+    
+    @staticmethod
+    def reconcile(db: Session) -> dict:
+        # Пересчитать все счетчики по самим таблицам (полный проход - для обслуживания,
+        # а не для запросов). Возвращает общие итоги
+        note_counts = dict(db.execute(
+            select(models.Note.user_id, func.count())
+            .where(models.Note.deleted_at.is_(None))
+            .group_by(models.Note.user_id)
+        ).tuples().all())
+        bookings = BookingCRUD.with_archive("user_id")
+        booking_counts = dict(db.execute(
+            select(bookings.c.user_id, func.count()).group_by(bookings.c.user_id)
+        ).tuples().all())
+        
+        rows = [
+            {
+                "id": user_id,
+                "note_count": note_counts.get(user_id, 0),
+                "booking_count": booking_counts.get(user_id, 0),
+            }
+            for user_id in db.scalars(select(models.User.id))
+        ]
+        if rows:
+            db.execute(update(models.User), rows)
+        
+        totals = {"notes": sum(note_counts.values()), "bookings": sum(booking_counts.values())}
+        db.execute(delete(models.Counter).where(models.Counter.name.in_(list(totals))))
+        db.execute(insert(models.Counter), [{"name": name, "value": value} for name, value in totals.items()])
+        # Изменения, накопленные в сессии до сверки, уже учтены пересчетом
+        db.info.pop("counter_deltas", None)
+        db.commit()
+        return totals
+
+
 # Создание экземпляров CRUD классов
 user_crud = UserCRUD()
 mentor_crud = MentorCRUD()
 note_crud = NoteCRUD()
 booking_crud = BookingCRUD()
-refresh_token_crud = RefreshTokenCRUD()
\ No newline at end of file
+waitlist_crud = WaitlistCRUD()
+refresh_token_crud = RefreshTokenCRUD()
+idempotency_crud = IdempotencyCRUD()
+archive_crud = ArchiveCRUD()
+job_run_crud = JobRunCRUD()
+counter_crud = CounterCRUD()
\ No newline at end of file
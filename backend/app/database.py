@@ -1,34 +1,118 @@
-from pathlib import Path
-from typing import Generator
-from fastapi import logger
-from sqlalchemy import create_engine, inspect
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import itertools
 import os
+from typing import Generator, Iterator, List, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
 from config import settings
 
 
-os.makedirs("data", exist_ok=True)
-
 # Подключение к SQLite базе данных
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-# Создание движка базы данных
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    echo=True  # Логирование SQL запросов
-)
+# Движок создается лениво при первом обращении (см. get_engine)
+_engine: Optional[Engine] = None
+
+# Движки реплик только для чтения (DATABASE_REPLICA_URLS), выбираются по кругу
+_read_engines: List[Engine] = []
+_read_engine_cycle: Optional[Iterator[Engine]] = None
+
+
+def _create_engine(url: str, read_only: bool = False) -> Engine:
+    # Создание движка базы данных
+    connect_args = {}
+    db_url = make_url(url)
+    if db_url.get_backend_name() == "sqlite":
+        connect_args["check_same_thread"] = False
+        # Каталог для файла SQLite создаем только при реальном подключении
+        if db_url.database and db_url.database != ":memory:":
+            os.makedirs(os.path.dirname(db_url.database) or ".", exist_ok=True)
+
+    # SQL запросы логируются через логгер sqlalchemy.engine (LOG_LEVELS), а не echo
+    engine = create_engine(url, connect_args=connect_args)
+    
+    if settings.SQL_PROFILER_ENABLED:
+        from profiler import query_profiler
+        query_profiler.install(engine)
+    
+    if db_url.get_backend_name() == "sqlite":
+        # WAL позволяет нескольким воркерам читать во время записи
+        @event.listens_for(engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            if read_only:
+                # Соединение только для чтения к тому же файлу: в режиме WAL
+                # читатели не блокируются записью основного движка
+                cursor.execute("PRAGMA query_only=ON")
+            else:
+                cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA busy_timeout=5000")
+            cursor.close()
+    
+    return engine
+
+
+def get_engine() -> Engine:
+    # Получить движок, создав его при первом вызове
+    global _engine
+    if _engine is None:
+        _engine = _create_engine(SQLALCHEMY_DATABASE_URL)
+        _session_factory.configure(bind=_engine)
+    return _engine
+
 
+def get_read_engines() -> List[Engine]:
+    # Движки реплик для чтения; пустой список - все запросы идут в основную БД
+    global _read_engine_cycle
+    if _read_engine_cycle is None and settings.DATABASE_REPLICA_URLS:
+        _read_engines.extend(
+            _create_engine(url, read_only=True) for url in settings.DATABASE_REPLICA_URLS
+        )
+        _read_engine_cycle = itertools.cycle(_read_engines)
+    return _read_engines
 
-# Создание фабрики сессий
-SessionLocal = sessionmaker(
+
+def dispose_engine() -> None:
+    # Закрыть соединения движков (при остановке приложения)
+    global _engine, _read_engine_cycle
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+    for read_engine in _read_engines:
+        read_engine.dispose()
+    _read_engines.clear()
+    _read_engine_cycle = None
+
+
+def __getattr__(name: str):
+    # Обратная совместимость: database.engine создает движок по требованию
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Фабрика сессий (привязывается к движку в get_engine)
+_session_factory = sessionmaker(
     autocommit=False,
     autoflush=False,
-    bind=engine,
     expire_on_commit=False
 )
 
 
+def SessionLocal() -> Session:
+    # Создать сессию, при необходимости инициализировав движок
+    if _engine is None:
+        get_engine()
+    return _session_factory()
+
+
+def ReadSessionLocal() -> Session:
+    # Сессия для чтения: следующая реплика по кругу или основная БД, если реплик нет
+    if not get_read_engines():
+        return SessionLocal()
+    return _session_factory(bind=next(_read_engine_cycle))
+
+
 # Базовый класс для моделей
 class Base(DeclarativeBase):
     pass
@@ -42,25 +126,3 @@ def get_db() -> Generator:
     finally:
         db.close()
 
-
-# Проверить, инициализирована ли база данных
-def check_database_initialized() -> bool:
-    inspector = inspect(engine)
-    required_tables = ["users", "mentors", "notes", "bookings", "refresh_tokens"]
-    existing_tables = inspector.get_table_names()
-    
-    # Проверяем наличие всех требуемых таблиц
-    for table in required_tables:
-        if table not in existing_tables:
-            return False
-    return True
-
-
-# Безопасно инициализировать базу данных
-def initialize_database():
-    if not check_database_initialized():
-        logger.info("Инициализация базы данных...")
-        Base.metadata.create_all(bind=engine)
-        logger.info("База данных инициализирована")
-        return True
-    return False
\ No newline at end of file
@@ -0,0 +1,107 @@
+import asyncio
+import json
+from collections import defaultdict
+from typing import Dict, Optional, Set
+from sqlalchemy.orm import Session
+from config import settings
+from invalidation import bus
+from metrics import metrics
+
+# Тема шины, через которую события доходят до воркера с SSE соединением
+EVENTS_TOPIC = "events"
+
+
+class Subscription:
+    # Подписка одного SSE соединения с ограниченной очередью
+
+    def __init__(self, user_id: int, queue_size: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # Клиент не успевал читать и потерял события - ему нужно перечитать данные
+        self.overflowed = False
+
+
+class EventHub:
+    # Pub/sub в памяти процесса: события пользователя -> его SSE соединения
+
+    def __init__(self, queue_size: int = 100, max_connections_per_user: int = 5):
+        self.queue_size = queue_size
+        self.max_connections_per_user = max_connections_per_user
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Запомнить event loop воркера (публикация возможна из других потоков)
+        self._loop = loop
+
+    def has_capacity(self, user_id: int) -> bool:
+        # Можно ли открыть пользователю еще одно соединение
+        return len(self._subscribers.get(user_id, ())) < self.max_connections_per_user
+
+    def subscribe(self, user_id: int) -> Optional[Subscription]:
+        # Создать подписку; None - превышен лимит соединений пользователя
+        if not self.has_capacity(user_id):
+            return None
+        subscription = Subscription(user_id, self.queue_size)
+        self._subscribers[user_id].add(subscription)
+        metrics.incr("events.connections")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+        metrics.incr("events.connections", -1)
+
+    def publish(self, user_id: int, event: dict) -> None:
+        # Отправить событие всем соединениям пользователя (потокобезопасно)
+        if user_id not in self._subscribers or self._loop is None:
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._deliver(user_id, event)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, user_id, event)
+
+    def _deliver(self, user_id: int, event: dict) -> None:
+        for subscription in list(self._subscribers.get(user_id, ())):
+            if subscription.queue.full():
+                # Медленный клиент: отбрасываем самое старое событие
+                subscription.queue.get_nowait()
+                subscription.overflowed = True
+                metrics.incr("events.dropped")
+            subscription.queue.put_nowait(event)
+            metrics.incr("events.delivered")
+
+
+def format_sse(event: dict) -> str:
+    # Сериализация события в формат text/event-stream
+    data = json.dumps(event["data"], ensure_ascii=False, default=str)
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+def publish_event(db: Session, user_id: int, event_type: str, data: dict) -> None:
+    # Опубликовать событие пользователю после коммита текущей транзакции.
+    # Событие идет через шину инвалидации, поэтому доходит до любого воркера.
+    payload = json.dumps({"user_id": user_id, "type": event_type, "data": data}, default=str)
+    bus.publish(db, EVENTS_TOPIC, payload)
+
+
+def _on_bus_event(key: Optional[str]) -> None:
+    if key is None:
+        return
+    payload = json.loads(key)
+    hub.publish(payload["user_id"], {"type": payload["type"], "data": payload["data"]})
+
+
+hub = EventHub(
+    queue_size=settings.EVENTS_QUEUE_SIZE,
+    max_connections_per_user=settings.EVENTS_MAX_CONNECTIONS_PER_USER,
+)
+bus.subscribe(EVENTS_TOPIC, _on_bus_event)
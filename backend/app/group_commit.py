@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from config import settings
+from database import SessionLocal
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Операция записи: изменяет сессию писателя без flush и коммита. Возвращенные
+# ORM объекты отдаются запросу после коммита пачки уже загруженными
+# (expire_on_commit=False, серверные значения приходят через RETURNING)
+WriteOp = Callable[[Session], Any]
+
+# Элемент очереди: операция, пользователь (для read-your-writes) и future запроса
+_Item = Tuple[WriteOp, Optional[int], Future]
+
+
+class GroupCommitWriter:
+    # Групповой коммит: мелкие записи конкурентных запросов выполняет один поток
+    # и фиксирует их одной транзакцией (в SQLite - один fsync на пачку).
+    # Future запроса разрешается только после коммита пачки с его операцией,
+    # поэтому ответ по-прежнему означает, что запись сохранена
+
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[_Item]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        # Запустить поток писателя
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        # Дописать уже поставленные операции и остановить поток
+        if not self.running:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, op: WriteOp, user_id: Optional[int] = None) -> Future:
+        # Поставить операцию в очередь; результат - в возвращаемом future
+        future: Future = Future()
+        self._queue.put((op, user_id, future))
+        return future
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                try:
+                    self._commit(batch)
+                except Exception as error:
+                    logger.exception("Ошибка группового коммита")
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(error)
+
+    def _collect(self) -> Tuple[List[_Item], bool]:
+        # Первую операцию ждем без ограничения, следующие - до конца окна
+        # или до заполнения пачки. Второй элемент - получен сигнал остановки
+        first = self._queue.get()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _commit(self, batch: List[_Item]) -> None:
+        # Выполнить пачку одной транзакцией (отмененные запросы пропускаются)
+        pending = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        while pending:
+            failed = self._execute(pending)
+            if failed is None:
+                return
+            # Ошибка операции откатывает транзакцию: эта операция получает исключение,
+            # остальные выполняются заново без нее (SAVEPOINT не используется:
+            # pysqlite фиксирует внешний SAVEPOINT как целую транзакцию)
+            del pending[failed]
+            metrics.incr("group_commit.retries")
+
+    def _execute(self, pending: List[_Item]) -> Optional[int]:
+        # Одна попытка пачки; возвращает индекс упавшей операции или None
+        db = SessionLocal()
+        try:
+            results = []
+            for index, (op, user_id, future) in enumerate(pending):
+                try:
+                    results.append(op(db))
+                except Exception as error:
+                    db.rollback()
+                    future.set_exception(error)
+                    return index
+                if user_id is not None:
+                    db.info.setdefault("user_ids", set()).add(user_id)
+
+            try:
+                # Один flush на пачку: вставки уходят многострочным INSERT ... RETURNING
+                db.commit()
+            except Exception as error:
+                db.rollback()
+                if len(pending) == 1:
+                    pending[0][2].set_exception(error)
+                    return None
+                # Ошибку flush нельзя отнести к операции - выполняем их по одной
+                metrics.incr("group_commit.splits")
+                for item in pending:
+                    self._execute([item])
+                return None
+        finally:
+            db.close()
+
+        metrics.incr("group_commit.batches")
+        metrics.incr("group_commit.writes", len(pending))
+        for (_, _, future), result in zip(pending, results):
+            future.set_result(result)
+        return None
+
+
+group_writer = GroupCommitWriter(
+    window_ms=settings.GROUP_COMMIT_WINDOW_MS,
+    max_batch=settings.GROUP_COMMIT_MAX_BATCH,
+)
+
+
+async def execute(db: Session, op: WriteOp, user_id: Optional[int] = None) -> Any:
+    # Выполнить операцию записи: через групповой коммит, если писатель запущен,
+    # иначе в сессии запроса с отдельным коммитом
+    if group_writer.running:
+        return await asyncio.wrap_future(group_writer.submit(op, user_id))
+    result = op(db)
+    db.commit()
+    return result
@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+from cache import create_cache
+from config import settings
+from metrics import metrics
+import crud
+
+logger = logging.getLogger(__name__)
+
+
+# Записать ответ в транзакции обработчика: save(session, result) до ее коммита
+SaveResponse = Callable[[Session, Any], None]
+
+
+class LeaseLost(HTTPException):
+    # Аренда ключа истекла и ключ занял повторный запрос: работа этого запроса
+    # откатывается, иначе обработчик выполнился бы дважды
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Запрос с этим ключом идемпотентности выполняется повторно"
+        )
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    # Ответ, сохраненный для повторной отдачи
+    request_hash: str
+    status_code: int
+    body: str
+
+
+# Последние ответы держим в памяти, остальные читаем из таблицы idempotency_keys
+_memory = create_cache(
+    "idempotency",
+    max_size=settings.IDEMPOTENCY_CACHE_SIZE,
+    ttl=settings.IDEMPOTENCY_TTL_HOURS * 3600,
+)
+
+# Выполняющиеся в этом процессе запросы: повторы с тем же ключом ждут результата первого
+_in_flight: Dict[Tuple[int, str], asyncio.Future] = {}
+
+
+def request_fingerprint(scope: str, payload: Any) -> str:
+    # Хеш запроса: один ключ нельзя использовать для разных запросов
+    raw = json.dumps([scope, jsonable_encoder(payload)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _adapter(response_model: Any) -> TypeAdapter:
+    return TypeAdapter(response_model)
+
+
+def _serialize(result: Any, response_model: Any) -> str:
+    # Тело ответа в том же виде, в каком его отдает FastAPI для response_model
+    if response_model is None:
+        return json.dumps(jsonable_encoder(result), ensure_ascii=False)
+    adapter = _adapter(response_model)
+    return adapter.dump_json(adapter.validate_python(result, from_attributes=True)).decode()
+
+
+def _replay(stored: StoredResponse, request_hash: str) -> Response:
+    if stored.request_hash != request_hash:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Ключ идемпотентности уже использован для другого запроса"
+        )
+    metrics.incr("idempotency.replayed")
+    return Response(
+        content=stored.body,
+        status_code=stored.status_code,
+        media_type="application/json",
+        headers={"Idempotency-Replayed": "true"},
+    )
+
+
+def _load(db: Session, user_id: int, key: str) -> Optional[StoredResponse]:
+    # Найти сохраненный ответ в памяти или в таблице (занятый ключ без ответа - None)
+    stored = _memory.get((user_id, key))
+    if stored is not None:
+        return stored
+
+    record = crud.idempotency_crud.get_key(db, user_id, key)
+    if record is None or record.status_code == crud.IDEMPOTENCY_PENDING:
+        return None
+    stored = StoredResponse(record.request_hash, record.status_code, record.response_body)
+    _memory.set((user_id, key), stored)
+    return stored
+
+
+async def execute(
+    db: Session,
+    key: Optional[str],
+    user_id: int,
+    scope: str,
+    payload: Any,
+    handler: Callable[[SaveResponse], Awaitable[Any]],
+    response_model: Any = None,
+) -> Any:
+    # Выполнить обработчик не более одного раза для пары (пользователь, ключ).
+    # Внутри процесса повторы ждут future первого запроса; между процессами
+    # ключ занимается строкой idempotency_keys до вызова обработчика.
+    # Обработчик получает save и вызывает save(session, result) перед коммитом
+    # своей записи: ответ сохраняется той же транзакцией, что и сама запись
+    if key is None:
+        return await handler(_skip_save)
+
+    if not key or len(key) > 255:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Неверный ключ идемпотентности"
+        )
+
+    request_hash = request_fingerprint(scope, payload)
+    flight_key = (user_id, key)
+
+    while True:
+        stored = _load(db, user_id, key)
+        if stored is not None:
+            return _replay(stored, request_hash)
+
+        in_flight = _in_flight.get(flight_key)
+        if in_flight is not None:
+            # Такой же запрос уже выполняется в этом процессе - ждем его ответ
+            metrics.incr("idempotency.coalesced")
+            stored = await asyncio.shield(in_flight)
+        else:
+            token = crud.idempotency_crud.claim_key(
+                db, user_id, key, request_hash, timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS)
+            )
+            if token is not None:
+                return await _run(db, user_id, key, token, request_hash, handler, response_model)
+            # Ключ занят запросом в другом процессе
+            metrics.incr("idempotency.waited")
+            stored = await _wait_for_response(db, user_id, key, request_hash)
+
+        if stored is not None:
+            return _replay(stored, request_hash)
+        # Первый запрос завершился ошибкой сервера - выполняем заново
+
+
+def _skip_save(session: Session, result: Any) -> None:
+    # Запрос без ключа: сохранять нечего
+    pass
+
+
+class _ResponseSaver:
+    # save для обработчика: ответ пишется в занятую строку в его транзакции
+
+    def __init__(self, user_id: int, key: str, token: str, request_hash: str, response_model: Any):
+        self.user_id = user_id
+        self.key = key
+        self.token = token
+        self.request_hash = request_hash
+        self.response_model = response_model
+        self.stored: Optional[StoredResponse] = None
+
+    def __call__(self, session: Session, result: Any) -> None:
+        # flush - серверные значения (id, created_at) нужны в теле ответа
+        session.flush()
+        body = _serialize(result, self.response_model)
+        if not crud.idempotency_crud.save_key(
+            session, self.user_id, self.key, self.token, status.HTTP_200_OK, body,
+            timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS), commit=False
+        ):
+            metrics.incr("idempotency.lease_lost")
+            raise LeaseLost()
+        self.stored = StoredResponse(self.request_hash, status.HTTP_200_OK, body)
+
+
+async def _run(
+    db: Session,
+    user_id: int,
+    key: str,
+    token: str,
+    request_hash: str,
+    handler: Callable[[SaveResponse], Awaitable[Any]],
+    response_model: Any,
+) -> Any:
+    # Выполнить обработчик по занятому ключу и сохранить ответ
+    flight_key = (user_id, key)
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[flight_key] = future
+    saver = _ResponseSaver(user_id, key, token, request_hash, response_model)
+    stored = None
+    try:
+        try:
+            result = await handler(saver)
+        except LeaseLost:
+            # Ключ принадлежит другому запросу: ничего не сохраняем и не освобождаем
+            raise
+        except HTTPException as e:
+            # Ошибки клиента детерминированы и тоже сохраняются; 5xx можно повторить
+            if e.status_code < 500:
+                stored = StoredResponse(
+                    request_hash, e.status_code, json.dumps({"detail": e.detail}, ensure_ascii=False)
+                )
+                # Незавершенная транзакция обработчика не должна мешать записи ответа
+                db.rollback()
+                _save(db, user_id, key, token, stored)
+            raise
+
+        if saver.stored is None:
+            # Обработчик не вызвал save - сохраняем ответ отдельной транзакцией
+            stored = StoredResponse(request_hash, status.HTTP_200_OK, _serialize(result, response_model))
+            _save(db, user_id, key, token, stored)
+        else:
+            stored = saver.stored
+            _memory.set((user_id, key), stored)
+        return result
+    finally:
+        _in_flight.pop(flight_key, None)
+        if stored is None:
+            db.rollback()
+            crud.idempotency_crud.release_key(db, user_id, key, token)
+        if not future.done():
+            future.set_result(stored)
+
+
+async def _wait_for_response(
+    db: Session, user_id: int, key: str, request_hash: str
+) -> Optional[StoredResponse]:
+    # Дождаться ответа запроса, занявшего ключ в другом процессе.
+    # None - ключ освобожден без ответа; по истечении IDEMPOTENCY_WAIT_SECONDS - 409
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.05
+    while loop.time() < deadline:
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+        # Каждая проверка - новая транзакция, чтобы увидеть чужой коммит
+        db.rollback()
+        record = crud.idempotency_crud.get_key(db, user_id, key)
+        if record is None:
+            return None
+        if record.request_hash != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Ключ идемпотентности уже использован для другого запроса"
+            )
+        if record.status_code != crud.IDEMPOTENCY_PENDING:
+            stored = StoredResponse(record.request_hash, record.status_code, record.response_body)
+            _memory.set((user_id, key), stored)
+            return stored
+
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Запрос с этим ключом идемпотентности еще выполняется"
+    )
+
+
+def _save(db: Session, user_id: int, key: str, token: str, stored: StoredResponse) -> None:
+    # Сохранить ответ отдельной транзакцией в занятую строку таблицы и в память
+    if not crud.idempotency_crud.save_key(
+        db, user_id, key, token, stored.status_code, stored.body,
+        timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+    ):
+        logger.warning(f"Ответ по ключу идемпотентности не сохранен: аренда ключа истекла (user {user_id})")
+        return
+    _memory.set((user_id, key), stored)
@@ -1,68 +1,70 @@
 import os
 from pathlib import Path
+import argparse
 from sqlalchemy import inspect
 from sqlalchemy.orm import Session
-from database import Base, SessionLocal, engine 
+from database import Base, SessionLocal, SQLALCHEMY_DATABASE_URL, get_engine
 import models_db as models
+import crud
+import migrations
 import logging
+import logs
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-os.makedirs("data", exist_ok=True)
-logger.info(f"Текущая директория: {os.getcwd()}")
-logger.info(f"Путь к БД: ./data/yogavibe.db")
 
 # Проверяем, существуют ли основные таблицы
 def check_tables_exist() -> bool:
-    inspector = inspect(engine)
+    inspector = inspect(get_engine())
     existing_tables = inspector.get_table_names()
     
-    # Ключевые таблицы, которые должны быть
-    required_tables = ["users", "mentors", "notes", "bookings", "refresh_tokens"]
+    # Все таблицы, описанные в моделях
+    required_tables = list(Base.metadata.tables)
     
-    # Проверяем наличие всех ключевых таблиц
+    # Проверяем наличие всех таблиц
     return all(table in existing_tables for table in required_tables)
 
 
-# Создать таблицы только если их нет
+# Создать недостающие таблицы и обновить схему существующих (migrations.py)
 def create_tables_if_not_exist():
     if not check_tables_exist():
         logger.info("Создание таблиц базы данных...")
-        Base.metadata.create_all(bind=engine)
+        migrations.upgrade_database()
         
-        inspector = inspect(engine)
+        inspector = inspect(get_engine())
         created_tables = inspector.get_table_names()
         logger.info(f"Создано таблиц: {len(created_tables)}")
         logger.info(f"Таблицы: {', '.join(created_tables)}")
         return True
     else:
         logger.info("Таблицы уже существуют")
+        migrations.upgrade_database()
         return False
 
 
 # Получить статистику базы данных
 def get_database_stats():
+    # Число таблиц и итоги по счетчикам (без COUNT(*) по большим таблицам)
     db = SessionLocal()
     try:
-        inspector = inspect(engine)
-        tables = inspector.get_table_names()
-        
-        stats = {"tables": len(tables)}
-        
-        # Подсчитываем записи в каждой таблице
-        for table in tables:
-            try:
-                count = db.execute(f"SELECT COUNT(*) FROM {table}").scalar()
-                stats[table] = count
-            except:
-                stats[table] = "error"
-        
+        stats = {"tables": len(inspect(get_engine()).get_table_names())}
+        stats.update(crud.counter_crud.get_totals(db))
         return stats
     finally:
         db.close()
 
 
+def reconcile_counters():
+    # Пересчитать счетчики заметок и бронирований по таблицам
+    db = SessionLocal()
+    try:
+        totals = crud.counter_crud.reconcile(db)
+        logger.info(f"Счетчики пересчитаны: {totals}")
+        return totals
+    finally:
+        db.close()
+
+
 # Создание моковых данных менторов
 def create_mock_mentors(db: Session):
     mock_mentors = [
@@ -230,6 +232,8 @@ def create_mock_mentors(db: Session):
 
 
 def init_db():
+    logger.info(f"Текущая директория: {os.getcwd()}")
+    logger.info(f"Путь к БД: {SQLALCHEMY_DATABASE_URL}")
     logger.info("Проверка базы данных...")
     
     # Создаем таблицы если их нет
@@ -256,4 +260,15 @@ def init_db():
 
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Инициализация и обслуживание базы данных")
+    parser.add_argument(
+        "--reconcile-counters",
+        action="store_true",
+        help="пересчитать счетчики заметок и бронирований по таблицам"
+    )
+    args = parser.parse_args()
+    
+    logs.configure_logging()
+    init_db()
+    if args.reconcile_counters:
+        reconcile_counters()
\ No newline at end of file
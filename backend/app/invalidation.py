@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import event, select, delete, func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+import models_db as models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Обработчик инвалидации получает ключ (или None - сбросить все по теме)
+Handler = Callable[[Optional[str]], None]
+
+
+class InvalidationBus:
+    # Шина инвалидации кешей между воркерами.
+    # publish() добавляет запись в журнал в той же транзакции, что и изменение данных;
+    # локальные обработчики вызываются после коммита, остальные воркеры
+    # получают событие, опрашивая журнал по возрастанию id.
+
+    def __init__(self):
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        # Темы, события которых воркер при старте перечитывает из журнала
+        self._replay: Dict[str, timedelta] = {}
+        self._last_id = 0
+
+    def subscribe(self, topic: str, handler: Handler, replay: Optional[timedelta] = None) -> None:
+        # Подписать обработчик на тему; replay - за какой период применить
+        # уже записанные события при старте воркера
+        self._handlers[topic].append(handler)
+        if replay is not None:
+            self._replay[topic] = max(replay, self._replay.get(topic, replay))
+
+    @property
+    def min_retention(self) -> timedelta:
+        # Журнал нельзя чистить раньше, чем истечет самый длинный период replay
+        return max(self._replay.values(), default=timedelta(0))
+
+    def publish(self, db: Session, topic: str, key=None) -> None:
+        # Зарегистрировать инвалидацию в текущей транзакции (без коммита)
+        key = None if key is None else str(key)
+        db.add(models.CacheInvalidation(topic=topic, key=key, origin=self.origin))
+        db.info.setdefault("pending_invalidations", []).append((topic, key))
+
+    def dispatch(self, topic: str, key: Optional[str]) -> None:
+        # Вызвать локальные обработчики темы
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(key)
+            except Exception:
+                logger.exception(f"Ошибка обработчика инвалидации {topic}")
+
+    def start_from_latest(self, db: Session) -> None:
+        # Начать чтение журнала с текущего конца (старые события уже неактуальны),
+        # кроме тем с replay - их свежие события применяются сразу
+        self._last_id = db.scalar(select(func.max(models.CacheInvalidation.id))) or 0
+        
+        now = datetime.now(timezone.utc)
+        for topic, window in self._replay.items():
+            stmt = select(models.CacheInvalidation.key).where(
+                models.CacheInvalidation.topic == topic,
+                models.CacheInvalidation.created_at >= now - window,
+                models.CacheInvalidation.id <= self._last_id
+            ).order_by(models.CacheInvalidation.id)
+            for key in db.scalars(stmt):
+                self.dispatch(topic, key)
+
+    def poll(self, db: Session) -> int:
+        # Применить события других воркеров, появившиеся с прошлого опроса
+        stmt = select(
+            models.CacheInvalidation.id,
+            models.CacheInvalidation.topic,
+            models.CacheInvalidation.key,
+            models.CacheInvalidation.origin,
+        ).where(models.CacheInvalidation.id > self._last_id).order_by(models.CacheInvalidation.id)
+
+        applied = 0
+        for event_id, topic, key, origin in db.execute(stmt):
+            self._last_id = event_id
+            if origin != self.origin:
+                self.dispatch(topic, key)
+                applied += 1
+        return applied
+
+    @staticmethod
+    def prune(db: Session, retention: timedelta) -> int:
+        # Удалить старые записи журнала
+        cutoff = datetime.now(timezone.utc) - retention
+        result = db.execute(
+            delete(models.CacheInvalidation).where(models.CacheInvalidation.created_at < cutoff)
+        )
+        db.commit()
+        return result.rowcount
+
+
+bus = InvalidationBus()
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_after_commit(session: Session) -> None:
+    # Локальные кеши сбрасываются сразу после фиксации изменений
+    for topic, key in session.info.pop("pending_invalidations", ()):
+        bus.dispatch(topic, key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop("pending_invalidations", None)
+
+
+def _with_session(job: Callable[[Session], object]) -> object:
+    db = SessionLocal()
+    try:
+        return job(db)
+    finally:
+        db.close()
+
+
+async def run_poller(interval: float, retention: timedelta, prune_every: int = 600) -> None:
+    # Фоновый опрос журнала инвалидаций
+    retention = max(retention, bus.min_retention)
+    await run_in_threadpool(_with_session, bus.start_from_latest)
+    iteration = 0
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(_with_session, bus.poll)
+            iteration += 1
+            if iteration % prune_every == 0:
+                await run_in_threadpool(_with_session, lambda db: bus.prune(db, retention))
+        except Exception:
+            logger.exception("Ошибка опроса журнала инвалидаций")
@@ -0,0 +1,174 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO, Tuple
+from config import settings
+from metrics import metrics
+
+# Логирование процесса. Поток запроса только кладет запись в очередь,
+# форматирует и пишет ее фоновый поток (QueueListener): медленный stderr
+# или диск не задерживают ответы. Вывод - JSON по строке на запись
+# (LOG_FORMAT="json") или текст; уровни - LOG_LEVEL и LOG_LEVELS.
+#
+# Выборка по запросам: решение принимается один раз на запрос (LOG_SAMPLE_RATE),
+# у не попавших в выборку запросов пишутся только предупреждения и ошибки,
+# так что журнал попавшего запроса всегда полный.
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+# Допустимый id запроса из заголовка X-Request-ID
+REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Контекст текущего запроса: (id, попал ли в выборку)
+_request: contextvars.ContextVar[Optional[Tuple[str, bool]]] = contextvars.ContextVar(
+    "log_request", default=None
+)
+
+# Стандартные атрибуты LogRecord; остальные (extra=...) попадают в JSON как поля
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "request_id", "asctime",
+}
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["_NonBlockingQueueHandler"] = None
+_output: Optional[logging.Handler] = None
+
+
+def begin_request(request_id: Optional[str] = None) -> Tuple[str, contextvars.Token]:
+    # Открыть контекст запроса; id из заголовка принимается, если он допустим
+    if not request_id or not REQUEST_ID.match(request_id):
+        request_id = uuid.uuid4().hex
+    rate = settings.LOG_SAMPLE_RATE
+    sampled = rate >= 1 or (rate > 0 and random.random() < rate)
+    return request_id, _request.set((request_id, sampled))
+
+
+def end_request(token: contextvars.Token) -> None:
+    _request.reset(token)
+
+
+def request_sampled() -> bool:
+    # Пишутся ли информационные записи текущего запроса (вне запроса - да)
+    context = _request.get()
+    return context is None or context[1]
+
+
+class RequestContextFilter(logging.Filter):
+    # Выполняется в потоке запроса: отбрасывает записи не попавших в выборку
+    # запросов и проставляет id запроса (в потоке вывода контекста уже нет)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _request.get()
+        if context is None:
+            return True
+        request_id, sampled = context
+        if not sampled and record.levelno < logging.WARNING:
+            return False
+        record.request_id = request_id
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    # Одна запись - одна строка JSON
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    # Очередь ограничена: если поток вывода не успевает, записи отбрасываются
+    # (считаются в метрике logs.dropped), а не копятся в памяти
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение собирается сразу (аргументы могут измениться до вывода),
+        # трассировка - отдельно от сообщения, чтобы JSON хранил ее своим полем
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("logs.dropped")
+
+
+def _create_formatter(log_format: str) -> logging.Formatter:
+    if log_format == "json":
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT, defaults={"request_id": "-"})
+
+
+def configure_logging(stream: Optional[TextIO] = None) -> None:
+    # Настроить логирование процесса (повторный вызов ничего не делает)
+    global _listener, _queue_handler, _output
+    if _listener is not None:
+        return
+
+    _output = logging.StreamHandler(stream or sys.stderr)
+    _output.setFormatter(_create_formatter(settings.LOG_FORMAT))
+    _queue_handler = _NonBlockingQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(settings.LOG_LEVEL)
+
+    # Логгеры uvicorn пишут через тот же конвейер и в том же формате
+    for name in ("uvicorn", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    for name, level in settings.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(_queue_handler.queue, _output)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    # Дописать очередь и остановить поток вывода; дальнейшие записи
+    # выводятся напрямую
+    global _listener, _queue_handler, _output
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(_queue_handler)
+    _listener.stop()
+    _output.filters.extend(_queue_handler.filters)
+    root.addHandler(_output)
+    _listener = _queue_handler = _output = None
@@ -1,6 +1,46 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from api import router as api_router
+from api import router as api_router, require_admin
+from config import settings
+from rate_limit import RateLimitMiddleware, InMemoryRateLimitStore
+from middleware import CompressionMiddleware, CacheControlMiddleware, ProfilingMiddleware, RequestLoggingMiddleware
+from metrics import metrics
+from tokens import get_token_service
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import database
+import logs
+import migrations
+import tasks
+import utils
+import profiler
+from events import hub
+from group_commit import group_writer
+from media import media_store
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Тяжелая инициализация выполняется при старте воркера, а не при импорте:
+    # логирование (поток вывода очереди), создание движка, обновление схемы
+    # (migrations.py) и фоновые задачи. К этому моменту uvicorn уже применил
+    # свою конфигурацию логов, configure_logging ее перенастраивает
+    logs.configure_logging()
+    await run_in_threadpool(migrations.upgrade_database)
+    # Контекст хеширования (и калибровка стоимости) готовится до первого входа
+    await run_in_threadpool(utils.get_pwd_context)
+    hub.bind_loop(asyncio.get_running_loop())
+    tasks.start()
+    if settings.GROUP_COMMIT_ENABLED:
+        group_writer.start()
+    yield
+    await tasks.stop()
+    await run_in_threadpool(group_writer.stop)
+    media_store.close()
+    database.dispose_engine()
+    logs.shutdown_logging()
 
 
 app = FastAPI(
@@ -8,6 +48,34 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
+    lifespan=lifespan,
+)
+
+
+# Профилирование отдельных запросов (внутренний слой - только работа приложения)
+if settings.REQUEST_PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, sample_rate=settings.REQUEST_PROFILING_SAMPLE_RATE)
+
+
+# Ограничение частоты запросов (до CORS, чтобы ответы 429 получали CORS заголовки)
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        limits=settings.RATE_LIMITS,
+        store=InMemoryRateLimitStore(max_keys=settings.RATE_LIMIT_MAX_KEYS),
+    )
+
+
+# Заголовки кеширования по маршрутам
+app.add_middleware(CacheControlMiddleware, policies=settings.CACHE_POLICIES)
+
+
+# Сжатие ответов gzip/brotli
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.GZIP_LEVEL,
+    brotli_quality=settings.BROTLI_QUALITY,
 )
 
 
@@ -18,9 +86,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Итог постраничных списков и id запроса доступны коду фронтенда
+    expose_headers=["X-Total-Count", "X-Request-ID"],
 )
 
 
+# Контекст логирования запроса (внешний слой: время включает все middleware)
+app.add_middleware(RequestLoggingMiddleware, slow_request_ms=settings.LOG_SLOW_REQUEST_MS)
+
+
 # Подключение API роутера
 app.include_router(api_router)
 
@@ -34,4 +108,51 @@ def read_root():
 @app.get("/api/health")
 def health_check():
     # Проверка здоровья приложения
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+
+@app.get("/api/metrics")
+def get_metrics():
+    # Счетчики процесса (сжатие, кеши и т.п.)
+    return metrics.snapshot()
+
+
+@app.get("/.well-known/jwks.json")
+def get_jwks():
+    # Открытые ключи подписи токенов (пусто для HS256)
+    return get_token_service().jwks()
+
+
+# Отладочные эндпоинты профилирования (только при включенных настройках):
+# показывают SQL и стеки запросов, поэтому доступны лишь администраторам (ADMIN_USERNAMES)
+debug_router = APIRouter(prefix="/api/debug", dependencies=[Depends(require_admin)])
+
+if settings.SQL_PROFILER_ENABLED:
+    @debug_router.get("/queries")
+    def get_query_profile(limit: int = settings.SQL_PROFILER_TOP_N, order: str = "total_ms"):
+        # Самые дорогие запросы по отпечаткам (order: total_ms, max_ms, count, rows)
+        if order not in ("total_ms", "max_ms", "count", "rows"):
+            raise HTTPException(status_code=400, detail="Неверный order")
+        return profiler.query_profiler.top(limit, order)
+
+    @debug_router.delete("/queries")
+    def reset_query_profile():
+        profiler.query_profiler.reset()
+        return {"status": "ok"}
+
+
+if settings.REQUEST_PROFILING_ENABLED:
+    @debug_router.get("/profiles")
+    def list_request_profiles():
+        # Последние профили запросов (новые первыми)
+        return [profile.summary() for profile in reversed(profiler.recent_profiles)]
+
+    @debug_router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+    def get_request_profile(profile_id: int):
+        for profile in profiler.recent_profiles:
+            if profile.id == profile_id:
+                return profile.report
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+
+
+app.include_router(debug_router)
@@ -0,0 +1,313 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+from starlette.concurrency import run_in_threadpool
+from config import settings
+from metrics import metrics
+from singleflight import SingleFlight
+import thumbnails
+
+logger = logging.getLogger(__name__)
+
+# Хранилище изображений, адресуемое содержимым: имя файла - sha256 оригинала,
+# поэтому URL неизменяем и кешируется клиентами навсегда.
+#   originals/ab/<sha256>.<ext>       - оригиналы (не вытесняются)
+#   thumbnails/<sha256>_<size>.webp   - миниатюры (LRU в пределах MEDIA_CACHE_MAX_BYTES)
+
+# Поддерживаемые форматы: расширение -> тип содержимого
+CONTENT_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+MEDIA_NAME = re.compile(r"^([0-9a-f]{64})\.(jpg|png|gif|webp)$")
+
+# Байт в начале файла, достаточных для определения формата
+_SIGNATURE_BYTES = 12
+
+
+class MediaTooLarge(ValueError):
+    pass
+
+
+class UnsupportedMedia(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredMedia:
+    digest: str
+    extension: str
+    size: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.digest}.{self.extension}"
+
+    @property
+    def content_type(self) -> str:
+        return CONTENT_TYPES[self.extension]
+
+
+def sniff_image(header: bytes) -> Optional[str]:
+    # Расширение по сигнатуре файла (заявленному Content-Type не доверяем)
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+class ThumbnailCache:
+    # Учет миниатюр на диске в порядке использования; при превышении бюджета
+    # удаляются давно не запрашивавшиеся. Каждый воркер ведет свой учет,
+    # при старте - по времени изменения файлов (обновляется при обращении)
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._scanned = False
+        self._lock = threading.Lock()
+
+    def _scan(self) -> None:
+        # Вызывается под блокировкой перед первым обращением
+        if self._scanned:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".webp"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._entries[path] = size
+            self._total += size
+        self._scanned = True
+
+    def get(self, path: str) -> bool:
+        # Есть ли миниатюра; попадание поднимает ее в начало очереди
+        with self._lock:
+            self._scan()
+            if path not in self._entries:
+                return False
+            self._entries.move_to_end(path)
+        if not os.path.exists(path):
+            # Вытеснена другим воркером
+            self._discard(path)
+            return False
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return True
+
+    def add(self, path: str, size: int) -> None:
+        # Учесть новую миниатюру и вытеснить старые сверх бюджета
+        with self._lock:
+            self._scan()
+            self._total += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                evicted, evicted_size = self._entries.popitem(last=False)
+                self._total -= evicted_size
+                metrics.incr("media.thumbnails.evicted")
+                try:
+                    os.remove(evicted)
+                except FileNotFoundError:
+                    pass
+
+    def _discard(self, path: str) -> None:
+        with self._lock:
+            self._total -= self._entries.pop(path, 0)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+
+class MediaStore:
+    # Сохранение загрузок и выдача миниатюр (уменьшение - в пуле процессов)
+
+    def __init__(
+        self,
+        root: str,
+        max_upload_bytes: int,
+        thumbnail_sizes: List[int],
+        thumbnail_quality: int,
+        cache_max_bytes: int,
+        workers: int,
+        max_image_pixels: int
+    ):
+        self.root = root
+        self.max_upload_bytes = max_upload_bytes
+        self.thumbnail_sizes = thumbnail_sizes
+        self.thumbnail_quality = thumbnail_quality
+        self.workers = workers
+        self.max_image_pixels = max_image_pixels
+        self.cache = ThumbnailCache(os.path.join(root, "thumbnails"), cache_max_bytes)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._renders = SingleFlight("thumbnails")
+
+    @property
+    def thumbnails_available(self) -> bool:
+        return thumbnails.available()
+
+    def original_path(self, digest: str, extension: str) -> str:
+        return os.path.join(self.root, "originals", digest[:2], f"{digest}.{extension}")
+
+    def find_original(self, digest: str) -> Optional[str]:
+        # Оригинал по хешу (расширение в URL миниатюры не передается)
+        for extension in CONTENT_TYPES:
+            path = self.original_path(digest, extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def thumbnail_path(self, digest: str, size: int) -> str:
+        return os.path.join(self.root, "thumbnails", f"{digest}_{size}.webp")
+
+    def ensure_directories(self) -> None:
+        for name in ("originals", "thumbnails", "tmp"):
+            os.makedirs(os.path.join(self.root, name), exist_ok=True)
+
+    async def save(self, chunks: AsyncIterator[bytes]) -> StoredMedia:
+        # Записать поток загрузки во временный файл, считая sha256 по ходу,
+        # и переименовать в файл по хешу (одинаковые загрузки хранятся один раз)
+        await run_in_threadpool(self.ensure_directories)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        digest = hashlib.sha256()
+        size = 0
+        header = b""
+        extension = None
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if size > self.max_upload_bytes:
+                        raise MediaTooLarge(f"Файл больше {self.max_upload_bytes} байт")
+                    if extension is None:
+                        header += chunk[:_SIGNATURE_BYTES]
+                        if len(header) >= _SIGNATURE_BYTES:
+                            extension = sniff_image(header)
+                            if extension is None:
+                                raise UnsupportedMedia("Поддерживаются только JPEG, PNG, GIF и WebP")
+                    digest.update(chunk)
+                    await run_in_threadpool(file.write, chunk)
+            if extension is None:
+                raise UnsupportedMedia("Поддерживаются только JPEG, PNG, GIF и WebP")
+
+            media = StoredMedia(digest.hexdigest(), extension, size)
+            await run_in_threadpool(self._publish, temporary, self.original_path(media.digest, extension))
+            metrics.incr("media.uploads")
+            return media
+        except BaseException:
+            try:
+                os.remove(temporary)
+            except FileNotFoundError:
+                pass
+            raise
+
+    @staticmethod
+    def _publish(temporary: str, target: str) -> None:
+        if os.path.exists(target):
+            os.remove(temporary)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temporary, target)
+
+    async def thumbnail(self, digest: str, size: int) -> Optional[str]:
+        # Путь к миниатюре; None - нет оригинала. Отсутствующая миниатюра строится
+        # в пуле процессов, одновременные запросы одной миниатюры ждут одну сборку
+        target = self.thumbnail_path(digest, size)
+        if self.cache.get(target):
+            metrics.incr("media.thumbnails.hit")
+            return target
+
+        source = self.find_original(digest)
+        if source is None:
+            return None
+
+        async def render() -> str:
+            started = time.perf_counter()
+            job = (thumbnails.render, source, target, size, self.thumbnail_quality, self.max_image_pixels)
+            loop = asyncio.get_running_loop()
+            pool = self._get_pool()
+            try:
+                written = await loop.run_in_executor(pool, *job)
+            except BrokenProcessPool:
+                # Процесс пула умер (например, убит по памяти) - такой пул больше
+                # не принимает задачи: заменяем его новым и повторяем один раз
+                metrics.incr("media.thumbnails.pool_restarted")
+                self._discard_pool(pool)
+                written = await loop.run_in_executor(self._get_pool(), *job)
+            self.cache.add(target, written)
+            metrics.incr("media.thumbnails.rendered")
+            logger.debug(f"Миниатюра {digest}_{size} за {(time.perf_counter() - started) * 1000:.1f} мс")
+            return target
+
+        return await self._renders.do((digest, size), render)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Пул создается при первой миниатюре; spawn - воркер uvicorn многопоточный,
+        # fork из него небезопасен
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor) -> None:
+        # Убрать сломанный пул (если его еще не заменил другой запрос)
+        if self._pool is pool:
+            self._pool = None
+            logger.warning("Пул процессов миниатюр сломан, создается новый")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def urls(self, media: StoredMedia) -> Dict[str, object]:
+        # URL оригинала и миниатюр для ответа API
+        base = "/api/v1/media"
+        return {
+            "url": f"{base}/{media.name}",
+            "thumbnails": {
+                str(size): f"{base}/{media.digest}/{size}.webp" for size in self.thumbnail_sizes
+            } if self.thumbnails_available else {},
+        }
+
+
+media_store = MediaStore(
+    root=settings.MEDIA_ROOT,
+    max_upload_bytes=settings.MEDIA_MAX_UPLOAD_BYTES,
+    thumbnail_sizes=settings.MEDIA_THUMBNAIL_SIZES,
+    thumbnail_quality=settings.MEDIA_THUMBNAIL_QUALITY,
+    cache_max_bytes=settings.MEDIA_CACHE_MAX_BYTES,
+    workers=settings.MEDIA_THUMBNAIL_WORKERS,
+    max_image_pixels=settings.MEDIA_MAX_IMAGE_PIXELS,
+)
@@ -0,0 +1,24 @@
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    # Простые счетчики процесса (запросы, сжатие, кеши и т.п.)
+
+    def __init__(self):
+        self._counters: Dict[str, float] = defaultdict(float)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        # Увеличить счетчик
+        self._counters[name] += value
+
+    def get(self, name: str) -> float:
+        # Текущее значение счетчика
+        return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        # Копия всех счетчиков для отдачи наружу
+        return dict(sorted(self._counters.items()))
+
+
+metrics = Metrics()
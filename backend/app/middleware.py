@@ -0,0 +1,316 @@
+import logging
+import random
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+from metrics import metrics
+import logs
+import profiler
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость
+    brotli = None
+
+logger = logging.getLogger(__name__)
+access_logger = logging.getLogger("yogavibe.access")
+
+# Типы содержимого, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "text/html",
+    "text/plain",
+    "text/css",
+    "application/javascript",
+)
+
+
+def _get_header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    # Получить значение заголовка ASGI (имена в нижнем регистре)
+    for key, value in headers:
+        if key == name:
+            return value
+    return None
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, data: bytes) -> bytes:
+        # Z_SYNC_FLUSH отдает сжатые данные сразу - нужно для потоковых ответов
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    # ASGI middleware сжатия ответов: brotli (если установлен) или gzip.
+    # Маленькие ответы отдаются как есть, потоковые сжимаются по частям.
+
+    def __init__(self, app, minimum_size: int = 500, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._choose_encoding(scope)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+    def _choose_encoding(self, scope) -> Optional[str]:
+        # Выбрать кодировку по заголовку Accept-Encoding
+        accept = _get_header(scope.get("headers", []), b"accept-encoding")
+        if not accept:
+            return None
+        accepted = {part.split(b";")[0].strip() for part in accept.lower().split(b",")}
+        if brotli is not None and b"br" in accepted:
+            return "br"
+        if b"gzip" in accepted:
+            return "gzip"
+        return None
+
+    def create_encoder(self, encoding: str):
+        if encoding == "br":
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.gzip_level)
+
+
+class _CompressionResponder:
+    # Обертка над send для одного ответа
+
+    def __init__(self, middleware: CompressionMiddleware, send, encoding: str):
+        self.middleware = middleware
+        self._send = send
+        self.encoding = encoding
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def send(self, message) -> None:
+        if message["type"] == "http.response.start":
+            # Откладываем заголовки до первого фрагмента тела
+            self.start_message = message
+            headers = message.get("headers", [])
+            content_type = _get_header(headers, b"content-type") or b""
+            self.passthrough = (
+                _get_header(headers, b"content-encoding") is not None
+                or not content_type.decode("latin-1").startswith(COMPRESSIBLE_TYPES)
+            )
+            if self.passthrough:
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                # Слишком маленький ответ - сжатие не окупается
+                self.passthrough = True
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+            await self._start()
+
+        self.bytes_in += len(body)
+        chunk = self.encoder.process(body) if body else b""
+        if not more_body:
+            chunk += self.encoder.finish()
+        self.bytes_out += len(chunk)
+
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        if not more_body:
+            self._record_metrics()
+
+    async def _start(self) -> None:
+        # Отправить заголовки сжатого ответа
+        self.encoder = self.middleware.create_encoder(self.encoding)
+        headers = [
+            (key, value) for key, value in self.start_message.get("headers", [])
+            if key != b"content-length"
+        ]
+        headers.append((b"content-encoding", self.encoding.encode()))
+        vary = _get_header(headers, b"vary")
+        if vary is None:
+            headers.append((b"vary", b"Accept-Encoding"))
+        elif b"accept-encoding" not in vary.lower():
+            headers = [(k, v) for k, v in headers if k != b"vary"]
+            headers.append((b"vary", vary + b", Accept-Encoding"))
+        await self._send({**self.start_message, "headers": headers})
+
+    def _record_metrics(self) -> None:
+        metrics.incr(f"compression.{self.encoding}.responses")
+        metrics.incr("compression.bytes_in", self.bytes_in)
+        metrics.incr("compression.bytes_out", self.bytes_out)
+        metrics.incr("compression.bytes_saved", self.bytes_in - self.bytes_out)
+
+
+class CacheControlMiddleware:
+    # Проставляет Cache-Control по самому длинному совпадающему префиксу пути,
+    # если обработчик не задал заголовок сам
+
+    def __init__(self, app, policies: Dict[str, str]):
+        self.app = app
+        # Сортируем префиксы по убыванию длины для поиска самого точного
+        self.policies = sorted(
+            ((prefix, value.encode()) for prefix, value in policies.items()),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        policy = self._match(scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Публичное кеширование допустимо только для безопасных методов
+        if scope["method"] not in ("GET", "HEAD") and b"public" in policy:
+            policy = b"no-store"
+
+        async def send_with_cache_control(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if _get_header(headers, b"cache-control") is None and message["status"] < 500:
+                    headers.append((b"cache-control", policy))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache_control)
+
+    def _match(self, path: str) -> Optional[bytes]:
+        for prefix, value in self.policies:
+            if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+                return value
+        return None
+
+
+class ProfilingMiddleware:
+    # Профилирование отдельных запросов: по заголовку X-Profile (значение
+    # "pyinstrument" выбирает pyinstrument, если он установлен) или случайной выборкой.
+    # Отчет доступен по /api/debug/profiles/{id}, id - в заголовке ответа X-Profile-Id.
+
+    def __init__(self, app, sample_rate: float = 0.0):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = _get_header(scope["headers"], b"x-profile")
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if (requested is None and not sampled) or not profiler.profiling_lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = profiler.next_profile_id()
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", str(profile_id).encode())
+                ]
+            await send(message)
+
+        sampler = profiler.Sampler(requested.decode("latin-1") if requested else None)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            try:
+                report = sampler.stop()
+            finally:
+                profiler.profiling_lock.release()
+            duration_ms = (time.perf_counter() - started) * 1000
+            profiler.recent_profiles.append(profiler.RequestProfile(
+                profile_id, scope["method"], scope["path"], duration_ms, sampler.engine, report
+            ))
+            metrics.incr("profiler.requests")
+            logger.info(f"Профиль #{profile_id}: {scope['method']} {scope['path']} {duration_ms:.1f} мс")
+
+
+class RequestLoggingMiddleware:
+    # Контекст логирования запроса: id (из X-Request-ID или новый) проставляется
+    # в записи лога и заголовок ответа X-Request-ID, решение о выборке - logs.begin_request.
+    # Строка журнала доступа пишется для попавших в выборку запросов,
+    # для медленных (slow_request_ms) и ответов 5xx - всегда
+
+    def __init__(self, app, slow_request_ms: float = 1000):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = _get_header(scope["headers"], b"x-request-id")
+        request_id, token = logs.begin_request(incoming.decode("latin-1") if incoming else None)
+        status_code = 500
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode())
+                ]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            level = logging.INFO
+            if status_code >= 500 or duration_ms >= self.slow_request_ms:
+                level = logging.WARNING
+            # Проверки до форматирования: у не попавшего в выборку запроса строка не собирается
+            if access_logger.isEnabledFor(level) and (level >= logging.WARNING or logs.request_sampled()):
+                access_logger.log(
+                    level,
+                    f"{scope['method']} {scope['path']} {status_code} {duration_ms:.1f} мс",
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": status_code,
+                        "duration_ms": round(duration_ms, 1),
+                    },
+                )
+            logs.end_request(token)
@@ -0,0 +1,88 @@
+import logging
+from typing import Callable, List, Set, Tuple
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+from database import Base, SessionLocal, get_engine
+import crud
+
+logger = logging.getLogger(__name__)
+
+# Обновление схемы существующей базы. create_all создает только недостающие
+# таблицы, поэтому колонки и индексы, добавленные в модели к уже существующим
+# таблицам, досоздаются здесь (ALTER TABLE ... ADD COLUMN, CREATE INDEX).
+# Новые колонки должны допускать NULL или иметь server_default.
+#
+# Выполняется при старте (serve.py - один раз до запуска воркеров, lifespan -
+# в каждом воркере, где обычно делать уже нечего) и из init_data.py.
+
+# Пересчет значений после изменения схемы непустой базы:
+# (добавленные "таблица.колонка" или созданные "таблица", функция пересчета)
+BACKFILLS: List[Tuple[Set[str], Callable[[Session], object]]] = [
+    (
+        {"mentors.total_bookings", "mentors.upcoming_bookings", "mentors.completed_sessions", "mentors.revenue"},
+        crud.mentor_crud.reconcile_stats,
+    ),
+    (
+        {"users.note_count", "users.booking_count", "counters"},
+        crud.counter_crud.reconcile,
+    ),
+]
+
+
+def _add_column(engine: Engine, table, column) -> bool:
+    # Добавить колонку; False - ее уже добавил другой процесс
+    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+    try:
+        with engine.begin() as connection:
+            connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+    except DBAPIError:
+        if column.name in {c["name"] for c in inspect(engine).get_columns(table.name)}:
+            return False
+        raise
+    return True
+
+
+def upgrade_schema(engine: Engine, existing_tables: Set[str]) -> Set[str]:
+    # Досоздать колонки и индексы существующих таблиц; возвращает "таблица.колонка"
+    inspector = inspect(engine)
+    added = set()
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns and _add_column(engine, table, column):
+                logger.info(f"Добавлена колонка {table.name}.{column.name}")
+                added.add(f"{table.name}.{column.name}")
+
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(engine, checkfirst=True)
+                logger.info(f"Создан индекс {index.name}")
+    return added
+
+
+def upgrade_database() -> Set[str]:
+    # Создать недостающие таблицы, колонки и индексы и пересчитать новые данные.
+    # Возвращает изменения: "таблица" - созданные таблицы, "таблица.колонка" - колонки
+    engine = get_engine()
+    existing_tables = set(inspect(engine).get_table_names())
+    Base.metadata.create_all(bind=engine)
+    changes = upgrade_schema(engine, existing_tables)
+    changes |= set(Base.metadata.tables) - existing_tables
+
+    # Пустой базе пересчитывать нечего
+    if existing_tables & set(Base.metadata.tables):
+        for targets, backfill in BACKFILLS:
+            if changes & targets:
+                db = SessionLocal()
+                try:
+                    logger.info(f"Пересчет после обновления схемы: {backfill.__qualname__}: {backfill(db)}")
+                finally:
+                    db.close()
+    return changes
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, ForeignKey, Boolean, func
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, ForeignKey, Boolean, Index, UniqueConstraint, func
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from datetime import datetime
 from typing import Optional, List
@@ -21,11 +21,16 @@ class User(Base):
     yoga_style: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     experience: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     goals: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    photo_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     
     # СИСТЕМНЫЕ ПОЛЯ 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     
+    # СЧЕТЧИКИ (ведет counters.py в транзакции записи)
+    note_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    booking_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    
     # СВЯЗИ 
     notes: Mapped[List["Note"]] = relationship("Note", back_populates="user", cascade="all, delete-orphan")
     bookings: Mapped[List["Booking"]] = relationship("Booking", back_populates="user", cascade="all, delete-orphan")
@@ -50,6 +55,12 @@ class Mentor(Base):
     photo_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     is_available: Mapped[bool] = mapped_column(Boolean, default=True)
     
+    # АГРЕГАТЫ БРОНИРОВАНИЙ (обновляются при записи, сверяются фоновой задачей)
+    total_bookings: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    upcoming_bookings: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    completed_sessions: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    revenue: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    
     # СИСТЕМНЫЕ ПОЛЯ 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     
@@ -60,6 +71,10 @@ class Mentor(Base):
 class Note(Base):
     # Модель заметки пользователя
     __tablename__ = "notes"
+    __table_args__ = (
+        # Список заметок пользователя по дате создания
+        Index("ix_notes_user_created", "user_id", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     text: Mapped[str] = mapped_column(Text, nullable=False)
@@ -68,6 +83,8 @@ class Note(Base):
     # СИСТЕМНЫЕ ПОЛЯ 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
+    # Мягкое удаление: строка переносится в архив фоновой задачей
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
     
     # СВЯЗИ 
     user: Mapped["User"] = relationship("User", back_populates="notes")
@@ -76,6 +93,12 @@ class Note(Base):
 class Booking(Base):
     # Модель бронирования сессии
     __tablename__ = "bookings"
+    __table_args__ = (
+        # Диапазонные запросы по расписанию ментора и проверка занятости слота
+        Index("ix_bookings_mentor_session", "mentor_id", "session_date"),
+        # Список бронирований пользователя по дате сессии
+        Index("ix_bookings_user_session", "user_id", "session_date"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
@@ -97,6 +120,24 @@ class Booking(Base):
     mentor: Mapped["Mentor"] = relationship("Mentor", back_populates="bookings")
 
 
+class WaitlistEntry(Base):
+    # Очередь ожидания занятого слота ментора. Следующий в очереди - запись слота
+    # с наименьшим id: поиск по индексу (mentor_id, session_date, id) за O(log n)
+    __tablename__ = "waitlist"
+    __table_args__ = (
+        Index("ix_waitlist_slot", "mentor_id", "session_date", "id"),
+        UniqueConstraint("user_id", "mentor_id", "session_date", name="uq_waitlist_user_slot"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False, index=True)
+    mentor_id: Mapped[int] = mapped_column(ForeignKey("mentors.id"), nullable=False)
+    session_date: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    duration_minutes: Mapped[int] = mapped_column(Integer, default=60)
+    notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
 class RefreshToken(Base):
     # Модель refresh токенов
     __tablename__ = "refresh_tokens"
@@ -109,4 +150,101 @@ class RefreshToken(Base):
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     
     # СВЯЗИ 
-    user: Mapped["User"] = relationship("User", back_populates="refresh_tokens")
\ No newline at end of file
+    user: Mapped["User"] = relationship("User", back_populates="refresh_tokens")
+
+
+# АРХИВ: холодные строки переносятся сюда пачками (crud.ArchiveCRUD).
+# Колонки повторяют основные таблицы, внешних ключей и уникальности нет
+
+class BookingArchive(Base):
+    # Завершенные и отмененные бронирования прошлых периодов
+    __tablename__ = "bookings_archive"
+    __table_args__ = (
+        Index("ix_bookings_archive_user_session", "user_id", "session_date"),
+        Index("ix_bookings_archive_mentor_session", "mentor_id", "session_date"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    mentor_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    session_date: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    duration_minutes: Mapped[int] = mapped_column(Integer, default=60)
+    price: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[str] = mapped_column(String, nullable=False)
+    notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    archived_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    
+    # СВЯЗИ (только чтение: ответы списка бронирований с данными ментора)
+    mentor: Mapped["Mentor"] = relationship(
+        "Mentor", primaryjoin="foreign(BookingArchive.mentor_id) == Mentor.id", viewonly=True
+    )
+
+
+class NoteArchive(Base):
+    # Удаленные заметки
+    __tablename__ = "notes_archive"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    archived_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class RefreshTokenArchive(Base):
+    # Отозванные и истекшие refresh токены
+    __tablename__ = "refresh_tokens_archive"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    token: Mapped[str] = mapped_column(String, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    is_active: Mapped[bool] = mapped_column(Boolean, default=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+class Counter(Base):
+    # Общие счетчики (число заметок, бронирований): итог без COUNT(*) по таблице
+    __tablename__ = "counters"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+
+
+class CacheInvalidation(Base):
+    # Журнал инвалидаций кешей для согласования воркеров
+    __tablename__ = "cache_invalidations"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    topic: Mapped[str] = mapped_column(String, nullable=False)
+    key: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    origin: Mapped[str] = mapped_column(String, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+class IdempotencyKey(Base):
+    # Сохраненные ответы запросов с заголовком Idempotency-Key
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_user_key"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    key: Mapped[str] = mapped_column(String, nullable=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    request_hash: Mapped[str] = mapped_column(String, nullable=False)
+    status_code: Mapped[int] = mapped_column(Integer, nullable=False)
+    response_body: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class JobRun(Base):
+    # Срок следующего запуска периодической задачи: задачу выполняет тот воркер,
+    # который первым занял срок, остальные пропускают интервал
+    __tablename__ = "job_runs"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    next_run_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
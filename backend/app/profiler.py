@@ -0,0 +1,235 @@
+import cProfile
+import io
+import itertools
+import logging
+import pstats
+import re
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import settings
+from metrics import metrics
+
+try:
+    import pyinstrument
+except ImportError:  # pyinstrument - необязательная зависимость, без нее - cProfile
+    pyinstrument = None
+
+logger = logging.getLogger(__name__)
+
+
+# ПРОФИЛИРОВАНИЕ SQL
+
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)|\(\s*%\(\w+\)s(?:\s*,\s*%\(\w+\)s)+\s*\)")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    # Нормализованный текст запроса: литералы и списки IN (...) схлопнуты
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _IN_LIST.sub("(...)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+class QueryStats:
+    # Накопленная статистика одного отпечатка запроса
+
+    __slots__ = ("fingerprint", "count", "total_ms", "max_ms", "rows", "plan")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        # Строки известны, только если драйвер сообщает rowcount
+        # (PostgreSQL; в SQLite - для INSERT/UPDATE/DELETE)
+        self.rows = 0
+        self.plan: Optional[List[str]] = None
+
+    def merge(self, other: "QueryStats") -> "QueryStats":
+        merged = QueryStats(self.fingerprint)
+        merged.count = self.count + other.count
+        merged.total_ms = self.total_ms + other.total_ms
+        merged.max_ms = max(self.max_ms, other.max_ms)
+        merged.rows = self.rows + other.rows
+        merged.plan = self.plan or other.plan
+        return merged
+
+    def to_dict(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0,
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "plan": self.plan,
+        }
+
+
+class QueryProfiler:
+    # Статистика запросов по отпечаткам в скользящем окне: текущее окно
+    # и предыдущее, по которым строится top-N
+
+    def __init__(self, slow_ms: float, window_seconds: float, max_fingerprints: int):
+        self.slow_ms = slow_ms
+        self.window_seconds = window_seconds
+        self.max_fingerprints = max_fingerprints
+        self._current: Dict[str, QueryStats] = {}
+        self._previous: Dict[str, QueryStats] = {}
+        self._window_started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def install(self, engine: Engine) -> None:
+        # Подключить обработчики событий к движку
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_started"].pop()) * 1000
+        key = fingerprint(statement)
+        rowcount = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+
+        with self._lock:
+            self._rotate()
+            stats = self._current.get(key)
+            if stats is None:
+                if len(self._current) >= self.max_fingerprints:
+                    metrics.incr("sql_profiler.dropped")
+                    return
+                stats = self._current[key] = QueryStats(key)
+            stats.count += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.rows += rowcount
+            need_plan = elapsed_ms >= self.slow_ms and stats.plan is None
+
+        if elapsed_ms >= self.slow_ms:
+            metrics.incr("sql_profiler.slow")
+            plan = None
+            if need_plan and not executemany:
+                plan = self._explain(conn, statement, parameters)
+                stats.plan = plan
+            logger.warning(
+                f"Медленный запрос {elapsed_ms:.1f} мс: {key}"
+                + (("\nПлан:\n  " + "\n  ".join(plan)) if plan else "")
+            )
+
+    @staticmethod
+    def _explain(conn, statement: str, parameters) -> Optional[List[str]]:
+        # План запроса отдельным курсором того же соединения
+        # (EXPLAIN без ANALYZE сам запрос не выполняет)
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            cursor = conn.connection.dbapi_connection.cursor()
+            try:
+                cursor.execute(prefix + statement, parameters)
+                return [" ".join(str(value) for value in row) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception as error:
+            return [f"EXPLAIN не выполнен: {error}"]
+
+    def _rotate(self) -> None:
+        now = time.monotonic()
+        if now - self._window_started >= self.window_seconds:
+            self._previous, self._current = self._current, {}
+            self._window_started = now
+
+    def top(self, n: int, order: str = "total_ms") -> List[dict]:
+        # Самые дорогие запросы за текущее и предыдущее окно
+        with self._lock:
+            self._rotate()
+            merged = dict(self._previous)
+            for key, stats in self._current.items():
+                merged[key] = merged[key].merge(stats) if key in merged else stats
+            ranked = sorted(merged.values(), key=lambda stats: getattr(stats, order), reverse=True)
+            return [stats.to_dict() for stats in ranked[:n]]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._current, self._previous = {}, {}
+            self._window_started = time.monotonic()
+
+
+query_profiler = QueryProfiler(
+    slow_ms=settings.SQL_SLOW_QUERY_MS,
+    window_seconds=settings.SQL_PROFILER_WINDOW_SECONDS,
+    max_fingerprints=settings.SQL_PROFILER_MAX_FINGERPRINTS,
+)
+
+
+# ПРОФИЛИРОВАНИЕ ЗАПРОСОВ (cProfile или pyinstrument)
+
+# Идентификаторы профилей (выдаются до начала запроса - для заголовка X-Profile-Id)
+_profile_ids = itertools.count(1)
+
+# Профилировщики Python не вкладываются: одновременно профилируется один запрос
+profiling_lock = threading.Lock()
+
+
+def next_profile_id() -> int:
+    return next(_profile_ids)
+
+
+class RequestProfile:
+    # Результат профилирования одного HTTP запроса
+
+    def __init__(self, profile_id: int, method: str, path: str, duration_ms: float, engine: str, report: str):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.duration_ms = duration_ms
+        self.engine = engine
+        self.report = report
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "duration_ms": round(self.duration_ms, 3),
+            "engine": self.engine,
+        }
+
+
+# Последние профили запросов
+recent_profiles: Deque[RequestProfile] = deque(maxlen=settings.REQUEST_PROFILING_KEEP)
+
+
+class Sampler:
+    # Профилировщик одного запроса. В event loop профилируется поток цикла,
+    # поэтому в отчет могут попасть и конкурентные запросы
+
+    def __init__(self, engine: Optional[str] = None):
+        self.engine = "pyinstrument" if engine == "pyinstrument" and pyinstrument is not None else "cprofile"
+        if self.engine == "pyinstrument":
+            self._profiler = pyinstrument.Profiler(async_mode="enabled")
+        else:
+            self._profiler = cProfile.Profile()
+
+    def start(self) -> None:
+        if self.engine == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self, top: int = 30) -> str:
+        # Остановить и вернуть текстовый отчет
+        if self.engine == "pyinstrument":
+            self._profiler.stop()
+            return self._profiler.output_text()
+        self._profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(self._profiler, stream=output).sort_stats("cumulative").print_stats(top)
+        return output.getvalue()
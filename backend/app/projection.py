@@ -0,0 +1,61 @@
+from typing import Any, Dict, Iterable, List, Optional, Type
+from fastapi import HTTPException, status
+from pydantic import BaseModel, TypeAdapter
+
+
+# Частичные ответы (?fields=): в SQL выбираются только запрошенные колонки,
+# ответ сериализуется схемой эндпоинта, но только с этими полями.
+
+def parse_fields(
+    fields: Optional[str],
+    model: Type[BaseModel],
+    always: Iterable[str] = ("id",)
+) -> Optional[List[str]]:
+    # Разобрать ?fields=name,city; None - все поля. Порядок - как в схеме
+    if not fields:
+        return None
+
+    requested = {part.strip() for part in fields.split(",") if part.strip()}
+    unknown = requested - set(model.model_fields)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Неизвестные значения fields: {', '.join(sorted(unknown))}"
+        )
+    requested.update(always)
+    return [name for name in model.model_fields if name in requested]
+
+
+class Projector:
+    # Сериализация ORM объектов или строк Core запроса с частью полей схемы
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self._adapter = TypeAdapter(List[model])
+        # Вложенные схемы (например, mentor в бронировании) валидируются из атрибутов
+        self._nested: Dict[str, TypeAdapter] = {
+            name: TypeAdapter(field.annotation)
+            for name, field in model.model_fields.items()
+            if _has_model(field.annotation)
+        }
+
+    def _value(self, item: Any, name: str) -> Any:
+        value = getattr(item, name)
+        nested = self._nested.get(name)
+        if nested is not None and value is not None:
+            return nested.validate_python(value, from_attributes=True)
+        return value
+
+    def dump_json(self, items: Iterable[Any], fields: List[str]) -> bytes:
+        # JSON массив объектов только с полями fields
+        projected = [
+            self.model.model_construct(**{name: self._value(item, name) for name in fields})
+            for item in items
+        ]
+        return self._adapter.dump_json(projected, include={"__all__": set(fields)})
+
+
+def _has_model(annotation: Any) -> bool:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return True
+    return any(_has_model(arg) for arg in getattr(annotation, "__args__", ()))
@@ -0,0 +1,148 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from utils import verify_token
+
+
+# Длительность периодов в секундах для записи вида "5/minute"
+PERIODS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    # Правило токен-бакета: capacity запросов, пополнение refill_rate токенов в секунду
+    capacity: int
+    refill_rate: float
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimitRule":
+        # Разобрать строку вида "10/minute"
+        count, _, period = value.partition("/")
+        seconds = PERIODS.get(period.strip())
+        if seconds is None or not count.strip().isdigit():
+            raise ValueError(f"Неверный формат лимита: {value}")
+        capacity = int(count)
+        return cls(capacity=capacity, refill_rate=capacity / seconds)
+
+
+class RateLimitStore(ABC):
+    # Интерфейс хранилища бакетов (in-memory, Redis и т.п.)
+
+    @abstractmethod
+    async def consume(self, key: str, rule: RateLimitRule, cost: int = 1) -> Tuple[bool, float]:
+        # Списать токены; вернуть (разрешено, секунд до повтора)
+        ...
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    # Хранилище бакетов в памяти процесса.
+    # Вызывается только из event loop и не содержит await внутри consume,
+    # поэтому операции атомарны без блокировок.
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def consume(self, key: str, rule: RateLimitRule, cost: int = 1) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (float(rule.capacity), now))
+        tokens = min(rule.capacity, tokens + (now - updated_at) * rule.refill_rate)
+
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+
+        # Переставляем ключ в конец словаря - порядок вставки служит LRU
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.pop(next(iter(self._buckets)))
+
+        if allowed:
+            return True, 0.0
+        return False, (cost - tokens) / rule.refill_rate
+
+
+class RateLimitMiddleware:
+    # ASGI middleware: токен-бакеты по IP и по пользователю для настроенных маршрутов
+
+    def __init__(self, app, limits: Dict[str, Dict[str, str]], store: Optional[RateLimitStore] = None):
+        self.app = app
+        self.store = store or InMemoryRateLimitStore()
+        self.rules: Dict[Tuple[str, str], Dict[str, RateLimitRule]] = {}
+        for route, scopes in limits.items():
+            method, _, path = route.partition(" ")
+            self.rules[(method.upper(), path)] = {
+                scope: RateLimitRule.parse(value) for scope, value in scopes.items()
+            }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rules = self.rules.get((scope["method"], scope["path"]))
+        if rules:
+            retry_after = await self._check(scope, rules)
+            if retry_after is not None:
+                await self._reject(send, retry_after)
+                return
+
+        await self.app(scope, receive, send)
+
+    async def _check(self, scope, rules: Dict[str, RateLimitRule]) -> Optional[float]:
+        # Проверить все применимые бакеты; вернуть время ожидания при превышении
+        route = f'{scope["method"]} {scope["path"]}'
+
+        ip_rule = rules.get("ip")
+        if ip_rule:
+            client = scope.get("client")
+            ip = client[0] if client else "unknown"
+            allowed, retry_after = await self.store.consume(f"ip:{ip}:{route}", ip_rule)
+            if not allowed:
+                return retry_after
+
+        user_rule = rules.get("user")
+        if user_rule:
+            user_id = self._get_user_id(scope)
+            if user_id:
+                allowed, retry_after = await self.store.consume(f"user:{user_id}:{route}", user_rule)
+                if not allowed:
+                    return retry_after
+
+        return None
+
+    @staticmethod
+    def _get_user_id(scope) -> Optional[str]:
+        # Идентификатор пользователя из access токена (без обращения к БД)
+        for name, value in scope.get("headers", []):
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() != "bearer":
+                    return None
+                payload = verify_token(token)
+                if payload and payload.get("type") == "access":
+                    return payload.get("sub")
+                return None
+        return None
+
+    @staticmethod
+    async def _reject(send, retry_after: float) -> None:
+        # Ответ 429 с заголовком Retry-After
+        body = json.dumps({"detail": "Слишком много запросов, попробуйте позже"}, ensure_ascii=False).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
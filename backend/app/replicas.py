@@ -0,0 +1,90 @@
+import time
+from typing import Dict, Generator, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from config import settings
+from database import SessionLocal, ReadSessionLocal, get_read_engines
+from invalidation import bus
+
+# Тема шины: пользователь только что записал данные, его чтения - в основную БД
+WRITES_TOPIC = "writes"
+
+# Ограничение размера таблицы последних записей
+MAX_TRACKED_WRITERS = 100_000
+
+# id пользователя -> время последней записи (time.monotonic воркера)
+_last_write: Dict[int, float] = {}
+
+
+def mark_write(user_id: int) -> None:
+    # Запомнить запись пользователя (read-your-writes)
+    now = time.monotonic()
+    if len(_last_write) >= MAX_TRACKED_WRITERS:
+        cutoff = now - settings.READ_YOUR_WRITES_SECONDS
+        for stale_id in [key for key, written in _last_write.items() if written < cutoff]:
+            del _last_write[stale_id]
+    _last_write[user_id] = now
+
+
+def is_sticky(user_id: Optional[int]) -> bool:
+    # Читать ли пользователю из основной БД (недавно были записи)
+    if user_id is None:
+        return False
+    written = _last_write.get(user_id)
+    return written is not None and time.monotonic() - written < settings.READ_YOUR_WRITES_SECONDS
+
+
+def open_read_session(user_id: Optional[int]) -> Generator:
+    # Сессия реплики, а сразу после записи пользователя - основной БД, чтобы он
+    # видел свои изменения. user_id - уже аутентифицированный пользователь
+    # (api.get_read_db), токен здесь повторно не разбирается
+    if get_read_engines() and not is_sticky(user_id):
+        db = ReadSessionLocal()
+    else:
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Отслеживание записей. Пользователь сессии известен после аутентификации
+# (session.info["user_id"]); факт записи - по flush и DML запросам ORM.
+
+@event.listens_for(Session, "after_flush")
+def _flag_flush(session: Session, flush_context) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_dml(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "before_commit")
+def _publish_write(session: Session) -> None:
+    # Сообщить всем воркерам о записи пользователя в той же транзакции
+    # (user_ids - пользователи пачки группового коммита)
+    if not get_read_engines():
+        return
+    user_ids = session.info.pop("user_ids", set())
+    user_id = session.info.get("user_id")
+    if user_id is not None and (session.info.get("wrote") or session.new or session.dirty or session.deleted):
+        user_ids.add(user_id)
+    for user_id in user_ids:
+        bus.publish(session, WRITES_TOPIC, user_id)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _reset_write_flag(session: Session) -> None:
+    session.info.pop("wrote", None)
+
+
+def _on_bus_event(key: Optional[str]) -> None:
+    if key is not None:
+        mark_write(int(key))
+
+
+bus.subscribe(WRITES_TOPIC, _on_bus_event)
@@ -0,0 +1,129 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from config import settings
+from invalidation import bus
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Тема шины, через которую отзывы токенов доходят до всех воркеров
+REVOCATIONS_TOPIC = "revocations"
+
+
+class RevocationList:
+    # Список отозванных access токенов в памяти воркера.
+    # Проверка - поиск в словаре без обращения к БД; записи живут не дольше
+    # самого токена, размер ограничен. При переполнении список отказывает
+    # закрыто: вытесняется токен, истекающий раньше всех, а вместе с ним
+    # отзываются все токены, истекающие не позже него (клиенты получат 401
+    # и обновят access токен по refresh токену).
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        # jti -> время истечения токена
+        self._tokens: Dict[str, float] = {}
+        # (время истечения, jti) - куча для вытеснения и очистки по истечению
+        self._expiry: List[Tuple[float, str]] = []
+        # Отозваны все токены со сроком истечения не позже этого момента
+        self._expired_before = 0.0
+        # id пользователя (строкой, как в sub) -> (отозваны токены, выданные до, запись истекает)
+        self._users: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def is_revoked(self, payload: dict) -> bool:
+        # Проверить access токен по его jti и отзыву всех токенов пользователя
+        if payload.get("exp", 0) <= self._expired_before:
+            return True
+        if self._tokens and payload.get("jti") in self._tokens:
+            return True
+        if self._users:
+            user_entry = self._users.get(payload.get("sub"))
+            if user_entry is not None and payload.get("iat", 0) < user_entry[0]:
+                return True
+        return False
+
+    def revoke(self, jti: str, expires_at: float) -> None:
+        # Отозвать один токен до момента его истечения
+        now = time.time()
+        if expires_at <= now:
+            return
+        with self._lock:
+            self._prune(now)
+            if jti not in self._tokens:
+                heapq.heappush(self._expiry, (expires_at, jti))
+            self._tokens[jti] = expires_at
+            evicted = 0
+            while len(self._tokens) > self.max_size:
+                expires, evicted_jti = heapq.heappop(self._expiry)
+                if self._tokens.pop(evicted_jti, None) is None:
+                    continue
+                self._expired_before = max(self._expired_before, expires)
+                evicted += 1
+        metrics.incr("revocation.tokens")
+        if evicted:
+            metrics.incr("revocation.evicted", evicted)
+            logger.error(
+                f"Список отозванных токенов переполнен ({self.max_size}): отозваны все "
+                f"access токены, истекающие до {datetime.fromtimestamp(self._expired_before, timezone.utc):%H:%M:%S} UTC; "
+                f"увеличьте REVOCATION_MAX_ENTRIES"
+            )
+
+    def revoke_user(self, user_id: str, issued_before: float) -> None:
+        # Отозвать все токены пользователя, выданные до указанного момента
+        expires_at = issued_before + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        with self._lock:
+            self._prune(time.time())
+            current = self._users.get(user_id)
+            if current is None or current[0] < issued_before:
+                self._users[user_id] = (issued_before, expires_at)
+        metrics.incr("revocation.users")
+
+    def _prune(self, now: float) -> None:
+        # Удалить записи о токенах, которые уже истекли сами
+        while self._expiry and self._expiry[0][0] <= now:
+            _, jti = heapq.heappop(self._expiry)
+            if self._tokens.get(jti, now + 1) <= now:
+                del self._tokens[jti]
+        expired_users = [user_id for user_id, entry in self._users.items() if entry[1] <= now]
+        for user_id in expired_users:
+            del self._users[user_id]
+
+    def __len__(self) -> int:
+        return len(self._tokens) + len(self._users)
+
+
+def revoke_token(db: Session, payload: dict) -> None:
+    # Отозвать токен во всех воркерах после коммита текущей транзакции
+    if "jti" not in payload:
+        return
+    bus.publish(db, REVOCATIONS_TOPIC, json.dumps({"jti": payload["jti"], "exp": payload["exp"]}))
+
+
+def revoke_user_tokens(db: Session, user_id: int) -> None:
+    # Отозвать все выданные пользователю access токены во всех воркерах
+    bus.publish(db, REVOCATIONS_TOPIC, json.dumps({"sub": str(user_id), "before": time.time()}))
+
+
+def _on_bus_event(key: Optional[str]) -> None:
+    if key is None:
+        return
+    entry = json.loads(key)
+    if "jti" in entry:
+        revocations.revoke(entry["jti"], entry["exp"])
+    else:
+        revocations.revoke_user(entry["sub"], entry["before"])
+
+
+revocations = RevocationList(max_size=settings.REVOCATION_MAX_ENTRIES)
+# Новый воркер восстанавливает отзывы за время жизни access токена из журнала шины
+bus.subscribe(
+    REVOCATIONS_TOPIC,
+    _on_bus_event,
+    replay=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+)
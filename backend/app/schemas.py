@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel, EmailStr, field_serializer, validator, ConfigDict
 
@@ -44,6 +44,7 @@ class UserResponse(BaseModel):
     yoga_style: Optional[str] = None
     experience: Optional[str] = None
     goals: Optional[str] = None
+    photo_url: Optional[str] = None
     created_at: datetime
     is_active: bool
     
@@ -117,6 +118,25 @@ class MentorResponse(MentorBase):
     is_available: bool
     created_at: datetime
     
+    # Агрегаты бронирований хранятся в строке ментора - без дополнительных запросов
+    total_bookings: int = 0
+    upcoming_bookings: int = 0
+    completed_sessions: int = 0
+    revenue: int = 0
+    
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Краткая схема ментора для вложения в другие ответы
+class MentorSummary(BaseModel):
+    id: int
+    name: str
+    city: str
+    yoga_style: str
+    price: int
+    rating: float
+    photo_url: Optional[str] = None
+    
     model_config = ConfigDict(from_attributes=True)
 
 
@@ -198,9 +218,65 @@ class BookingResponse(BookingBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+# Запись в очереди ожидания занятого слота (position - место в очереди, с 1)
+class WaitlistResponse(BookingBase):
+    id: int
+    user_id: int
+    created_at: datetime
+    position: int = 1
+    
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Схема ответа с бронированием и данными ментора (include=mentor)
+class BookingWithMentorResponse(BookingResponse):
+    mentor: Optional[MentorSummary] = None
+    
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Интервал календаря загрузки ментора
+class CalendarBucket(BaseModel):
+    start: datetime
+    booked_minutes: int
+    bookings: int
+    
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Календарь загрузки ментора (тепловая карта по дням или часам)
+class MentorCalendarResponse(BaseModel):
+    mentor_id: int
+    bucket: str
+    date_from: datetime
+    date_to: datetime
+    buckets: List[CalendarBucket]
+    
+    model_config = ConfigDict(from_attributes=True)
+
+
 # Схема для обновления бронирования
 class BookingUpdate(BaseModel):
     status: Optional[str] = None
     notes: Optional[str] = None
     
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Сводка для стартового экрана: разделы выбираются параметром ?fields=
+class DashboardResponse(BaseModel):
+    user: Optional[UserResponse] = None
+    upcoming_bookings: Optional[List[BookingWithMentorResponse]] = None
+    recent_notes: Optional[List[NoteResponse]] = None
+    mentors: Optional[List[MentorResponse]] = None
+
+
+# Загруженное изображение: неизменяемые URL оригинала и миниатюр (размер -> URL)
+class MediaResponse(BaseModel):
+    id: str
+    url: str
+    content_type: str
+    size: int
+    thumbnails: Dict[str, str] = {}
+    
+    model_config = ConfigDict(from_attributes=True)
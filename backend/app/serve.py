@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+from config import settings
+
+
+# Точка входа для продакшена: несколько воркеров uvicorn.
+# При наличии gunicorn используется он (SIGHUP - плавный перезапуск воркеров,
+# SIGTERM - плавная остановка), иначе встроенный менеджер процессов uvicorn.
+# Кеши каждого воркера независимы и согласуются через шину инвалидации.
+
+
+def default_workers() -> int:
+    # Число воркеров: из настроек или по числу доступных ядер
+    if settings.WEB_CONCURRENCY > 0:
+        return settings.WEB_CONCURRENCY
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def upgrade_database() -> None:
+    # Схема обновляется один раз до запуска воркеров, а не в каждом наперегонки
+    import database
+    import logs
+    import migrations
+
+    logs.configure_logging()
+    try:
+        migrations.upgrade_database()
+    finally:
+        database.dispose_engine()
+        logs.shutdown_logging()
+
+
+def run_gunicorn(host: str, port: int, workers: int) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class YogaVibeApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+            self.cfg.set("graceful_timeout", settings.GRACEFUL_TIMEOUT_SECONDS)
+            # Приложение импортируется в каждом воркере: ничего не разделяется через fork
+            self.cfg.set("preload_app", False)
+
+        def load(self):
+            from main import app
+            return app
+
+    YogaVibeApplication().run()
+
+
+def run_uvicorn(host: str, port: int, workers: int, reload: bool) -> None:
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host=host,
+        port=port,
+        workers=None if reload else workers,
+        reload=reload,
+        timeout_graceful_shutdown=settings.GRACEFUL_TIMEOUT_SECONDS,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Запуск YogaVibe API")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--reload", action="store_true", help="Режим разработки: один воркер с автоперезагрузкой")
+    args = parser.parse_args()
+
+    upgrade_database()
+
+    if not args.reload and sys.platform != "win32":
+        try:
+            run_gunicorn(args.host, args.port, args.workers)
+            return
+        except ImportError:
+            pass
+
+    run_uvicorn(args.host, args.port, args.workers, args.reload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from metrics import metrics
+
+
+class SingleFlight:
+    # Объединение одинаковых одновременных запросов: пока выполняется загрузка
+    # по ключу, остальные вызовы с тем же ключом ждут ее результат.
+    # Загрузка идет в отдельной задаче, поэтому отмена одного запроса
+    # (разрыв соединения клиентом) не прерывает ее для остальных.
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Any:
+        # Выполнить fn один раз для всех одновременных вызовов с ключом key.
+        # Исключение загрузки получают все ожидающие; по таймауту ожидающий
+        # получает asyncio.TimeoutError, а загрузка продолжается для остальных.
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            metrics.incr(f"singleflight.{self.name}.executed")
+        else:
+            metrics.incr(f"singleflight.{self.name}.coalesced")
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            metrics.incr(f"singleflight.{self.name}.timeout")
+            raise
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Забираем исключение, чтобы оно не считалось необработанным,
+        # если никто из ожидающих не дождался результата
+        if not task.cancelled() and task.exception() is not None:
+            metrics.incr(f"singleflight.{self.name}.error")
+
+    def in_flight(self) -> int:
+        return len(self._calls)
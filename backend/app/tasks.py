@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Callable, List
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from database import SessionLocal
+from config import settings
+import crud
+import invalidation
+
+logger = logging.getLogger(__name__)
+
+# Запущенные фоновые задачи приложения
+_tasks: List[asyncio.Task] = []
+
+
+def _run_with_session(job: Callable[[Session], object]) -> object:
+    # Выполнить задачу с отдельной сессией базы данных
+    db = SessionLocal()
+    try:
+        return job(db)
+    finally:
+        db.close()
+
+
+def _run_once(name: str, interval: int, job: Callable[[Session], object]) -> object:
+    # Выполнить задачу, если этот интервал не занят другим воркером (таблица job_runs):
+    # при N воркерах задача выполняется один раз за интервал, а не N раз
+    def run(db: Session) -> object:
+        if not crud.job_run_crud.claim_run(db, name, timedelta(seconds=interval)):
+            return None
+        return job(db)
+    
+    return _run_with_session(run)
+
+
+async def _periodic(name: str, interval: int, job: Callable[[Session], object]) -> None:
+    # Периодически запускать задачу в пуле потоков, не блокируя event loop
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await run_in_threadpool(_run_once, name, interval, job)
+            if result is not None:
+                logger.info(f"Фоновая задача {name} выполнена: {result}")
+        except Exception:
+            logger.exception(f"Ошибка фоновой задачи {name}")
+
+
+def start() -> None:
+    # Запустить периодические задачи
+    _tasks.append(asyncio.create_task(invalidation.run_poller(
+        settings.CACHE_INVALIDATION_POLL_SECONDS,
+        timedelta(minutes=settings.CACHE_INVALIDATION_RETENTION_MINUTES),
+    )))
+    
+    # (имя, интервал, задача). Агрегаты менторов при старте не пересчитываются:
+    # после изменения схемы это делает migrations.upgrade_database (serve.py - один
+    # раз до запуска воркеров)
+    jobs = [
+        ("reconcile_mentor_stats", settings.MENTOR_STATS_RECONCILE_INTERVAL_SECONDS,
+         crud.mentor_crud.reconcile_stats),
+        ("purge_idempotency_keys", settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS,
+         crud.idempotency_crud.purge_expired),
+        ("archive_cold_rows", settings.ARCHIVE_INTERVAL_SECONDS,
+         crud.archive_crud.archive_cold_rows),
+    ]
+    for name, interval, job in jobs:
+        if interval > 0:
+            _tasks.append(asyncio.create_task(_periodic(name, interval, job)))
+
+
+async def stop() -> None:
+    # Остановить периодические задачи
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -0,0 +1,35 @@
+import os
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow - необязательная зависимость, без нее миниатюр нет
+    Image = None
+
+
+# Выполняется в процессах пула media.MediaStore, поэтому модуль ничего
+# не импортирует из приложения (процессы запускаются через spawn)
+
+def available() -> bool:
+    return Image is not None
+
+
+def render(source: str, target: str, size: int, quality: int, max_pixels: int) -> int:
+    # Уменьшить изображение до size точек по большей стороне и сохранить в WebP.
+    # Пишем во временный файл и переименовываем: читатели не видят недописанный файл.
+    # Изображения больше max_pixels точек не декодируются: маленький файл может
+    # развернуться в гигабайты памяти и уронить процесс пула
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with Image.open(source) as image:
+        width, height = image.size
+        if width * height > max_pixels:
+            raise ValueError(f"Изображение {width}x{height} больше {max_pixels} точек")
+        # JPEG декодируется сразу в уменьшенном масштабе (в разы быстрее полного)
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.mode in ("LA", "P", "PA") else "RGB")
+        temporary = f"{target}.{os.getpid()}.tmp"
+        image.save(temporary, "WEBP", quality=quality, method=4)
+    os.replace(temporary, target)
+    return os.path.getsize(target)
@@ -0,0 +1,176 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import jwt
+from jwt.algorithms import get_default_algorithms
+from config import settings
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _read_key(value: Optional[str]) -> Optional[str]:
+    # Ключ в настройках задается PEM строкой или путем к файлу
+    if value and not value.lstrip().startswith("-----") and Path(value).is_file():
+        return Path(value).read_text()
+    return value
+
+
+class TokenService:
+    # Выпуск и проверка JWT без лишней работы на каждый запрос:
+    # объекты ключей и закодированный заголовок готовятся один раз.
+    # HS* подписывает общим секретом, EdDSA/ES256 - закрытым ключом, а проверить
+    # токен может любой сервис с открытым ключом (см. jwks()).
+
+    def __init__(
+        self,
+        algorithm: str,
+        secret_key: Optional[str] = None,
+        private_key: Optional[str] = None,
+        public_key: Optional[str] = None
+    ):
+        algorithms = get_default_algorithms()
+        if algorithm not in algorithms:
+            raise ValueError(f"Алгоритм {algorithm} не поддерживается (для EdDSA/ES256 нужен cryptography)")
+
+        self.algorithm = algorithm
+        self._algorithm = algorithms[algorithm]
+        self._hmac = None
+        kid = None
+
+        if algorithm.startswith("HS"):
+            if not secret_key:
+                raise ValueError(f"Для {algorithm} нужен SECRET_KEY")
+            key = self._algorithm.prepare_key(secret_key)
+            # Шаблон HMAC с уже обработанным ключом: на каждый токен только copy()
+            self._hmac = hmac.new(key, digestmod=self._algorithm.hash_alg)
+            self._signing_key = self._verifying_key = key
+        else:
+            if not private_key and not public_key:
+                raise ValueError(f"Для {algorithm} нужен JWT_PRIVATE_KEY или JWT_PUBLIC_KEY")
+            self._signing_key = self._algorithm.prepare_key(private_key) if private_key else None
+            if public_key:
+                self._verifying_key = self._algorithm.prepare_key(public_key)
+            else:
+                self._verifying_key = self._signing_key.public_key()
+            kid = self._key_id()
+
+        header = {"alg": algorithm, "typ": "JWT"}
+        if kid:
+            header["kid"] = kid
+        self.kid = kid
+        # Тот же JSON, что выдает PyJWT: токены совместимы в обе стороны
+        self._header_prefix = _b64encode(
+            json.dumps(header, separators=(",", ":"), sort_keys=True).encode()
+        ) + "."
+
+    def _key_id(self) -> str:
+        # Идентификатор ключа: отпечаток открытого ключа (для ротации ключей)
+        from cryptography.hazmat.primitives import serialization
+
+        der = self._verifying_key.public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        return _b64encode(hashlib.sha256(der).digest()[:12])
+
+    def _sign(self, message: bytes) -> bytes:
+        if self._hmac is not None:
+            mac = self._hmac.copy()
+            mac.update(message)
+            return mac.digest()
+        return self._algorithm.sign(message, self._signing_key)
+
+    def _verify(self, message: bytes, signature: bytes) -> bool:
+        if self._hmac is not None:
+            return hmac.compare_digest(self._sign(message), signature)
+        return self._algorithm.verify(message, self._verifying_key, signature)
+
+    def encode(self, claims: Dict) -> str:
+        # Подписать набор claims (exp и iat - числа, как в JWT)
+        if self._signing_key is None:
+            raise RuntimeError("Сервис настроен только на проверку токенов (нет закрытого ключа)")
+        signing_input = self._header_prefix + _b64encode(
+            json.dumps(claims, separators=(",", ":")).encode()
+        )
+        return signing_input + "." + _b64encode(self._sign(signing_input.encode("ascii")))
+
+    def decode(self, token: str) -> Optional[Dict]:
+        # Проверить подпись и срок действия; None - токен недействителен
+        if not token.startswith(self._header_prefix):
+            # Другой заголовок (например, другой порядок полей) - общая проверка PyJWT
+            return self._decode_generic(token)
+
+        try:
+            signing_input, _, signature = token.rpartition(".")
+            payload_segment = signing_input[len(self._header_prefix):]
+            if not payload_segment or "." in payload_segment:
+                return None
+            if not self._verify(signing_input.encode("ascii"), _b64decode(signature)):
+                return None
+            payload = json.loads(_b64decode(payload_segment))
+        except (ValueError, binascii.Error, UnicodeError):
+            return None
+
+        if not isinstance(payload, dict):
+            return None
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)) or exp <= time.time():
+            return None
+        return payload
+
+    def _decode_generic(self, token: str) -> Optional[Dict]:
+        try:
+            return jwt.decode(token, self._verifying_key, algorithms=[self.algorithm])
+        except jwt.InvalidTokenError:
+            return None
+
+    def issue(self, claims: Dict, token_type: str, lifetime: float, now: Optional[float] = None) -> str:
+        # Выпустить токен: exp, iat с долями секунды (для отзыва) и jti
+        now = time.time() if now is None else now
+        return self.encode({
+            **claims,
+            "exp": int(now + lifetime),
+            "iat": now,
+            "jti": uuid.uuid4().hex,
+            "type": token_type,
+        })
+
+    def issue_pair(self, subject: str) -> Tuple[str, str]:
+        # Access и refresh токены с общим моментом выпуска
+        now = time.time()
+        claims = {"sub": subject}
+        return (
+            self.issue(claims, "access", settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60, now),
+            self.issue(claims, "refresh", settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400, now),
+        )
+
+    def jwks(self) -> Dict:
+        # Открытые ключи в формате JWK Set для проверки токенов другими сервисами
+        if self._hmac is not None:
+            return {"keys": []}
+        jwk = self._algorithm.to_jwk(self._verifying_key, as_dict=True)
+        jwk.update({"kid": self.kid, "alg": self.algorithm, "use": "sig"})
+        return {"keys": [jwk]}
+
+
+@lru_cache(maxsize=None)
+def get_token_service() -> TokenService:
+    # Сервис создается при первом обращении: ключи читаются и разбираются один раз
+    return TokenService(
+        settings.ALGORITHM,
+        secret_key=settings.SECRET_KEY,
+        private_key=_read_key(settings.JWT_PRIVATE_KEY),
+        public_key=_read_key(settings.JWT_PUBLIC_KEY),
+    )
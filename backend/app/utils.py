@@ -1,59 +1,115 @@
-from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional
-import jwt
-from passlib.context import CryptContext
+import logging
+import math
+import statistics
+import time
+from datetime import timedelta
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 from config import settings
+from tokens import get_token_service
 
+logger = logging.getLogger(__name__)
 
-# Хеширование паролей - используем sha256_crypt
 
-pwd_context = CryptContext(
-    schemes=["sha256_crypt", "bcrypt"],
-    deprecated="auto",
-    sha256_crypt__default_rounds=29000
-)
+# Хеширование паролей - схема и стоимость из настроек (по умолчанию sha256_crypt)
+
+# Схемы, хеши которых еще проверяются; все, кроме основной, перехешируются при входе
+PASSWORD_SCHEMES = ("sha256_crypt", "bcrypt")
+
+
+def calibrate_hash_rounds(scheme: str, target_ms: float, samples: int = 3) -> int:
+    # Подобрать rounds, при которых хеширование занимает около target_ms на этой машине
+    from passlib.registry import get_crypt_handler
+    
+    handler = get_crypt_handler(scheme)
+    
+    def measure(rounds: int) -> float:
+        sample_handler = handler.using(rounds=rounds)
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            sample_handler.hash("calibration")
+            timings.append((time.perf_counter() - started) * 1000)
+        return max(statistics.median(timings), 1e-3)
+    
+    if handler.rounds_cost == "log2":
+        # bcrypt: стоимость удваивается с каждым шагом
+        rounds = handler.min_rounds + int(math.log2(max(target_ms / measure(handler.min_rounds), 1)))
+    else:
+        # Линейная стоимость: грубая оценка на малом числе rounds, затем уточнение
+        # на самой оценке (постоянные накладные расходы занижают первую)
+        sample_rounds = max(handler.min_rounds, 5000)
+        rounds = int(sample_rounds * target_ms / measure(sample_rounds))
+        rounds = min(max(rounds, handler.min_rounds), handler.max_rounds)
+        rounds = int(rounds * target_ms / measure(rounds))
+        # Две значащие цифры: воркеры на одинаковом железе получают одно значение
+        rounds = int(float(f"{rounds:.2g}"))
+    
+    return min(max(rounds, handler.min_rounds), handler.max_rounds)
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    # Контекст passlib создается при первом хешировании, а не при импорте.
+    # PASSWORD_HASH_ROUNDS=0 - стоимость калибруется под PASSWORD_HASH_TARGET_MS
+    from passlib.context import CryptContext
+    from passlib.registry import get_crypt_handler
+    
+    scheme = settings.PASSWORD_HASH_SCHEME
+    rounds = settings.PASSWORD_HASH_ROUNDS
+    if rounds <= 0:
+        rounds = calibrate_hash_rounds(scheme, settings.PASSWORD_HASH_TARGET_MS)
+        logger.info(f"Калибровка {scheme}: rounds={rounds} (цель {settings.PASSWORD_HASH_TARGET_MS} мс)")
+    
+    # Хеши заметно слабее текущей стоимости помечаются needs_update; допуск
+    # гасит разброс калибровки, иначе воркеры перехешировали бы пароли по кругу
+    min_rounds = rounds
+    if get_crypt_handler(scheme).rounds_cost == "linear":
+        min_rounds = int(rounds * (1 - settings.PASSWORD_HASH_REHASH_TOLERANCE))
+    
+    return CryptContext(
+        schemes=[scheme] + [other for other in PASSWORD_SCHEMES if other != scheme],
+        default=scheme,
+        deprecated="auto",
+        **{f"{scheme}__default_rounds": rounds, f"{scheme}__min_rounds": min_rounds}
+    )
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     # Проверка пароля
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     # Получение хеша пароля
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    # Хеш создан устаревшей схемой или с заниженной стоимостью
+    return get_pwd_context().needs_update(hashed_password)
 
 
-# Функции для работы с JWT
+# Функции для работы с JWT (подпись и проверка - tokens.TokenService)
 
 def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -> str:
     # Создание access токена
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    
-    to_encode.update({"exp": expire, "type": "access"})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
+    if expires_delta is None:
+        expires_delta = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    return get_token_service().issue(data, "access", expires_delta.total_seconds())
 
 
 def create_refresh_token(data: Dict) -> str:
     # Создание refresh токена
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire, "type": "refresh"})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
+    lifetime = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS).total_seconds()
+    return get_token_service().issue(data, "refresh", lifetime)
+
+
+def create_token_pair(user_id: int) -> Tuple[str, str]:
+    # Access и refresh токены для входа, регистрации и обновления
+    return get_token_service().issue_pair(str(user_id))
 
 
 def verify_token(token: str) -> Optional[Dict]:
     # Проверка токена
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
\ No newline at end of file
+    return get_token_service().decode(token)
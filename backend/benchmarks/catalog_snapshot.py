@@ -0,0 +1,107 @@
+# Сравнение фильтрации каталога: SQL запрос + сериализация против колоночного снимка.
+#
+# Запуск из каталога backend:
+#
+#     python benchmarks/catalog_snapshot.py [--mentors 100000] [--repeat 20]
+#
+# Данные генерируются во временной SQLite базе.
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+TMP_DIR = tempfile.mkdtemp(prefix="yogavibe-bench-")
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+os.environ["DATABASE_URL"] = f"sqlite:///{TMP_DIR}/catalog.db"
+sys.path.insert(0, str(APP_DIR))
+
+from sqlalchemy import insert  # noqa: E402
+import catalog  # noqa: E402
+import database  # noqa: E402
+import models_db as models  # noqa: E402
+from api import load_mentor_list  # noqa: E402
+
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Новосибирск", "Екатеринбург", "Самара", "Омск", "Уфа"]
+STYLES = ["Хатха", "Аштанга", "Кундалини", "Виньяса", "Инь-йога", "Айенгара", "Бикрам"]
+
+QUERIES = [
+    {},
+    {"city": "Москва"},
+    {"city": "Казань", "yoga_style": "Хатха"},
+    {"gender": "female", "min_price": 2000, "max_price": 3000, "sort": "-rating"},
+    {"min_rating": 4.5, "sort": "price", "skip": 500},
+]
+
+
+def populate(count: int) -> None:
+    # Заполнить таблицу менторов случайными данными
+    rng = random.Random(42)
+    engine = database.get_engine()
+    engine.echo = False
+    database.Base.metadata.create_all(bind=engine)
+    rows = [
+        {
+            "name": f"Ментор {i}",
+            "description": "Опытный инструктор по йоге, индивидуальные и групповые занятия. " * 3,
+            "gender": rng.choice(["male", "female"]),
+            "city": rng.choice(CITIES),
+            "price": rng.randrange(1500, 5000, 100),
+            "yoga_style": rng.choice(STYLES),
+            "rating": round(rng.uniform(3.5, 5.0), 1),
+            "experience_years": rng.randint(1, 25),
+            "is_available": rng.random() > 0.1,
+        }
+        for i in range(count)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(models.Mentor), rows)
+
+
+def measure(fn, repeat: int) -> float:
+    # Медианное время вызова в микросекундах
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк каталога менторов")
+    parser.add_argument("--mentors", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    populate(args.mentors)
+
+    started = time.perf_counter()
+    snapshot = catalog.catalog.refresh()
+    build_ms = (time.perf_counter() - started) * 1000
+    backend = "numpy" if catalog.np is not None else "array (без numpy)"
+    print(f"Менторов: {args.mentors}, снимок: {backend}, сборка {build_ms:.0f} мс\n")
+
+    print(f"{'запрос':<80} {'SQL, мкс':>12} {'снимок, мкс':>12} {'ускорение':>10}")
+    for query in QUERIES:
+        filters = {
+            "city": None, "yoga_style": None, "gender": None, "min_price": None,
+            "max_price": None, "min_rating": None, "sort": None, "skip": 0, "limit": 100,
+            **query,
+        }
+        sql_us = measure(lambda: load_mentor_list(filters), max(3, args.repeat // 4))
+        snapshot_us = measure(lambda: snapshot.query(**filters), args.repeat)
+        print(f"{str(query):<80} {sql_us:>12.0f} {snapshot_us:>12.0f} {sql_us / snapshot_us:>9.0f}x")
+
+    database.dispose_engine()
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Пропускная способность мелких записей в SQLite: коммит на каждую заметку
+# против группового коммита (group_commit.GroupCommitWriter).
+#
+# Запуск из каталога backend:
+#
+#     python benchmarks/group_commit.py [--writers 64] [--seconds 3]
+#
+# Каждый писатель - поток, имитирующий запрос: создает заметку и ждет ее коммита.
+# База создается во временном каталоге.
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+DATA_DIR = tempfile.mkdtemp(prefix="group-commit-")
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATA_DIR}/bench.db"
+os.environ["LOG_LEVEL"] = "WARNING"
+os.environ["DEBUG"] = "false"
+sys.path.insert(0, str(APP_DIR))
+
+import crud  # noqa: E402
+import database  # noqa: E402
+import models_db as models  # noqa: E402
+import schemas  # noqa: E402
+from group_commit import GroupCommitWriter  # noqa: E402
+
+
+def create_note(session):
+    # Та же операция, что в POST /notes
+    return crud.note_crud.create_note(session, schemas.NoteCreate(text="заметка"), 1, commit=False)
+
+
+def run(writers: int, seconds: float, write) -> float:
+    # Записей в секунду: writers потоков пишут в цикле до истечения времени
+    counts = [0] * writers
+    deadline = time.perf_counter() + seconds
+
+    def worker(index: int):
+        while time.perf_counter() < deadline:
+            write()
+            counts[index] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк группового коммита")
+    parser.add_argument("--writers", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    engine = database.get_engine()
+    database.Base.metadata.create_all(bind=engine)
+    db = database.SessionLocal()
+    db.add(models.User(id=1, username="bench", email="bench@example.com", hashed_password="-"))
+    db.commit()
+    db.close()
+
+    def direct():
+        session = database.SessionLocal()
+        try:
+            create_note(session)
+            session.commit()
+        finally:
+            session.close()
+
+    writer = GroupCommitWriter(window_ms=args.window_ms, max_batch=1024)
+    writer.start()
+
+    def grouped():
+        writer.submit(create_note).result()
+
+    direct_rate = run(args.writers, args.seconds, direct)
+    grouped_rate = run(args.writers, args.seconds, grouped)
+    writer.stop()
+
+    print(f"писателей: {args.writers}, база: {DATA_DIR}")
+    print(f"{'коммит на запись':<20} {direct_rate:>10,.0f} зап/с")
+    print(f"{'групповой коммит':<20} {grouped_rate:>10,.0f} зап/с  ({grouped_rate / direct_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
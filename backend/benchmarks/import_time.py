@@ -0,0 +1,75 @@
+# Замер времени импорта приложения (холодный старт воркера).
+#
+# Запуск из каталога backend:
+#
+#     python benchmarks/import_time.py [модуль] [--top N] [--runs N]
+#
+# Скрипт выполняет `python -X importtime -c "import <модуль>"` в отдельном
+# процессе, выводит суммарное время импорта и самые дорогие модули.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+
+def run_importtime(module: str):
+    # Запустить импорт в чистом процессе и разобрать вывод -X importtime
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "benchmark-secret-key")
+    env["PYTHONPATH"] = str(APP_DIR)
+
+    # Запуск во временном каталоге проверяет, что импорт не создает файлов
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=cwd,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        created = os.listdir(cwd)
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # Формат строки: "import time: <self> | <cumulative> | <модуль>"
+        self_part, cumulative_part, name = line.split("|", 2)
+        self_us = int(self_part.split(":", 1)[1])
+        rows.append((int(cumulative_part), self_us, name.rstrip()))
+    return rows, created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время импорта приложения")
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    totals = []
+    rows, created = [], []
+    for _ in range(args.runs):
+        rows, created = run_importtime(args.module)
+        top_level = [row for row in rows if row[2].strip() == args.module]
+        totals.append(top_level[-1][0] if top_level else max(row[0] for row in rows))
+
+    print(f"Импорт '{args.module}': медиана {statistics.median(totals) / 1000:.1f} мс "
+          f"(мин {min(totals) / 1000:.1f} мс, запусков {args.runs})")
+    if created:
+        print(f"ВНИМАНИЕ: при импорте созданы файлы: {', '.join(created)}")
+
+    print(f"\nСамые дорогие модули (последний запуск, top {args.top}):")
+    print(f"{'cumulative, мс':>15} {'self, мс':>10}  модуль")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>15.1f} {self_us / 1000:>10.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# Стоимость логирования на запрос: прежняя схема (echo=True движка, синхронный
+# StreamHandler и строка журнала доступа uvicorn) против logs.configure_logging
+# (очередь, JSON, RequestLoggingMiddleware с выборкой запросов).
+#
+# Запуск из каталога backend:
+#
+#     python benchmarks/logging_overhead.py [--requests 2000] [--rounds 5]
+#
+# Запрос - ASGI вызов, выполняющий то же чтение, что GET /notes. HTTP слой
+# (TestClient) не используется: его разброс больше стоимости логирования.
+# Лог пишется в файл во временном каталоге; время процессора считается до
+# записи всей очереди, то есть включает работу фонового потока вывода.
+# Режимы чередуются по раундам, в таблице - медианы.
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+DATA_DIR = tempfile.mkdtemp(prefix="logging-overhead-")
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATA_DIR}/bench.db"
+sys.path.insert(0, str(APP_DIR))
+
+import crud  # noqa: E402
+import database  # noqa: E402
+import logs  # noqa: E402
+import models_db as models  # noqa: E402
+import schemas  # noqa: E402
+from config import settings  # noqa: E402
+from middleware import RequestLoggingMiddleware  # noqa: E402
+
+SCOPE = {
+    "type": "http",
+    "method": "GET",
+    "path": "/api/v1/notes",
+    "query_string": b"limit=20",
+    "headers": [],
+    "client": ("127.0.0.1", 50000),
+    "http_version": "1.1",
+}
+
+
+async def notes_app(scope, receive, send):
+    # То же чтение, что GET /notes
+    db = database.SessionLocal()
+    try:
+        notes = crud.note_crud.get_user_notes(db, 1, 0, 20)
+    finally:
+        db.close()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": str(len(notes)).encode()})
+
+
+async def logged_by_uvicorn(scope, receive, send):
+    # Прежний журнал доступа: строка uvicorn.access на каждый запрос
+    await notes_app(scope, receive, send)
+    logging.getLogger("uvicorn.access").info(
+        '%s - "%s %s HTTP/%s" %d', "127.0.0.1:50000", scope["method"], scope["path"], scope["http_version"], 200
+    )
+
+
+def reset_logging():
+    # Снять обработчики предыдущего режима (в том числе добавленный echo=True)
+    logs.shutdown_logging()
+    database.get_engine().echo = False
+    for name in ("", "sqlalchemy.engine.Engine"):
+        logger = logging.getLogger(name)
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+    logging.getLogger("sqlalchemy.engine.Engine").setLevel(logging.NOTSET)
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def setup_quiet(sink):
+    # Точка отсчета: без логирования
+    reset_logging()
+    return notes_app
+
+
+def setup_before(sink):
+    # Прежняя схема: basicConfig(INFO) и echo=True - каждый SQL запрос
+    # форматируется и пишется синхронно в потоке запроса
+    reset_logging()
+    logging.basicConfig(level=logging.INFO, stream=sink)
+    stdout, sys.stdout = sys.stdout, sink
+    try:
+        database.get_engine().echo = True
+    finally:
+        sys.stdout = stdout
+    return logged_by_uvicorn
+
+
+def queued(sample_rate):
+    def setup(sink):
+        reset_logging()
+        settings.LOG_SAMPLE_RATE = sample_rate
+        logs.configure_logging(stream=sink)
+        return RequestLoggingMiddleware(notes_app, slow_request_ms=settings.LOG_SLOW_REQUEST_MS)
+    return setup
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+def measure(requests, setup, sink):
+    app = setup(sink)
+    loop = asyncio.new_event_loop()
+
+    async def run():
+        for _ in range(requests):
+            await app(SCOPE, receive, send)
+
+    started_wall = time.perf_counter()
+    started_cpu = time.process_time()
+    loop.run_until_complete(run())
+    wall = time.perf_counter() - started_wall
+    # Дождаться вывода очереди - его стоимость тоже относится к запросам
+    logs.shutdown_logging()
+    sink.flush()
+    cpu = time.process_time() - started_cpu
+    loop.close()
+    return wall / requests * 1e6, cpu / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость логирования на запрос")
+    parser.add_argument("--requests", type=int, default=2000, help="запросов на режим в раунде")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = database.get_engine()
+    database.Base.metadata.create_all(bind=engine)
+    db = database.SessionLocal()
+    db.add(models.User(id=1, username="bench", email="bench@example.com", hashed_password="-"))
+    for index in range(20):
+        crud.note_crud.create_note(db, schemas.NoteCreate(text=f"заметка {index}"), 1, commit=False)
+    db.commit()
+    db.close()
+
+    modes = [
+        ("без логов", setup_quiet),
+        ("echo=True (было)", setup_before),
+        ("очередь, выборка 100%", queued(1.0)),
+        ("очередь, выборка 1%", queued(0.01)),
+    ]
+
+    with open(os.devnull, "w") as sink:
+        # Прогрев
+        measure(args.requests, setup_quiet, sink)
+
+    samples = {name: [] for name, _ in modes}
+    written = {}
+    for _ in range(args.rounds):
+        for index, (name, setup) in enumerate(modes):
+            path = os.path.join(DATA_DIR, f"log-{index}.txt")
+            with open(path, "w") as sink:
+                samples[name].append(measure(args.requests, setup, sink))
+            written[name] = os.path.getsize(path) / args.requests
+    reset_logging()
+
+    base_wall = statistics.median(wall for wall, _ in samples["без логов"])
+    base_cpu = statistics.median(cpu for _, cpu in samples["без логов"])
+    print(f"запросов на режим: {args.requests} x {args.rounds} раундов, база: {DATA_DIR}")
+    print(f"{'режим':<24} {'мкс/запрос':>11} {'логи, мкс':>10} {'CPU мкс':>9} {'логи, мкс':>10} {'байт лога':>10}")
+    for name, _ in modes:
+        wall = statistics.median(wall for wall, _ in samples[name])
+        cpu = statistics.median(cpu for _, cpu in samples[name])
+        print(
+            f"{name:<24} {wall:>11.0f} {wall - base_wall:>+10.0f} "
+            f"{cpu:>9.0f} {cpu - base_cpu:>+10.0f} {written[name]:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Пропускная способность выпуска и проверки JWT: PyJWT напрямую против TokenService.
+#
+# Запуск из каталога backend:
+#
+#     python benchmarks/tokens.py [--seconds 1.0]
+#
+# Для EdDSA и ES256 ключи генерируются на лету (нужен cryptography).
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+sys.path.insert(0, str(APP_DIR))
+
+import jwt  # noqa: E402
+from tokens import TokenService  # noqa: E402
+
+SECRET = os.environ["SECRET_KEY"]
+
+
+def generate_keys(algorithm: str):
+    # Пара ключей в PEM для асимметричного алгоритма
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    if algorithm == "EdDSA":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    return private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+
+def throughput(fn, seconds: float) -> float:
+    # Число вызовов в секунду за отведенное время
+    calls = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            fn()
+        calls += 100
+    return calls / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк JWT")
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f"{'алгоритм':<8} {'операция':<10} {'PyJWT, оп/с':>14} {'сервис, оп/с':>14} {'ускорение':>10}")
+    for algorithm in ("HS256", "EdDSA", "ES256"):
+        if algorithm == "HS256":
+            signing_key = verifying_key = SECRET
+            service = TokenService(algorithm, secret_key=SECRET)
+        else:
+            try:
+                signing_key = generate_keys(algorithm)
+            except ImportError:
+                print(f"{algorithm:<8} пропущен: не установлен cryptography")
+                continue
+            service = TokenService(algorithm, private_key=signing_key)
+            verifying_key = service._verifying_key
+
+        # Эквивалент прежнего utils.create_access_token: claims + PyJWT
+        def pyjwt_encode():
+            return jwt.encode(
+                {"sub": "42", "exp": int(time.time()) + 900, "iat": time.time(), "type": "access"},
+                signing_key,
+                algorithm=algorithm,
+            )
+
+        def service_encode():
+            return service.issue({"sub": "42"}, "access", 900)
+
+        token = service_encode()
+
+        def pyjwt_decode():
+            return jwt.decode(token, verifying_key, algorithms=[algorithm])
+
+        def service_decode():
+            return service.decode(token)
+
+        for operation, baseline, candidate in (
+            ("подпись", pyjwt_encode, service_encode),
+            ("проверка", pyjwt_decode, service_decode),
+        ):
+            baseline_ops = throughput(baseline, args.seconds)
+            candidate_ops = throughput(candidate, args.seconds)
+            print(f"{algorithm:<8} {operation:<10} {baseline_ops:>14,.0f} {candidate_ops:>14,.0f} "
+                  f"{candidate_ops / baseline_ops:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
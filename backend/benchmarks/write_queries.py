@@ -0,0 +1,144 @@
+# Число SQL запросов на каждый пишущий эндпоинт API.
+#
+# Запуск из каталога backend:
+#
+#     python benchmarks/write_queries.py [--verbose]
+#
+# Эндпоинты вызываются через TestClient на временной базе; запросы считаются
+# по событию before_cursor_execute основного движка. Если эндпоинт выполнил
+# больше запросов, чем указано в BUDGETS, или ответил ошибкой, скрипт завершается
+# с кодом 1. Обязательная проверка перед слиянием (см. README).
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+DATA_DIR = tempfile.mkdtemp(prefix="write-queries-")
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATA_DIR}/bench.db"
+os.environ["LOG_LEVEL"] = "WARNING"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["GROUP_COMMIT_ENABLED"] = "false"
+sys.path.insert(0, str(APP_DIR))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+import database  # noqa: E402
+import init_data  # noqa: E402
+from main import app  # noqa: E402
+
+# Допустимое число запросов. Записи, которые нельзя убрать: BEGIN/COMMIT не
+# считаются (pysqlite выполняет их без курсора), журнал шины инвалидации и
+# событий пишется в той же транзакции, счетчики заметок и бронирований
+# (counters.py) - два UPDATE: пользователь и общий итог; отмена бронирования
+# проверяет голову очереди ожидания слота (один поиск по индексу)
+BUDGETS = {
+    "POST /auth/register": 4,
+    "POST /auth/login": 3,
+    "POST /auth/refresh": 3,
+    "PUT /users/me": 3,
+    "POST /notes": 3,
+    "PUT /notes/{id}": 2,
+    "DELETE /notes/{id}": 4,
+    "POST /bookings": 9,
+    "PUT /bookings/{id}/cancel": 7,
+    "POST /auth/logout": 2,
+}
+
+
+class StatementLog:
+    # Запросы, выполненные основным движком
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        statement = " ".join(statement.split())
+        # Опрос журнала шины инвалидации идет в фоне, а не в запросе
+        if statement.startswith("SELECT") and "FROM cache_invalidations" in statement:
+            return
+        self.statements.append(statement)
+
+    def take(self):
+        statements, self.statements = self.statements, []
+        return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Число SQL запросов пишущих эндпоинтов")
+    parser.add_argument("--verbose", action="store_true", help="печатать сами запросы")
+    args = parser.parse_args()
+
+    init_data.init_db()
+    engine = database.get_engine()
+    log = StatementLog()
+    event.listen(engine, "before_cursor_execute", log)
+
+    failed = False
+
+    def measure(name, call):
+        nonlocal failed
+        log.take()
+        response = call()
+        statements = log.take()
+        budget = BUDGETS[name]
+        # Ответ с ошибкой не проверяет бюджет (запросы оборвались раньше) - тоже провал
+        if response.status_code >= 400:
+            mark = "ОШИБКА"
+        else:
+            mark = "ok" if len(statements) <= budget else "ПРЕВЫШЕН"
+        failed = failed or mark != "ok"
+        print(f"{name:<28} {response.status_code:>4} {len(statements):>4} / {budget:<4} {mark}")
+        if args.verbose:
+            for statement in statements:
+                print(f"    {statement[:160]}")
+        return response
+
+    with TestClient(app) as client:
+        api = "/api/v1"
+        tokens = measure("POST /auth/register", lambda: client.post(f"{api}/auth/register", json={
+            "username": "queries", "email": "queries@example.com", "password": "secret123",
+        })).json()
+        tokens = measure("POST /auth/login", lambda: client.post(f"{api}/auth/login", json={
+            "login": "queries", "password": "secret123",
+        })).json()
+        tokens = measure("POST /auth/refresh", lambda: client.post(f"{api}/auth/refresh", json={
+            "refresh_token": tokens["refresh_token"],
+        })).json()
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        # Пользователь попадает в кеш воркера до замеров
+        client.get(f"{api}/users/me", headers=headers)
+
+        measure("PUT /users/me", lambda: client.put(f"{api}/users/me", json={"city": "Казань"}, headers=headers))
+        # PUT /users/me сбрасывает кеш пользователя
+        client.get(f"{api}/users/me", headers=headers)
+
+        note = measure("POST /notes", lambda: client.post(
+            f"{api}/notes", json={"text": "заметка"}, headers=headers
+        )).json()
+        measure("PUT /notes/{id}", lambda: client.put(
+            f"{api}/notes/{note['id']}", json={"text": "изменена"}, headers=headers
+        ))
+        measure("DELETE /notes/{id}", lambda: client.delete(f"{api}/notes/{note['id']}", headers=headers))
+
+        session_date = (datetime.now(timezone.utc) + timedelta(days=7)).replace(microsecond=0)
+        booking = measure("POST /bookings", lambda: client.post(f"{api}/bookings", json={
+            "mentor_id": 1, "session_date": session_date.isoformat(), "duration_minutes": 60,
+        }, headers=headers)).json()
+        measure("PUT /bookings/{id}/cancel", lambda: client.put(
+            f"{api}/bookings/{booking['id']}/cancel", headers=headers
+        ))
+        measure("POST /auth/logout", lambda: client.post(f"{api}/auth/logout", json={
+            "refresh_token": tokens["refresh_token"],
+        }, headers=headers))
+
+    print(f"база: {DATA_DIR}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
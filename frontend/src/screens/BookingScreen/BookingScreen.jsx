@@ -73,7 +73,7 @@ const BookingScreen = () => {
         yogaStyle: response.yoga_style,
         rating: response.rating,
         experienceYears: response.experience_years,
-        photoUrl: response.photo_url,
+        photoUrl: ApiService.mediaUrl(response.photo_url, 256),
         isAvailable: response.is_available,
         availability: ["Пн-Пт: 9:00-18:00", "Сб: 10:00-15:00"]
       };
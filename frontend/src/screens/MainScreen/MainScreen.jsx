@@ -133,7 +133,7 @@ const MainScreen = ({ user, onLogout }) => {
           yogaStyle: mentor.yoga_style,
           rating: mentor.rating,
           experienceYears: mentor.experience_years,
-          photoUrl: mentor.photo_url,
+          photoUrl: ApiService.mediaUrl(mentor.photo_url, 256),
           isAvailable: mentor.is_available,
           createdAt: mentor.created_at
         }));
@@ -56,7 +56,7 @@ const MentorProfileScreen = () => {
         yogaStyle: response.yoga_style,
         rating: response.rating,
         experienceYears: response.experience_years,
-        photoUrl: response.photo_url,
+        photoUrl: ApiService.mediaUrl(response.photo_url, 512),
         isAvailable: response.is_available,
         
         // Дополнительные поля для профиля
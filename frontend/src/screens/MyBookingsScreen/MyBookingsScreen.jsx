@@ -141,12 +141,34 @@ StatsCard.propTypes = {
 const MyBookingsScreen = () => {
   const navigate = useNavigate();
   const [bookings, setBookings] = useState([]);
+  const [waitlist, setWaitlist] = useState([]);
   const [loading, setLoading] = useState(true);
   const [activeTab, setActiveTab] = useState('active');
   const [error, setError] = useState(null);
 
   useEffect(() => {
     loadBookings();
+    loadWaitlist();
+  }, []);
+
+  // Изменения статусов приходят с сервера, опрашивать список не нужно
+  useEffect(() => {
+    const unsubscribe = BookingService.subscribeToEvents((type, data) => {
+      if (type === 'booking.updated') {
+        setBookings(prev => prev.map(b => 
+          b.id === data.id ? { ...b, status: data.status } : b
+        ));
+      } else if (type === 'booking.created') {
+        loadBookings();
+      } else {
+        // booking.promoted - запись из очереди стала бронированием;
+        // resync - события могли потеряться: перечитываем оба списка
+        loadBookings();
+        loadWaitlist();
+      }
+    });
+    
+    return unsubscribe;
   }, []);
 
   // Эффект для обновления прошедших бронирований
@@ -238,6 +260,24 @@ const MyBookingsScreen = () => {
     }
   };
 
+  const loadWaitlist = async () => {
+    try {
+      setWaitlist(await BookingService.getWaitlist());
+    } catch (error) {
+      console.error('Error loading waitlist:', error);
+    }
+  };
+
+  const handleLeaveWaitlist = useCallback(async (entryId) => {
+    try {
+      await BookingService.leaveWaitlist(entryId);
+      setWaitlist(prev => prev.filter(entry => entry.id !== entryId));
+    } catch (error) {
+      console.error('Error leaving waitlist:', error);
+      setError(error.message);
+    }
+  }, []);
+
   const { filteredBookings, counts, now } = useMemo(() => {
     const now = new Date();
     
@@ -416,6 +456,48 @@ const MyBookingsScreen = () => {
           )}
         </div>
 
+        {/* Очередь ожидания занятых слотов */}
+        {waitlist.length > 0 && (
+          <div className="bookings-list">
+            <h2>Лист ожидания</h2>
+            {waitlist.map(entry => (
+              <div key={entry.id} className="booking-card">
+                <div className="booking-details">
+                  <div className="detail-row">
+                    <span className="detail-label">Дата:</span>
+                    <span className="detail-value">
+                      {entry.sessionDate.toLocaleString('ru-RU', {
+                        day: 'numeric',
+                        month: 'short',
+                        hour: '2-digit',
+                        minute: '2-digit'
+                      })}
+                    </span>
+                  </div>
+                  <div className="detail-row">
+                    <span className="detail-label">Место в очереди:</span>
+                    <span className="detail-value">{entry.position}</span>
+                  </div>
+                </div>
+                <div className="booking-actions">
+                  <button 
+                    onClick={() => handleViewMentor(entry.mentorId)}
+                    className="action-btn view-mentor-btn"
+                  >
+                    Профиль ментора
+                  </button>
+                  <button 
+                    onClick={() => handleLeaveWaitlist(entry.id)}
+                    className="action-btn cancel-btn"
+                  >
+                    Выйти из очереди
+                  </button>
+                </div>
+              </div>
+            ))}
+          </div>
+        )}
+
         {/* Статистика */}
         <div className="bookings-stats">
           <StatsCard value={counts.total} label="Всего записей" />
@@ -2,6 +2,7 @@ import React, { useState, useEffect, useRef, useCallback, useMemo } from 'react'
 import PropTypes from 'prop-types';
 import UserService from '../../services/UserService';
 import AuthService from '../../services/AuthService';
+import ApiService from '../../services/ApiService';
 import './ProfileScreen.css';
 
 // Константы для полей профиля
@@ -30,6 +31,8 @@ const FIELD_CONFIGS = {
 
 // Максимальный размер файла фото (5MB)
 const MAX_PHOTO_SIZE = 5 * 1024 * 1024;
+// Размер миниатюры фото профиля на сервере
+const PHOTO_THUMBNAIL_SIZE = 256;
 const ALLOWED_FILE_TYPES = ['image/jpeg', 'image/png', 'image/gif', 'image/webp'];
 
 const ProfileScreen = ({ user, onUpdateProfile }) => {
@@ -116,14 +119,13 @@ const ProfileScreen = ({ user, onUpdateProfile }) => {
         communicationStyle: localProfile?.communicationStyle || '',
         mentorPreferences: localProfile?.mentorPreferences || '',
         additionalInfo: localProfile?.additionalInfo || '',
-        photo: localProfile?.photo || null
+        photo: serverProfile?.photo_url || null
       };
 
       setProfile(mergedProfile);
       
-      if (localProfile?.photo) {
-        setPhotoPreview(localProfile.photo);
-      }
+      // Фото хранится на сервере
+      setPhotoPreview(ApiService.mediaUrl(serverProfile?.photo_url, PHOTO_THUMBNAIL_SIZE));
       
     } catch (error) {
       console.error('ProfileScreen: Error loading profile:', error);
@@ -224,20 +226,12 @@ const ProfileScreen = ({ user, onUpdateProfile }) => {
       validatePhotoFile(file);
       setIsUploadingPhoto(true);
 
-      const base64String = await new Promise((resolve, reject) => {
-        const reader = new FileReader();
-        reader.onloadend = () => resolve(reader.result);
-        reader.onerror = reject;
-        reader.readAsDataURL(file);
-      });
-
-      setPhotoPreview(base64String);
-      setProfile(prev => ({ ...prev, photo: base64String }));
+      const updatedUser = await UserService.uploadProfilePhoto(file);
+      const photoUrl = updatedUser?.photo_url || null;
 
-      const userId = user?.id || AuthService.getCurrentUser()?.id;
-      if (userId) {
-        UserService.saveProfilePhoto(userId, base64String); // Синхронно
-      }
+      setPhotoPreview(ApiService.mediaUrl(photoUrl, PHOTO_THUMBNAIL_SIZE));
+      setProfile(prev => ({ ...prev, photo: photoUrl }));
+      setCurrentUser(prev => ({ ...prev, photo_url: photoUrl }));
 
       setSaveSuccess(true);
       setTimeout(() => setSaveSuccess(false), 2000);
@@ -252,17 +246,21 @@ const ProfileScreen = ({ user, onUpdateProfile }) => {
     }
   }, [user]);
 
-  const removePhoto = useCallback(() => {
+  const removePhoto = useCallback(async () => {
     if (!window.confirm('Удалить фото профиля?')) return;
 
-    setPhotoPreview(null);
-    setProfile(prev => ({ ...prev, photo: null }));
-
-    const userId = user?.id || AuthService.getCurrentUser()?.id;
-    if (userId) {
-      UserService.saveProfilePhoto(userId, null); // Синхронно
+    try {
+      setIsUploadingPhoto(true);
+      await UserService.deleteProfilePhoto();
+      setPhotoPreview(null);
+      setProfile(prev => ({ ...prev, photo: null }));
+      setCurrentUser(prev => ({ ...prev, photo_url: null }));
+    } catch (error) {
+      alert(error.message);
+    } finally {
+      setIsUploadingPhoto(false);
     }
-  }, [user]);
+  }, []);
 
   // Сохранение всех данных
   const handleSaveAll = useCallback(async () => {
@@ -292,11 +290,6 @@ const ProfileScreen = ({ user, onUpdateProfile }) => {
         if (Object.keys(localData).length > 0) {
           UserService.saveLocalProfile(userId, localData);
         }
-        
-        // Сохраняем фото (синхронно)
-        if (profile.photo !== null) {
-          UserService.saveProfilePhoto(userId, profile.photo);
-        }
       } catch (localError) {
         console.warn('Ошибка сохранения локальных данных:', localError);
       }
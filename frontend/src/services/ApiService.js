@@ -25,8 +25,8 @@ class ApiService {
       headers
     };
     
-    // Если передано тело и это не строка, сериализуем в JSON
-    if (config.body && typeof config.body !== 'string') {
+    // Если передано тело и это не строка и не файл, сериализуем в JSON
+    if (config.body && typeof config.body !== 'string' && !(config.body instanceof Blob)) {
       config.body = JSON.stringify(config.body);
     }
     
@@ -152,6 +152,16 @@ class ApiService {
     }
   }
 
+  // Истек ли access токен (поле exp JWT; skewSeconds - запас на задержки)
+  static isTokenExpired(token, skewSeconds = 30) {
+    try {
+      const payload = JSON.parse(atob(token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/')));
+      return !payload.exp || payload.exp * 1000 <= Date.now() + skewSeconds * 1000;
+    } catch (error) {
+      return true;
+    }
+  }
+
   // Очистка авторизационных данных
   static clearAuth() {
     localStorage.removeItem('yogavibe_token');
@@ -232,6 +242,12 @@ class ApiService {
     return await this.request('/users/me');
   }
 
+  // Данные стартового экрана одним запросом (fields - список разделов)
+  static async getDashboard(fields = []) {
+    const query = fields.length ? `?fields=${fields.join(',')}` : '';
+    return await this.request(`/users/me/dashboard${query}`);
+  }
+
   static async updateUserProfile(userData) {
     return await this.request('/users/me', {
       method: 'PUT',
@@ -239,6 +255,37 @@ class ApiService {
     });
   }
 
+  // Фото профиля: файл уходит телом запроса как есть
+  static async uploadProfilePhoto(file) {
+    return await this.request('/users/me/photo', {
+      method: 'PUT',
+      headers: { 'Content-Type': file.type || 'application/octet-stream' },
+      body: file
+    });
+  }
+
+  static async deleteProfilePhoto() {
+    return await this.request('/users/me/photo', {
+      method: 'DELETE'
+    });
+  }
+
+  // === ИЗОБРАЖЕНИЯ ===
+
+  // Полный адрес изображения; для загруженных на сервер (/api/v1/media/...)
+  // с size - адрес миниатюры WebP этого размера (128, 256 или 512)
+  static mediaUrl(path, size = null) {
+    if (!path || !path.startsWith('/')) {
+      return path || null;
+    }
+    const origin = new URL(this.BASE_URL).origin;
+    const match = path.match(/^(\/api\/v1\/media\/[0-9a-f]{64})\.[a-z]+$/);
+    if (match && size) {
+      return `${origin}${match[1]}/${size}.webp`;
+    }
+    return `${origin}${path}`;
+  }
+
   // === МЕНТОРЫ ===
   
   static async getMentors(filters = {}) {
@@ -269,10 +316,19 @@ class ApiService {
   static async createNote(noteData) {
     return await this.request('/notes', {
       method: 'POST',
+      headers: { 'Idempotency-Key': this.newIdempotencyKey() },
       body: noteData
     });
   }
 
+  // Ключ идемпотентности: повтор запроса с тем же ключом не создаст дубликат
+  static newIdempotencyKey() {
+    if (typeof crypto !== 'undefined' && crypto.randomUUID) {
+      return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+  }
+
   static async updateNote(noteId, noteData) {
     return await this.request(`/notes/${noteId}`, {
       method: 'PUT',
@@ -305,6 +361,25 @@ class ApiService {
     });
   }
 
+  // Очередь ожидания занятого времени: при отмене чужого бронирования
+  // слот переходит первому в очереди (событие booking.promoted)
+  static async joinWaitlist(bookingData) {
+    return await this.request('/bookings/waitlist', {
+      method: 'POST',
+      body: bookingData
+    });
+  }
+
+  static async getWaitlist() {
+    return await this.request('/bookings/waitlist');
+  }
+
+  static async leaveWaitlist(entryId) {
+    return await this.request(`/bookings/waitlist/${entryId}`, {
+      method: 'DELETE'
+    });
+  }
+
   // === ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ ===
   
   static isAuthenticated() {
@@ -28,12 +28,13 @@ class AuthService {
         return { isAuthenticated: false };
       }
       
-      // Пробуем получить данные пользователя с сервера
-      console.log('AuthService: Getting current user from API...');
-      const userData = await ApiService.getCurrentUser().catch((error) => {
+      // Пробуем получить данные пользователя с сервера (только раздел user:
+      // остальные разделы сводки экраны загружают сами)
+      const dashboard = await ApiService.getDashboard(['user']).catch((error) => {
         console.error('AuthService: Error getting current user:', error);
         return null;
       });
+      const userData = dashboard?.user;
       
       if (userData) {
         console.log('AuthService: User data received:', userData);
@@ -5,7 +5,8 @@ class BookingService {
   static async getBookings() {
     try {
       console.log('BookingService: Getting bookings...');
-      const response = await ApiService.request('/bookings', {
+      // include=mentor - данные ментора приходят в том же ответе
+      const response = await ApiService.request('/bookings?include=mentor', {
         method: 'GET'
       });
       console.log('BookingService: Bookings received:', response);
@@ -67,8 +68,9 @@ class BookingService {
       
       console.log('BookingService: Sending to backend:', bookingData);
       
-      const response = await ApiService.request('/bookings', {
+      const response = await ApiService.request('/bookings?include=mentor', {
         method: 'POST',
+        headers: { 'Idempotency-Key': ApiService.newIdempotencyKey() },
         body: bookingData
       });
       
@@ -167,6 +169,106 @@ class BookingService {
     }
   }
 
+  // Записи пользователя в очереди ожидания занятых слотов
+  static async getWaitlist() {
+    const response = await ApiService.getWaitlist();
+    return response.map(entry => ({
+      id: entry.id,
+      mentorId: entry.mentor_id,
+      sessionDate: new Date(entry.session_date),
+      durationMinutes: entry.duration_minutes,
+      position: entry.position
+    }));
+  }
+
+  // Выход из очереди ожидания
+  static async leaveWaitlist(entryId) {
+    try {
+      return await ApiService.leaveWaitlist(entryId);
+    } catch (error) {
+      const enhancedError = new Error(
+        error.body?.detail || error.message || 'Не удалось выйти из очереди'
+      );
+      enhancedError.originalError = error;
+      throw enhancedError;
+    }
+  }
+
+  // Подписка на уведомления об изменениях бронирований (Server-Sent Events)
+  // Возвращает функцию отписки
+  static subscribeToEvents(onEvent) {
+    if (typeof EventSource === 'undefined') {
+      return () => {};
+    }
+    
+    const eventTypes = ['booking.created', 'booking.updated', 'booking.promoted', 'resync'];
+    let source = null;
+    let closed = false;
+    let retryTimer = null;
+    let retryDelay = 1000;
+    let connectedBefore = false;
+    
+    // Токен передается в строке запроса и проверяется только при подключении.
+    // Встроенное переподключение EventSource повторило бы тот же (истекший)
+    // токен и после 401 остановилось навсегда, поэтому поток переоткрывается
+    // вручную со свежим токеном
+    const connect = async (forceRefresh = false) => {
+      let token = localStorage.getItem('yogavibe_token');
+      if (token && (forceRefresh || ApiService.isTokenExpired(token))) {
+        const refreshed = await ApiService.refreshAccessToken();
+        token = refreshed ? localStorage.getItem('yogavibe_token') : null;
+      }
+      if (closed || !token) {
+        return;
+      }
+      
+      const url = `${ApiService.BASE_URL}/events?access_token=${encodeURIComponent(token)}`;
+      const current = new EventSource(url);
+      let opened = false;
+      source = current;
+      
+      current.onopen = () => {
+        opened = true;
+        retryDelay = 1000;
+        // События, пришедшие пока потока не было, потеряны - перечитываем данные
+        if (connectedBefore) {
+          onEvent('resync', {});
+        }
+        connectedBefore = true;
+      };
+      
+      eventTypes.forEach(type => {
+        current.addEventListener(type, (event) => {
+          try {
+            onEvent(type, JSON.parse(event.data));
+          } catch (error) {
+            console.error('BookingService: Error handling event:', error);
+          }
+        });
+      });
+      
+      current.onerror = () => {
+        current.close();
+        if (closed) {
+          return;
+        }
+        // Поток не открылся - вероятно, токен отклонен: обновляем его принудительно
+        retryTimer = setTimeout(() => connect(!opened), retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      };
+    };
+    
+    connect();
+    
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) {
+        source.close();
+      }
+    };
+  }
+
   // Получение бронирований из localStorage
   static getLocalBookings(userId) {
     try {
@@ -44,19 +44,31 @@ class UserService {
     }
   }
 
-  // Загрузка фото профиля (локальное хранилище)
-  static saveProfilePhoto(userId, photoData) {
+  // Загрузка фото профиля на сервер; возвращает обновленного пользователя
+  static async uploadProfilePhoto(file) {
     try {
-      const allProfiles = JSON.parse(localStorage.getItem('yogavibe_profiles') || '{}');
-      if (!allProfiles[userId]) {
-        allProfiles[userId] = {};
+      const response = await ApiService.uploadProfilePhoto(file);
+      if (response) {
+        ApiService.setUserData(response);
       }
-      allProfiles[userId].photo = photoData;
-      localStorage.setItem('yogavibe_profiles', JSON.stringify(allProfiles));
-      return true;
+      return response;
     } catch (error) {
-      console.error('UserService: Error saving photo:', error);
-      return false;
+      console.error('UserService: Error uploading photo:', error);
+      throw error;
+    }
+  }
+
+  // Удаление фото профиля
+  static async deleteProfilePhoto() {
+    try {
+      const response = await ApiService.deleteProfilePhoto();
+      if (response) {
+        ApiService.setUserData(response);
+      }
+      return response;
+    } catch (error) {
+      console.error('UserService: Error deleting photo:', error);
+      throw error;
     }
   }
 